@@ -0,0 +1,94 @@
+# Compares accuracy, training time, latency and model size of the intent backends on datasets/intents.json. Every
+# fifth pattern of an intent is held out for the evaluation, the models are saved into a temporary directory, so the
+# pretrained models of BaxterLite are not touched.
+# Run from the project root: python -m benchmarks.compare_intent_backends
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import *
+
+import numpy as np
+
+from benchmarks.inference_benchmark import measure
+from utils.config_helper import ConfigHelper
+from utils.intent_backends import INTENT_BACKENDS, IntentBackend, create_backend
+from utils.string_helper import DEFAULT_MODEL_NAME, StringHelper, Model, Word2VecModels
+
+
+def split_dataset(dataset: dict, str_helper: StringHelper,
+                  max_token_length: int) -> Tuple[List[Tuple[str, int]], List[Tuple[str, int]]]:
+    """
+    :param dataset: dict - loaded intent dataset
+    :param str_helper: StringHelper instance
+    :param max_token_length: int - patterns with more tokens are skipped
+    :return: Tuple - train and test samples (pattern, class index)
+    """
+    train: List[Tuple[str, int]] = []
+    test: List[Tuple[str, int]] = []
+    for idx, intent in enumerate(dataset['intents']):
+        patterns: List[str] = [pattern for pattern in intent.get('patterns', [])
+                               if str_helper.get_token_length(pattern) <= max_token_length]
+        for pattern_idx, pattern in enumerate(patterns):
+            (test if pattern_idx % 5 == 4 else train).append((pattern, idx))
+    return train, test
+
+
+def get_directory_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(directory) for file in files)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Compare the intent backends')
+    parser.add_argument('--backends', nargs='+', default=list(INTENT_BACKENDS), choices=INTENT_BACKENDS)
+    parser.add_argument('--epochs', type=int, default=200, help='epochs of the backends which are trained iteratively')
+    parser.add_argument('--samples', type=int, default=200, help='amount of sentences for the latency measurement')
+    args: argparse.Namespace = parser.parse_args()
+
+    config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    target_model: Model = Word2VecModels().get_model_by_name(
+        config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME)
+    str_helper: StringHelper = StringHelper(target_model)
+    max_token_length: int = config_helper.get_config_setting('max_token_length')
+
+    with open('datasets/intents.json', 'r', encoding='utf-8') as f:
+        dataset: dict = json.load(f)
+    train, test = split_dataset(dataset, str_helper, max_token_length)
+    num_classes: int = len(dataset['intents'])
+
+    def featurize(samples: List[Tuple[str, int]]) -> Tuple[np.ndarray, np.ndarray]:
+        return (str_helper.get_insertable_batch([pattern.lower() for pattern, _ in samples], max_token_length),
+                np.array([label for _, label in samples]))
+
+    train_features, train_labels = featurize(train)
+    test_features, test_labels = featurize(test)
+    latency_sentences: List[str] = [pattern for pattern, _ in test][:args.samples]
+
+    results: dict = {'train_samples': len(train), 'test_samples': len(test)}
+    for name in args.backends:
+        with tempfile.TemporaryDirectory() as directory:
+            backend: IntentBackend = create_backend(name, str_helper.get_model_name(), max_token_length,
+                                                    str_helper.get_dimensions(), directory,
+                                                    config_helper.get_config_setting('inference_mode'))
+            start: float = time.perf_counter()
+            backend.fit(train_features, train_labels, num_classes, args.epochs, 64)
+            train_seconds: float = time.perf_counter() - start
+            backend.save()
+            backend.warm_up()
+
+            predictions: np.ndarray = np.argmax(backend.predict(test_features), axis=1)
+            results[name] = {
+                'accuracy': float(np.mean(predictions == test_labels)),
+                'train_seconds': train_seconds,
+                'model_bytes': get_directory_size(directory),
+                'latency': measure(lambda sentence: backend.predict(
+                    str_helper.get_insertable_batch([sentence.lower()], max_token_length)), latency_sentences)
+            }
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+# Compares the old per-token featurizer with StringHelper.get_insertable_batch on the intent and ITF datasets.
+# Run from the project root: python -m benchmarks.featurizer_benchmark
+
+import argparse
+import glob
+import json
+import time
+from typing import *
+
+import numpy as np
+
+from utils.config_helper import ConfigHelper
+from utils.string_helper import DEFAULT_MODEL_NAME, StringHelper, Model, Word2VecModels
+
+
+def legacy_get_insertable(str_helper: StringHelper, s: str, max_token_length: int) -> np.ndarray:
+    """
+    The featurizer as it was before: one ndarray per token, np.zeros for every unknown token and padding slot
+    """
+    current_sentence: list = []
+    for token in str_helper.tokenize(s):
+        if token in ['?', '!', '.', ',']:
+            continue
+        token: str = str_helper.stem(token)
+        try:
+            current_sentence.append(str_helper.w2v(token))
+        except (KeyError,):
+            current_sentence.append(np.zeros((str_helper.get_dimensions(),)))
+    for _ in range(max_token_length - len(current_sentence)):
+        current_sentence.append(np.zeros((str_helper.get_dimensions(),)))
+    return np.array(current_sentence)
+
+
+def load_sentences(limit: int) -> Dict[str, List[str]]:
+    """
+    :param limit: int - maximum amount of sentences per dataset
+    :return: dict - dataset name -> sentences
+    """
+    datasets: Dict[str, List[str]] = {}
+    with open('datasets/intents.json', 'r', encoding='utf-8') as f:
+        intents: dict = json.load(f)
+    datasets['intents'] = [pattern for intent in intents['intents'] for pattern in intent['patterns']][:limit]
+    for path in sorted(glob.glob('datasets/itf/*.json')):
+        with open(path, 'r', encoding='utf-8') as f:
+            dataset: dict = json.load(f)
+        datasets[path] = [str(entry['pattern']).lower() for entry in dataset['intents'][:limit]]
+    return datasets
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark the featurizer')
+    parser.add_argument('--limit', type=int, default=20_000, help='maximum amount of sentences per dataset')
+    parser.add_argument('--batch-size', type=int, default=1024, help='sentences per get_insertable_batch call')
+    args: argparse.Namespace = parser.parse_args()
+
+    config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    max_token_length: int = config_helper.get_config_setting('max_token_length')
+    target_model: Model = Word2VecModels().get_model_by_name(
+        config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME)
+    str_helper: StringHelper = StringHelper(target_model)
+
+    results: dict = {}
+    for name, sentences in load_sentences(args.limit).items():
+        sentences = [s for s in sentences if str_helper.get_token_length(s) <= max_token_length]
+
+        start: float = time.perf_counter()
+        legacy: np.ndarray = np.array([legacy_get_insertable(str_helper, s, max_token_length) for s in sentences])
+        legacy_seconds: float = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batched: np.ndarray = np.concatenate(
+            [str_helper.get_insertable_batch(sentences[idx:idx + args.batch_size], max_token_length)
+             for idx in range(0, len(sentences), args.batch_size)])
+        batched_seconds: float = time.perf_counter() - start
+
+        results[name] = {'sentences': len(sentences),
+                         'legacy_seconds': legacy_seconds,
+                         'batched_seconds': batched_seconds,
+                         'speedup': legacy_seconds / batched_seconds if batched_seconds else None,
+                         'equal': bool(np.allclose(legacy, batched))}
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+# Compares the single-sentence latency of the inference modes (keras.Model.predict vs. traced tf.function vs.
+# NumPy engine).
+# Run from the project root: python -m benchmarks.inference_benchmark
+
+import argparse
+import json
+import time
+from typing import *
+
+import numpy as np
+
+from utils.config_helper import ConfigHelper
+from utils.inference import INFERENCE_MODES
+from utils.intent_classifier import Classifier
+from utils.itf.itf import TokenDetector
+from utils.string_helper import DEFAULT_MODEL_NAME, StringHelper, Model, Word2VecModels
+
+
+def measure(fn: Callable[[str], Any], sentences: List[str]) -> Dict[str, float]:
+    """
+    :param fn: Callable - function which is called once per sentence
+    :param sentences: List[str] - sentences to run
+    :return: dict - mean, p50 and p95 latency in milliseconds
+    """
+    timings: List[float] = []
+    for sentence in sentences:
+        start: float = time.perf_counter()
+        fn(sentence)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {'mean_ms': float(np.mean(timings)),
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p95_ms': float(np.percentile(timings, 95))}
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark the inference modes')
+    parser.add_argument('--samples', type=int, default=200, help='amount of sentences per mode')
+    args: argparse.Namespace = parser.parse_args()
+
+    config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    target_model: Model = Word2VecModels().get_model_by_name(
+        config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME)
+    str_helper: StringHelper = StringHelper(target_model)
+
+    classifier: Classifier = Classifier(config_helper, str_helper, 'datasets/intents.json', use_pretrained=True)
+    token_detector: TokenDetector = TokenDetector(config_helper=config_helper, str_helper=str_helper,
+                                                  intent_paths=[], use_pretrained=True)
+
+    with open('datasets/intents.json', 'r', encoding='utf-8') as f:
+        dataset: dict = json.load(f)
+    max_token_length: int = config_helper.get_config_setting('max_token_length')
+    sentences: List[str] = [pattern for intent in dataset['intents'] for pattern in intent['patterns']
+                            if str_helper.get_token_length(pattern) <= max_token_length]
+    sentences = sentences[:args.samples]
+
+    results: dict = {}
+    for mode in INFERENCE_MODES:
+        mode_results: dict = {}
+        if classifier.is_usable():
+            classifier.set_inference_mode(mode)
+            classifier.warm_up()
+            mode_results['classifier'] = measure(classifier.classify, sentences)
+        if token_detector.is_usable():
+            token_detector.set_inference_mode(mode)
+            token_detector.warm_up()
+            mode_results['token_detector'] = measure(token_detector.get_important_parts, sentences)
+        results[mode] = mode_results
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
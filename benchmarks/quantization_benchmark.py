@@ -0,0 +1,110 @@
+# Compares the full precision NumPy export of the intent detector and the token detector with their float16 and int8
+# quantized variants (dequantized on the first forward pass, which is the default, and kept quantized in memory): file
+# size, memory of the weights, load time, first call, single-sentence latency (also relative to float32) and how much
+# the outputs change. The intent detector is additionally evaluated on the patterns of datasets/intents.json.
+# Run from the project root: python -m benchmarks.quantization_benchmark
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from typing import *
+
+import numpy as np
+
+from benchmarks.inference_benchmark import measure
+from utils.config_helper import ConfigHelper
+from utils.numpy_engine import QUANTIZATION_MODES, NumpyModel, export_layers, get_export_path, save_layers
+from utils.string_helper import DEFAULT_MODEL_NAME, StringHelper, Model, Word2VecModels
+
+
+def load_source(model_file: str) -> Union[Tuple[List[dict], Dict[str, np.ndarray]], None]:
+    """
+    :param model_file: string - path to the saved Keras model
+    :return: Tuple - layers and float32 weights (from the NumPy export if there is one, else from the Keras model)
+    """
+    export_file: str = get_export_path(model_file)
+    if os.path.isfile(export_file):
+        model: NumpyModel = NumpyModel.load(export_file)
+        return model.get_layers(), model.get_weights()
+    if not os.path.isfile(model_file):
+        return None
+    from tensorflow import keras
+    return export_layers(keras.models.load_model(model_file))
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Benchmark the quantized models')
+    parser.add_argument('--samples', type=int, default=200, help='amount of sentences for the latency measurement')
+    parser.add_argument('--loads', type=int, default=10, help='how often every export is loaded')
+    args: argparse.Namespace = parser.parse_args()
+
+    config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    target_model: Model = Word2VecModels().get_model_by_name(
+        config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME)
+    str_helper: StringHelper = StringHelper(target_model)
+    max_token_length: int = config_helper.get_config_setting('max_token_length')
+
+    with open('datasets/intents.json', 'r', encoding='utf-8') as f:
+        dataset: dict = json.load(f)
+    samples: List[Tuple[str, int]] = [(pattern, idx) for idx, intent in enumerate(dataset['intents'])
+                                      for pattern in intent['patterns']
+                                      if str_helper.get_token_length(pattern) <= max_token_length]
+    features: np.ndarray = str_helper.get_insertable_batch([pattern.lower() for pattern, _ in samples],
+                                                           max_token_length)
+    labels: np.ndarray = np.array([label for _, label in samples])
+    latency_inputs: List[np.ndarray] = [features[idx:idx + 1] for idx in range(min(args.samples, len(features)))]
+
+    results: dict = {}
+    for name, model_file in [('intent_detector', f'models/pretrained/intent_detector_{target_model.name}.h5'),
+                             ('token_detector', f'models/pretrained/token_detector-{target_model.name}.h5')]:
+        source: Union[Tuple[List[dict], Dict[str, np.ndarray]], None] = load_source(model_file)
+        if source is None:
+            continue
+        layers, weights = source
+        reference: Union[np.ndarray, None] = None
+        model_results: dict = {}
+        with tempfile.TemporaryDirectory() as directory:
+            for quantization in (None,) + QUANTIZATION_MODES:
+                path: str = os.path.join(directory, f'{name}_{quantization or "float32"}.npz')
+                save_layers(path, layers, weights, quantization)
+                # the default dequantizes once on the first forward pass, keep_quantized trades latency for memory
+                for keep_quantized in ((False,) if quantization is None else (False, True)):
+                    start: float = time.perf_counter()
+                    for _ in range(args.loads):
+                        model: NumpyModel = NumpyModel.load(path, keep_quantized)
+                    load_ms: float = (time.perf_counter() - start) * 1000 / args.loads
+
+                    start = time.perf_counter()
+                    model(latency_inputs[0])
+                    first_call_ms: float = (time.perf_counter() - start) * 1000
+
+                    outputs: np.ndarray = model(features)
+                    if reference is None:
+                        reference = outputs
+                    variant: dict = {
+                        'bytes': os.path.getsize(path),
+                        'weight_bytes': model.get_nbytes(),
+                        'load_ms': load_ms,
+                        'first_call_ms': first_call_ms,
+                        'latency': measure(model, latency_inputs),
+                        'max_output_delta': float(np.max(np.abs(outputs - reference))),
+                        'mean_output_delta': float(np.mean(np.abs(outputs - reference)))
+                    }
+                    variant['latency_vs_float32'] = variant['latency']['mean_ms'] / \
+                        (model_results['float32']['latency']['mean_ms'] if model_results else
+                         variant['latency']['mean_ms'])
+                    if name == 'intent_detector':
+                        variant['accuracy'] = float(np.mean(np.argmax(outputs, axis=1) == labels))
+                        variant['agreement'] = float(np.mean(np.argmax(outputs, axis=1) ==
+                                                             np.argmax(reference, axis=1)))
+                    model_results[(quantization or 'float32') + ('_keep_quantized' if keep_quantized else '')] = \
+                        variant
+        results[name] = model_results
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# Load test of the headless server (python server.py): sends messages over HTTP (every client uses one keep-alive
+# connection and its own session) and reports throughput and latency.
+# Run from the project root while the server is running: python -m benchmarks.server_benchmark
+
+import argparse
+import asyncio
+import json
+import time
+from typing import *
+
+import aiohttp
+import numpy as np
+
+
+async def run_client(session: aiohttp.ClientSession, url: str, messages: List[str], timings: List[float]) -> int:
+    """
+    :param session: aiohttp.ClientSession - connection of the client
+    :param url: string - URL of the /message endpoint
+    :param messages: List[str] - messages the client sends one after another
+    :param timings: List[float] - the latency of every request in milliseconds is appended
+    :return: int - amount of failed requests
+    """
+    session_id: Union[str, None] = None
+    errors: int = 0
+    for message in messages:
+        start: float = time.perf_counter()
+        try:
+            async with session.post(url, json={'message': message, 'session_id': session_id}) as response:
+                answer: dict = await response.json()
+                session_id = answer.get('session_id')
+            timings.append((time.perf_counter() - start) * 1000)
+        except (aiohttp.ClientError, ValueError):
+            errors += 1
+    return errors
+
+
+async def run(args: argparse.Namespace) -> dict:
+    url: str = args.url.rstrip('/') + '/message'
+    messages: List[str] = [args.messages[idx % len(args.messages)] for idx in range(args.requests)]
+    timings: List[float] = []
+    start: float = time.perf_counter()
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.concurrency)) as session:
+        errors: List[int] = await asyncio.gather(*[run_client(session, url, messages[idx::args.concurrency], timings)
+                                                   for idx in range(args.concurrency)])
+    seconds: float = time.perf_counter() - start
+    return {'requests': len(timings),
+            'errors': sum(errors),
+            'concurrency': args.concurrency,
+            'requests_per_second': len(timings) / seconds,
+            'mean_ms': float(np.mean(timings)) if timings else None,
+            'p50_ms': float(np.percentile(timings, 50)) if timings else None,
+            'p95_ms': float(np.percentile(timings, 95)) if timings else None,
+            'p99_ms': float(np.percentile(timings, 99)) if timings else None}
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Load test the BaxterLite server')
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='address of the server')
+    parser.add_argument('--requests', type=int, default=1000, help='amount of messages in total')
+    parser.add_argument('--concurrency', type=int, default=16, help='amount of clients sending at the same time')
+    parser.add_argument('--messages', nargs='+', default=['Hallo', 'Wie spät ist es?', 'Wie geht es dir?'],
+                        help='messages the clients send (in turns)')
+    args: argparse.Namespace = parser.parse_args()
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,27 +1,18 @@
+import argparse
 import time
 from utils.action_helper.action_helper import ActionHelper
+from utils.bootstrap import add_model_phases
 from utils.config_helper import ConfigHelper
-from utils.string_helper import StringHelper, Model, Word2VecModels
 from utils.itf.itf import TokenDetector
 from utils.intent_classifier import Classifier
 from utils.ui.ui_helper import Ui, webview
 from utils.tray_helper.tray_helper import TrayHelper
 from utils.hook_helper import thread_helper
+from utils.lazy_proxy import LazyProxy
+from utils.startup import StartupPipeline
 from threading import Thread
-from tensorflow import keras
 from typing import *
 
-keras.mixed_precision.set_global_policy('mixed_float16')
-
-
-def init_model(model_class: Union[Classifier, TokenDetector], epochs: int) -> None:
-    if model_class.is_usable():
-        if isinstance(model_class, Classifier):
-            model_class.train(epochs=20)  # make sure that the model is trained on the new dataset
-        return
-    model_class.train(epochs=epochs)
-    # TODO: Make instance check and load pretrained model if available
-
 
 def show_startup_message() -> None:
     msg_width: int = 75
@@ -35,46 +26,62 @@ def show_startup_message() -> None:
     print('-' * msg_width)
 
 
+def parse_args() -> argparse.Namespace:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='BaxterLite')
+    parser.add_argument('--retrain', action='store_true',
+                        help='retrain the intent classifier even if the intent dataset did not change')
+    parser.add_argument('--profile-startup', metavar='PATH', default=None,
+                        help='write the duration of every startup phase as JSON to PATH')
+    parser.add_argument('--refresh-catalog', action='store_true',
+                        help='update datasets/word2vec_catalog.json from the gensim catalog (needs internet)')
+    return parser.parse_args()
+
+
 def main() -> None:
+    args: argparse.Namespace = parse_args()
     show_startup_message()
     start: float = time.time()
 
-    model_helper: Word2VecModels = Word2VecModels()
-    target_model: Model = model_helper.get_model_by_idx(5)
-    # target_model: Model = model_helper.get_model_by_idx(0)
-    config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
-
-    str_helper: StringHelper = StringHelper(target_model)
-    token_detector: TokenDetector = TokenDetector(config_helper=config_helper, str_helper=str_helper,
-                                                  intent_paths=[],
-                                                  use_pretrained=True)
-    init_model(token_detector,
-               115)  # NOTE: You should always prefer the pretrained model since it is trained on a huge dataset
-    # and the training process takes a lot of time.
-    # token_detector.train(epochs=10, train_on_pretrained=True)
+    pipeline: StartupPipeline = StartupPipeline()
+    with pipeline.measure('config'):
+        config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    # Only a few actions need the TokenDetector, so with lazy_token_detector it is loaded on its first use (or in the
+    # background once the UI is up, see preload_token_detector) instead of delaying the startup
+    lazy_token_detector: bool = bool(config_helper.get_config_setting('lazy_token_detector'))
+    add_model_phases(pipeline, config_helper, retrain=args.retrain, refresh_catalog=args.refresh_catalog,
+                     lazy_token_detector=lazy_token_detector)
+    results: Dict[str, Any] = pipeline.run()
+    classifier: Classifier = results['classifier']
+    token_detector: Union[TokenDetector, LazyProxy] = results['token_detector']
 
-    classifier: Classifier = Classifier(config_helper, str_helper, 'datasets/intents.json', use_pretrained=True)
-    init_model(classifier, 200)
+    # pywebview windows are created on the main thread
+    with pipeline.measure('ui', depends_on=['classifier', 'token_detector', 'plugins']):
+        action_helper: ActionHelper = ActionHelper(config_helper=config_helper,
+                                                   token_detector=token_detector,
+                                                   classifier=classifier)
 
-    action_helper: ActionHelper = ActionHelper(config_helper=config_helper,
-                                               token_detector=token_detector,
-                                               classifier=classifier)
+        ui_title: str = config_helper.get_config_setting('ui_title')
+        ui_width: int = config_helper.get_config_setting('ui_width')
+        ui_height: int = config_helper.get_config_setting('ui_height')
 
-    ui_title: str = config_helper.get_config_setting('ui_title')
-    ui_width: int = config_helper.get_config_setting('ui_width')
-    ui_height: int = config_helper.get_config_setting('ui_height')
+        ui: Ui = Ui(title=ui_title, width=ui_width, height=ui_height, classifier=classifier,
+                    action_helper=action_helper, config_helper=config_helper)
 
-    ui: Ui = Ui(title=ui_title, width=ui_width, height=ui_height, classifier=classifier, action_helper=action_helper,
-                config_helper=config_helper)
+        action_helper.set_ui(ui)
 
-    action_helper.set_ui(ui)
-
-    Thread(target=TrayHelper.run_from_thread, args=(ui, config_helper)).start()
-    Thread(target=thread_helper, args=(ui,)).start()
+        Thread(target=TrayHelper.run_from_thread, args=(ui, config_helper)).start()
+        Thread(target=thread_helper, args=(ui,)).start()
 
     print(f'Startup in {time.time() - start} seconds')
-
-    webview.start(debug=False)
+    pipeline.print_report()
+    if args.profile_startup:
+        pipeline.write_profile(args.profile_startup)
+
+    # webview.start calls the function in a separate thread once the GUI loop is running
+    preload: bool = lazy_token_detector and bool(config_helper.get_config_setting('preload_token_detector'))
+    webview.start(token_detector.preload if preload else None, debug=False)
+    action_helper.shutdown()
+    ui.get_session_store().snapshot()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,120 @@
+import argparse
+import logging
+import os
+import socket
+import sys
+import time
+from utils.action_helper.action_helper import ActionHelper
+from utils.bootstrap import add_model_phases, start_classifier_scheduler, start_token_detector_scheduler
+from utils.config_helper import ConfigHelper
+from utils.intent_backends import PRETRAINED_DIR
+from utils.intent_classifier import Classifier
+from utils.itf.itf import TokenDetector
+from utils.lazy_proxy import LazyProxy
+from utils.numpy_engine import check_quantization, get_export_path, is_export_current
+from utils.server.prefork import PreforkServer
+from utils.server.server import Server
+from utils.session_store import SessionStore
+from utils.startup import StartupPipeline
+from utils.string_helper import DEFAULT_MODEL_NAME
+from functools import partial
+from typing import *
+
+
+def parse_args() -> argparse.Namespace:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='BaxterLite HTTP/WebSocket server')
+    parser.add_argument('--host', default=None, help='interface to listen on (default: server_host in config.json)')
+    parser.add_argument('--port', type=int, default=None, help='port to listen on (default: server_port in config.json)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='amount of worker processes sharing the port, more than 1 needs a posix system '
+                             '(default: server_workers in config.json)')
+    parser.add_argument('--retrain', action='store_true',
+                        help='retrain the intent classifier even if the intent dataset did not change')
+    return parser.parse_args()
+
+
+def check_prefork_models(config_helper: ConfigHelper) -> None:
+    """
+    TensorFlow is not fork-safe (the workers can hang in its thread pools), so the pre-fork mode only runs on the NumPy
+    exports of the models. Raises if a model would still be loaded through Keras.
+    :param config_helper: ConfigHelper instance
+    :return: None
+    """
+    if config_helper.get_config_setting('inference_mode') != 'numpy':
+        raise Exception('The pre-fork mode of the server needs "inference_mode": "numpy" in config.json, TensorFlow is '
+                        'not fork-safe.')
+    model_name: str = config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME
+    quantization: Union[str, None] = check_quantization(config_helper.get_config_setting('model_quantization'))
+    model_files: List[str] = [os.path.join(PRETRAINED_DIR, f'token_detector-{model_name}.h5')]
+    if config_helper.get_config_setting('intent_backend') in [None, 'lstm']:  # the centroid backend has no Keras model
+        model_files.append(os.path.join(PRETRAINED_DIR, f'intent_detector_{model_name}.h5'))
+    for model_file in model_files:
+        export_file: str = get_export_path(model_file, quantization)
+        if not is_export_current(model_file, export_file):
+            raise Exception(f'The pre-fork mode of the server needs a current NumPy export of {model_file} '
+                            f'({export_file}). Start the server once with 1 worker or run '
+                            f'python -m utils.numpy_engine --model {model_name}'
+                            f'{" --quantize " + quantization if quantization else ""}.')
+
+
+def run_worker(config_helper: ConfigHelper, classifier: Classifier, token_detector: Union[TokenDetector, LazyProxy],
+               idx: int, sock: socket.socket) -> None:
+    # threads don't survive a fork, so the schedulers and the action executor are started in every worker
+    start_classifier_scheduler(config_helper, classifier)
+    start_token_detector_scheduler(config_helper, token_detector)
+    action_helper: ActionHelper = ActionHelper(config_helper=config_helper,
+                                               token_detector=token_detector,
+                                               classifier=classifier)
+    # the conversations of a worker are only known to that worker, so there is no shared snapshot and HTTP requests
+    # (which the kernel hands to any worker) can't continue a conversation
+    session_store: SessionStore = SessionStore(ttl_seconds=config_helper.get_config_setting('session_ttl_seconds'),
+                                               max_sessions=config_helper.get_config_setting('session_max_count')
+                                               or 10000)
+    logging.info(f'Worker {idx} started')
+    try:
+        Server(config_helper, classifier, action_helper, session_store, http_sessions=False).run(sock=sock)
+    finally:
+        action_helper.shutdown()
+
+
+def main() -> None:
+    args: argparse.Namespace = parse_args()
+    start: float = time.time()
+
+    pipeline: StartupPipeline = StartupPipeline()
+    with pipeline.measure('config'):
+        config_helper: ConfigHelper = ConfigHelper(config_path='config.json')
+    workers: int = args.workers or config_helper.get_config_setting('server_workers') or 1
+    if workers > 1:
+        check_prefork_models(config_helper)
+    # in the pre-fork mode everything is loaded by the parent, so the workers share it
+    add_model_phases(pipeline, config_helper, retrain=args.retrain,
+                     lazy_token_detector=workers == 1 and bool(config_helper.get_config_setting('lazy_token_detector')),
+                     start_schedulers=workers == 1)
+    results: Dict[str, Any] = pipeline.run()
+    classifier: Classifier = results['classifier']
+    print(f'Startup in {time.time() - start} seconds')
+    pipeline.print_report()
+
+    host: str = args.host or config_helper.get_config_setting('server_host') or '127.0.0.1'
+    port: int = args.port or config_helper.get_config_setting('server_port') or 8080
+    if workers > 1:
+        # e.g. the intent classifier was retrained because the intent dataset changed
+        if 'tensorflow' in sys.modules:
+            raise Exception('TensorFlow was loaded during the startup, but it is not fork-safe. Start the server once '
+                            'with 1 worker, so the models are trained and exported, then restart it with more workers.')
+        PreforkServer(partial(run_worker, config_helper, classifier, results['token_detector']), workers).serve(host,
+                                                                                                                port)
+        return
+
+    action_helper: ActionHelper = ActionHelper(config_helper=config_helper,
+                                               token_detector=results['token_detector'],
+                                               classifier=classifier)
+    try:
+        Server(config_helper, classifier, action_helper).run(host, port)
+    finally:
+        action_helper.shutdown()
+
+
+if __name__ == '__main__':
+    main()
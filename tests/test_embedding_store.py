@@ -0,0 +1,72 @@
+# Offline round trip of the compact word vector format: a small synthetic word2vec text file is exported and looked up
+# again through the memory-mapped EmbeddingStore. Run from the project root: python -m unittest discover -s tests
+
+import os
+import tempfile
+import unittest
+from typing import *
+
+import numpy as np
+
+from utils.embedding_store import EmbeddingStore, export_vectors, get_store_dir, read_word2vec_text
+
+
+class EmbeddingStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.__tmp: tempfile.TemporaryDirectory = tempfile.TemporaryDirectory()
+        self.__root: str = self.__tmp.name
+
+    def tearDown(self) -> None:
+        self.__tmp.cleanup()
+
+    def __write_vectors(self, lines: List[str]) -> str:
+        path: str = os.path.join(self.__root, 'vectors.txt')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+        return path
+
+    def test_round_trip(self) -> None:
+        path: str = self.__write_vectors(['3 4',
+                                          'hello 0.1 0.2 0.3 0.4',
+                                          'world -1 0 1 2',
+                                          'straße 0.5 0.25 0.125 0'])
+        words, vectors = read_word2vec_text(path)
+        self.assertEqual(words, ['hello', 'world', 'straße'])
+        self.assertEqual(vectors.shape, (3, 4))
+
+        for dtype in ['float32', 'float16']:
+            directory: str = get_store_dir(f'synthetic-{dtype}', self.__root)
+            export_vectors(words, vectors, directory, 'synthetic', dtype)
+            self.assertTrue(EmbeddingStore.exists(directory))
+
+            store: EmbeddingStore = EmbeddingStore(directory)
+            self.assertEqual(len(store), 3)
+            self.assertEqual(store.get_dimensions(), 4)
+            self.assertEqual(store.get_model_name(), 'synthetic')
+            self.assertIn('straße', store)
+            self.assertNotIn('missing', store)
+            self.assertEqual(store.key_to_index['world'], 1)
+            for idx, word in enumerate(words):
+                self.assertEqual(store[word].dtype, np.float32)
+                np.testing.assert_allclose(store[word], vectors[idx], atol=1e-3)
+
+    def test_line_breaks_are_rejected(self) -> None:
+        vectors: np.ndarray = np.eye(3, 4, dtype=np.float32)
+        for idx, word in enumerate(['b\nc', 'b\rc']):
+            directory: str = os.path.join(self.__root, f'broken-{idx}')
+            with self.assertRaises(Exception):
+                export_vectors(['a', word, 'd'], vectors, directory, 'broken')
+            self.assertFalse(EmbeddingStore.exists(directory))
+
+    def test_windows_line_endings(self) -> None:
+        # stores written in text mode on Windows end every line with \r\n
+        directory: str = get_store_dir('windows', self.__root)
+        export_vectors(['a', 'b', 'c'], np.eye(3, 4, dtype=np.float32), directory, 'windows')
+        with open(os.path.join(directory, 'vocab.txt'), 'w', encoding='utf-8', newline='') as f:
+            f.write('a\r\nb\r\nc')
+        store: EmbeddingStore = EmbeddingStore(directory)
+        self.assertEqual(store.key_to_index, {'a': 0, 'b': 1, 'c': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
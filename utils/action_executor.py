@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import *
+
+from utils.config_helper import ConfigHelper
+
+# action keys of the current call chain (e.g. repeat -> play_song), so an action which calls itself doesn't wait for the
+# concurrency slot it already occupies
+_running_actions: contextvars.ContextVar = contextvars.ContextVar('running_actions', default=frozenset())
+# workers of the nested pool per worker of the pool, enough for call chains a few levels deep
+NESTED_WORKERS_PER_WORKER: int = 4
+
+
+class ActionTimeoutError(Exception):
+    pass
+
+
+class ActionExecutor:
+    def __init__(self, max_workers: int = 8, timeouts: Union[Dict[str, Union[float, None]], None] = None,
+                 concurrency: Union[Dict[str, Union[int, None]], None] = None, name: str = 'action-executor') -> None:
+        """
+        Runs actions on one persistent event loop (coroutine actions) and a bounded thread pool (sync actions), so a slow
+        action doesn't block the thread which classifies the next message.
+        :param max_workers: int - maximum amount of sync actions running at the same time
+        :param timeouts: Dict[str, float | None] - seconds per action key, 'default' applies to all other actions,
+        None means no timeout
+        :param concurrency: Dict[str, int | None] - maximum amount of parallel calls per action key, 'default' applies
+        to all other actions, None means no limit
+        :param name: string - name of the event loop thread and prefix of the worker threads
+        """
+        if max_workers < 1:
+            raise Exception('max_workers of the action executor must be at least 1.')
+        self.__timeouts: Dict[str, Union[float, None]] = dict(timeouts or {})
+        self.__concurrency: Dict[str, Union[int, None]] = dict(concurrency or {})
+        self.__name: str = name
+
+        self.__max_workers: int = max_workers
+        self.__pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        # sync actions started by a sync action (which blocks its worker while it waits) run here, otherwise a full
+        # pool would wait for itself
+        self.__nested_pool: ThreadPoolExecutor = ThreadPoolExecutor(
+            max_workers=max_workers * NESTED_WORKERS_PER_WORKER, thread_name_prefix=f'{name}-nested')
+        self.__worker_threads: Set[int] = set()
+        # only used on the loop thread
+        self.__semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.__free_workers: Union[asyncio.Semaphore, None] = None
+        self.__stopped: bool = False
+
+        self.__loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.__loop_thread: threading.Thread = threading.Thread(target=self.__run_loop, name=name, daemon=True)
+        self.__loop_thread.start()
+
+    @staticmethod
+    def from_config(config_helper: ConfigHelper) -> 'ActionExecutor':
+        """
+        Creates an executor with action_workers, action_timeouts and action_concurrency of config.json
+        :param config_helper: ConfigHelper instance
+        :return: ActionExecutor
+        """
+        max_workers: Union[int, None] = config_helper.get_config_setting('action_workers')
+        return ActionExecutor(max_workers=max_workers if max_workers is not None else 8,
+                              timeouts=config_helper.get_config_setting('action_timeouts'),
+                              concurrency=config_helper.get_config_setting('action_concurrency'))
+
+    def __run_loop(self) -> None:
+        asyncio.set_event_loop(self.__loop)
+        self.__loop.run_forever()
+
+    def get_loop(self) -> asyncio.AbstractEventLoop:
+        return self.__loop
+
+    def is_loop_thread(self) -> bool:
+        return threading.get_ident() == self.__loop_thread.ident
+
+    def is_worker_thread(self) -> bool:
+        return threading.get_ident() in self.__worker_threads
+
+    def get_timeout(self, action_key: str) -> Union[float, None]:
+        return self.__timeouts.get(action_key, self.__timeouts.get('default'))
+
+    def __get_limit(self, action_key: str) -> Union[int, None]:
+        return self.__concurrency.get(action_key, self.__concurrency.get('default'))
+
+    def submit(self, action_key: str, fn: Callable[..., Any], *args: Any) -> Future:
+        """
+        Runs fn(*args) in the background. Coroutine functions run on the event loop, everything else in the thread pool.
+        The context variables of the caller are visible inside the action. Actions started by other actions (e.g. by
+        repeat) get the same concurrency limit and timeout.
+        :param action_key: string - action key, used for the timeout and the concurrency limit
+        :param fn: Callable - get_response method of the action
+        :param args: Any - arguments of fn
+        :return: Future - resolves with the result of fn, ActionTimeoutError if it took longer than its timeout
+        """
+        if self.__stopped:
+            raise Exception(f'Action executor {self.__name} is already stopped.')
+        context: contextvars.Context = contextvars.copy_context()
+        return asyncio.run_coroutine_threadsafe(self.__run(action_key, fn, args, context, self.is_worker_thread()),
+                                                self.__loop)
+
+    async def __run(self, action_key: str, fn: Callable[..., Any], args: Tuple[Any, ...], context: contextvars.Context,
+                    nested: bool) -> Any:
+        running: FrozenSet[str] = context.get(_running_actions, frozenset())
+        context.run(_running_actions.set, running | {action_key})
+        is_sync: bool = not asyncio.iscoroutinefunction(fn)
+        limit: Union[int, None] = None if action_key in running else self.__get_limit(action_key)
+
+        semaphores: List[asyncio.Semaphore] = []
+        if is_sync and not nested:
+            # the worker is reserved before the concurrency slot of the action, so an action which holds a slot never
+            # waits for a worker which is blocked by an action waiting for that slot (e.g. repeat -> play_song)
+            if self.__free_workers is None:
+                self.__free_workers = asyncio.Semaphore(self.__max_workers)
+            semaphores.append(self.__free_workers)
+        if limit is not None:
+            if action_key not in self.__semaphores:
+                self.__semaphores[action_key] = asyncio.Semaphore(limit)
+            semaphores.append(self.__semaphores[action_key])
+
+        acquired: List[asyncio.Semaphore] = []
+        try:
+            for semaphore in semaphores:
+                await semaphore.acquire()
+                acquired.append(semaphore)
+            if is_sync:
+                pool: ThreadPoolExecutor = self.__nested_pool if nested else self.__pool
+                # cancelling a running sync action has no effect, the one of a queued action removes it from the pool
+                work: Union[Future, asyncio.Task] = pool.submit(context.run, self.__call_in_worker, fn, args)
+                job: asyncio.Future = asyncio.wrap_future(work)
+            else:
+                # tasks copy the current context, so the task is created inside the context of the caller
+                work = job = context.run(self.__loop.create_task, fn(*args))
+        except BaseException:
+            for semaphore in acquired:
+                semaphore.release()
+            raise
+        # the slots are released when the action has really ended, a sync action can't be interrupted, so after a
+        # timeout it keeps its worker and its slot until it returns (its result is dropped)
+        job.add_done_callback(lambda _: [semaphore.release() for semaphore in acquired])
+
+        timeout: Union[float, None] = self.get_timeout(action_key)
+        try:
+            return await asyncio.wait_for(asyncio.shield(job), timeout)
+        except asyncio.TimeoutError:
+            work.cancel()
+            raise ActionTimeoutError(f'Action {action_key} took longer than {timeout} seconds')
+        except asyncio.CancelledError:
+            work.cancel()
+            raise
+
+    def __call_in_worker(self, fn: Callable[..., Any], args: Tuple[Any, ...]) -> Any:
+        self.__worker_threads.add(threading.get_ident())
+        return fn(*args)
+
+    def shutdown(self) -> None:
+        """
+        Stops the event loop and the thread pool, running sync actions are finished first
+        :return: None
+        """
+        if self.__stopped:
+            return
+        self.__stopped = True
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__loop_thread.join()
+        self.__pool.shutdown(wait=True)
+        self.__nested_pool.shutdown(wait=True)
+        try:
+            self.__loop.close()
+        except Exception as e:
+            logging.error(['[ActionExecutor -> shutdown]', 'While closing the event loop', e])
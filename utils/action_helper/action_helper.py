@@ -1,14 +1,21 @@
-from utils.action_helper.actions import current_time_action, greet_action, play_song_action, clear_chat_action, \
-    tell_joke_action, repeat_action, open_website_action
+from utils.action_helper.actions import current_time_action, greet_action, clear_chat_action, tell_joke_action, \
+    repeat_action
+from utils.action_executor import ActionExecutor, ActionTimeoutError
 from utils.config_helper import ConfigHelper
 from utils.action_utils import ActionUtils, TriggerInfos
 from utils.intent_classifier import Classifier
 from utils.itf.itf import TokenDetector
+from utils.lazy_proxy import LazyProxy
+from concurrent.futures import Future
 from typing import *
+import importlib
 import logging
-import asyncio
 
 from utils.plugin_manager import PluginManager
+from utils.prompt_broker import current_conversation
+
+if TYPE_CHECKING:
+    from utils.ui.ui_helper import Ui  # only for type hints, importing it at runtime would load pywebview
 
 
 class BaxterPlugin:
@@ -28,29 +35,43 @@ class BaxterPlugin:
         return self.version
 
 
+def lazy_action(module_name: str, class_name: str) -> LazyProxy:
+    """
+    Imports an action on its first call, for actions with heavy dependencies (e.g. ytmusicapi)
+    :param module_name: string - name of the module in utils/action_helper/actions
+    :param class_name: string - name of the action class
+    :return: LazyProxy - proxy of the action instance
+    """
+    return LazyProxy(lambda: getattr(importlib.import_module(f'utils.action_helper.actions.{module_name}'),
+                                     class_name)(), class_name)
+
+
 class ActionHelper:
-    def __init__(self, config_helper: ConfigHelper, token_detector: TokenDetector, classifier: Classifier) -> None:
+    def __init__(self, config_helper: ConfigHelper, token_detector: Union[TokenDetector, LazyProxy],
+                 classifier: Classifier) -> None:
         self.__config_helper: ConfigHelper = config_helper
         self.__action_utils: ActionUtils = ActionUtils(config_helper=config_helper,
                                                        token_detector=token_detector,
                                                        action_helper=self,
                                                        classifier=classifier)
         self.__plugin_manager: PluginManager = PluginManager(classifier)
+        # persistent event loop and bounded thread pool for the actions, see action_workers, action_timeouts and
+        # action_concurrency in config.json
+        self.__executor: ActionExecutor = ActionExecutor.from_config(config_helper)
 
         self.__actions: dict = {
             'get_current_time': current_time_action.CurrentTimeAction(),
             'greet_user': greet_action.GreetAction(),
-            'play_song': play_song_action.PlaySongAction(),
+            'play_song': lazy_action('play_song_action', 'PlaySongAction'),
             'clear_chat': clear_chat_action.ClearChatAction(),
             'tell_joke': tell_joke_action.TellJokeAction(),
             'repeat': repeat_action.RepeatAction(),
-            'open_website': open_website_action.OpenWebsiteAction(),
+            'open_website': lazy_action('open_website_action', 'OpenWebsiteAction'),
         }
         self.__actions.update(self.__plugin_manager.get_plugin_actions())
         self.__plugins: List[BaxterPlugin] = []
 
-        from utils.ui.ui_helper import Ui  # import locally to avoid circular imports but still have type hints
-        self.__ui: Union[Ui, None] = None
+        self.__ui: Union['Ui', None] = None
 
     def set_ui(self, ui) -> None:
         self.__action_utils.set_ui(ui)
@@ -70,9 +91,70 @@ class ActionHelper:
         """
         return action_key in self.__actions.keys()
 
+    def get_executor(self) -> ActionExecutor:
+        return self.__executor
+
+    def shutdown(self) -> None:
+        self.__executor.shutdown()
+
+    def __get_action_function(self, action_key: str) -> Union[Callable, None]:
+        action: Any = self.__actions.get(action_key)
+        if action is None:
+            return None
+        # every class linked in self.__actions MUST have a get_response method
+        get_response: Union[Callable, None] = getattr(action, 'get_response', None)
+        if get_response is None:
+            raise Exception(f'Action {action_key} has no get_response method')
+        return get_response
+
+    @staticmethod
+    def __resolved(result: Any) -> Future:
+        future: Future = Future()
+        future.set_result(result)
+        return future
+
+    def dispatch_action(self, input_str: str, action_key: str, main_str: str, error_str: str,
+                        trigger_infos: TriggerInfos) -> Future:
+        """
+        Starts an action in the background and returns immediately
+        :param input_str: string - input string of the user
+        :param action_key: string - action key also known as action name
+        :param main_str: string - main response string of action (randomly chosen from patterns list)
+        :param error_str: string - error response string of action
+        :param trigger_infos: TriggerInfos - util class to pass infos about the current trigger of an action
+        :return: Future - resolves with the response of the action (error_str if it failed or timed out)
+        """
+        if action_key == 'stopword-detected':
+            return self.__resolved(None)
+        if action_key is None:
+            return self.__resolved(main_str)
+        get_response: Union[Callable, None] = self.__get_action_function(action_key)
+        if get_response is None:
+            return self.__resolved(main_str)
+
+        result: Future = Future()
+        channel: Any = self.__action_utils.get_channel()
+        conversation_id: str = current_conversation.get()
+
+        def on_done(action_future: Future) -> None:
+            try:
+                result.set_result(action_future.result())
+            except Exception as e:
+                logging.error(['[ActionHelper -> dispatch_action]', 'While trying to execute action', action_key, e])
+                if isinstance(e, ActionTimeoutError) and channel is not None:
+                    # the action gave up, so its prompt must not take the next message of the user as its answer
+                    channel.cancel_prompts(conversation_id)
+                result.set_result(error_str)
+
+        self.__executor.submit(action_key, get_response, input_str, main_str, error_str, self.__action_utils,
+                               trigger_infos).add_done_callback(on_done)
+        return result
+
     def try_action(self, input_str: str, action_key: str, main_str: str, error_str: str,
                    trigger_infos: TriggerInfos) -> Any:
         """
+        Blocking version of dispatch_action for sync actions which call other actions (e.g. repeat). Coroutine actions
+        run on the event loop of the actions, which must not block, so they have to await dispatch_action instead.
         :param input_str: string - input string of the user
         :param action_key: string - action key also known as action name
         :param main_str: string - main response string of action (randomly chosen from patterns list)
@@ -80,27 +162,7 @@ class ActionHelper:
         :param trigger_infos: TriggerInfos - util class to pass infos about the current trigger of an action
         :return: Any - response of action, should be a string
         """
-        if action_key == 'stopword-detected':
-            return None
-        if action_key is None:
-            return main_str
-        action: Callable = self.__actions.get(action_key)
-        if action is None:
-            return main_str
-        # return action(input_str, main_str, error_str, self.__action_utils)
-        # every class linked in self.__actions MUST have a get_response method
-        try:
-            # return action.get_response(input_str, main_str, error_str, self.__action_utils,  # type: ignore
-            #                            trigger_infos)
-            # check if the get_response function is a coroutine (async function)
-            if asyncio.iscoroutinefunction(action.get_response):
-                return asyncio.run(action.get_response(input_str, main_str, error_str, self.__action_utils,
-                                                       trigger_infos))
-            else:
-                return action.get_response(input_str, main_str, error_str, self.__action_utils,
-                                           trigger_infos)
-        except AttributeError:
-            raise Exception(f'Action {action_key} has no get_response method')
-        except Exception as e:
-            logging.error(['[ActionHelper -> try_action]', 'While trying to execute action', action_key, e])
-            return error_str
+        if self.__executor.is_loop_thread():
+            raise Exception('try_action would block the event loop of the actions, await '
+                            'asyncio.wrap_future(ActionHelper.dispatch_action(...)) instead.')
+        return self.dispatch_action(input_str, action_key, main_str, error_str, trigger_infos).result()
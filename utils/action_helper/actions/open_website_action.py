@@ -1,15 +1,16 @@
 import webbrowser as wb
 
-from utils.action_utils import ActionUtils
+from utils.action_utils import ActionUtils, TriggerInfos
 from utils.itf.itf import PositionPrediction
 
 
 class OpenWebsiteAction:
     @classmethod
     def get_response(cls, input_str: str, main_str: str, error_str: str, action_utils: ActionUtils,
-                     _: object) -> str:
+                     trigger_infos: TriggerInfos) -> str:
         try:
-            positions: PositionPrediction = action_utils.get_token_detector().get_important_parts(input_str)
+            positions: PositionPrediction = action_utils.get_token_detector().get_important_parts(
+                trigger_infos.get_message(input_str))
             web_start_idx, web_end_idx = positions.part1_start, positions.part1_end
             if not all([web_start_idx, web_end_idx]):
                 return error_str
@@ -1,5 +1,5 @@
 import logging
-from utils.action_utils import ActionUtils
+from utils.action_utils import ActionUtils, TriggerInfos
 from utils.itf.itf import TokenDetector, PositionPrediction
 from typing import *
 import ytmusicapi as yt_api
@@ -9,10 +9,11 @@ import os
 
 class PlaySongAction:
     def get_response(self, input_str: str, main_str: str, error_str: str, action_utils: ActionUtils,
-                     __: object) -> str:
+                     trigger_infos: TriggerInfos) -> str:
         try:
             token_detector: TokenDetector = action_utils.get_token_detector()
-            position_prediction: PositionPrediction = token_detector.get_important_parts(input_str)
+            position_prediction: PositionPrediction = token_detector.get_important_parts(
+                trigger_infos.get_message(input_str))
 
             song_indexes: List[int] = [round(x) for x in
                                        [position_prediction.part1_start, position_prediction.part1_end]]
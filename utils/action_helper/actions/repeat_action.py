@@ -13,7 +13,8 @@ class RepeatAction:
                 return error_str
             # rerun last action
             new_trigger_infos: TriggerInfos = TriggerInfos(ui=trigger_infos.ui, last_action='repeat',
-                                                           last_input=trigger_infos.last_input)
+                                                           last_input=trigger_infos.last_input,
+                                                           message=trigger_infos.last_message)
             intent_data: Intent = action_utils.get_classifier().get_intent_by_action(trigger_infos.last_action)
             if intent_data is None:
                 print('No intent data found for last action')
@@ -1,33 +1,62 @@
+import contextvars
 from dataclasses import dataclass
 
-import webview
 from utils.config_helper import ConfigHelper
 from utils.itf.itf import TokenDetector
+from utils.lazy_proxy import LazyProxy
+from utils.string_helper import FeaturizedMessage
 from typing import *
 import re
 
+if TYPE_CHECKING:
+    from utils.ui.ui_helper import Ui  # only for type hints, importing it at runtime would load pywebview
+
+# channel (the Ui or a connection of the server) the current message came from, the server sets it per message and
+# actions inherit it from ActionHelper.dispatch_action
+current_channel: contextvars.ContextVar = contextvars.ContextVar('current_channel', default=None)
+
 
 @dataclass
 class TriggerInfos:
     # Util class to pass infos about the current trigger of an action
-    ui: webview.Window
+    ui: Any  # webview.Window of the desktop app or the connection of the server, both have evaluate_js
     last_action: Union[str, None]
     last_input: Union[str, None]
+    # already embedded versions of the current and the last input, so actions don't have to embed them again
+    message: Union[FeaturizedMessage, None] = None
+    last_message: Union[FeaturizedMessage, None] = None
+
+    def get_message(self, input_str: str) -> Union[FeaturizedMessage, str]:
+        """
+        :param input_str: string - input string the action was called with
+        :return: FeaturizedMessage of the input if available, else the input string itself
+        """
+        if self.message is not None and self.message.text == input_str:
+            return self.message
+        return input_str
 
 
 class ActionUtils:
-    def __init__(self, config_helper: ConfigHelper, token_detector: TokenDetector, action_helper, classifier) -> None:
+    def __init__(self, config_helper: ConfigHelper, token_detector: Union[TokenDetector, LazyProxy], action_helper,
+                 classifier) -> None:
         self.__config_helper: ConfigHelper = config_helper
-        self.__token_detector: TokenDetector = token_detector
+        # the TokenDetector can be a LazyProxy, which loads it on the first call
+        self.__token_detector: Union[TokenDetector, LazyProxy] = token_detector
         self.__action_helper = action_helper
         self.__classifier = classifier
 
-        from utils.ui.ui_helper import Ui  # import locally to avoid circular imports but still have type hints
-        self.__ui: Union[Ui, None] = None
+        self.__ui: Union['Ui', None] = None
 
     def set_ui(self, ui) -> None:
         self.__ui = ui
 
+    def get_channel(self) -> Any:
+        """
+        :return: Any - channel of the current message (see current_channel), the Ui if there is none
+        """
+        channel: Any = current_channel.get()
+        return channel if channel is not None else self.__ui
+
     def request_input(self, prompt: str, callback: Callable[[str], None]) -> None:
         """
         Use this method if you want to request some input from the user.
@@ -35,15 +64,17 @@ class ActionUtils:
         :param callback: Callable[[str], None] -> callback to call when the user sends a message
         :return: None
         """
-        self.__ui.request_next_message(prompt, callback)
+        self.get_channel().request_next_message(prompt, callback)
 
-    async def request_input_async(self, prompt: str) -> str:
+    async def request_input_async(self, prompt: str, timeout: Union[float, None] = None) -> str:
         """
         Use this method if you want to request some input from the user.
         :param prompt: str -> prompt to send to the ui (message to display)
+        :param timeout: float -> seconds to wait for the response, raises a PromptTimeoutError if the user doesn't
+        answer in time, None waits until the user answers
         :return: str -> response from the user
         """
-        return await self.__ui.request_next_message_async(prompt)
+        return await self.get_channel().request_next_message_async(prompt, timeout)
 
     def send_message(self, message: str) -> None:
         """
@@ -51,7 +82,7 @@ class ActionUtils:
         :param message: str -> message to send
         :return: None
         """
-        self.__ui.send_message(message)
+        self.get_channel().send_message(message)
 
     def get_classifier(self):
         return self.__classifier
@@ -62,7 +93,7 @@ class ActionUtils:
     def get_config_helper(self) -> ConfigHelper:
         return self.__config_helper
 
-    def get_token_detector(self) -> TokenDetector:
+    def get_token_detector(self) -> Union[TokenDetector, LazyProxy]:
         return self.__token_detector
 
     @staticmethod
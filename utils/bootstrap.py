@@ -0,0 +1,116 @@
+# Loads the models of BaxterLite (word vectors, intent classifier, token detector). Shared by the desktop app (main.py)
+# and the headless server (server.py), so it must not import any UI code.
+
+from utils.config_helper import ConfigHelper
+from utils.string_helper import DEFAULT_MODEL_NAME, StringHelper, Model, Word2VecModels
+from utils.itf.itf import TokenDetector
+from utils.intent_classifier import Classifier
+from utils.inference_scheduler import InferenceScheduler
+from utils.lazy_proxy import LazyProxy
+from utils.intent_backends import IntentBackend
+from utils.plugin_manager import PluginManager
+from utils.startup import StartupPipeline
+from functools import partial
+from typing import *
+
+
+def init_model(model_class: Union[Classifier, TokenDetector], epochs: int, force_retrain: bool = False) -> None:
+    if model_class.is_usable():
+        if isinstance(model_class, Classifier) and (force_retrain or not model_class.is_up_to_date()):
+            # new intents/patterns only need a short fine-tuning, everything else is trained on the whole dataset
+            if force_retrain or not model_class.train_incremental():
+                model_class.train(epochs=20)  # make sure that the model is trained on the new dataset
+        return
+    model_class.train(epochs=epochs)
+    # TODO: Make instance check and load pretrained model if available
+
+
+def start_token_detector_scheduler(config_helper: ConfigHelper, token_detector: TokenDetector) -> None:
+    token_detector.set_scheduler(InferenceScheduler.from_config(config_helper, token_detector.get_important_parts_batch,
+                                                                name='token-detector-scheduler'))
+
+
+def start_classifier_scheduler(config_helper: ConfigHelper, classifier: Classifier) -> None:
+    # Concurrent requests are merged into one forward pass if inference_batching is enabled in config.json
+    # (sentences found by the pattern matcher never reach the scheduler, so it doesn't have to check them again)
+    classifier.set_scheduler(InferenceScheduler.from_config(config_helper,
+                                                            partial(classifier.classify_batch,
+                                                                    use_pattern_matcher=False),
+                                                            name='classifier-scheduler'))
+
+
+def create_token_detector(config_helper: ConfigHelper, str_helper: StringHelper,
+                          with_scheduler: bool = True) -> TokenDetector:
+    token_detector: TokenDetector = TokenDetector(config_helper=config_helper, str_helper=str_helper,
+                                                  intent_paths=[],
+                                                  use_pretrained=True)
+    init_model(token_detector,
+               115)  # NOTE: You should always prefer the pretrained model since it is trained on a huge dataset
+    # and the training process takes a lot of time.
+    # token_detector.train(epochs=10, train_on_pretrained=True)
+
+    # Trace the inference function once, so the first message doesn't pay for it
+    token_detector.warm_up()
+    if with_scheduler:
+        start_token_detector_scheduler(config_helper, token_detector)
+    return token_detector
+
+
+def load_string_helper(config_helper: ConfigHelper, target_model: Model) -> StringHelper:
+    # LRU cache sizes of StringHelper, missing settings keep the defaults
+    cache_sizes: dict = {key: config_helper.get_config_setting(key) for key in
+                         ['stem_cache_size', 'insertable_cache_size']
+                         if config_helper.setting_exists(key)}
+    return StringHelper(target_model, **cache_sizes)
+
+
+def load_token_detector(config_helper: ConfigHelper, str_helper: StringHelper, lazy: bool,
+                        with_scheduler: bool = True) -> Union[TokenDetector, LazyProxy]:
+    if lazy:
+        return LazyProxy(partial(create_token_detector, config_helper, str_helper, with_scheduler), 'TokenDetector')
+    return create_token_detector(config_helper, str_helper, with_scheduler)
+
+
+def load_classifier(config_helper: ConfigHelper, str_helper: StringHelper, backend: IntentBackend,
+                    force_retrain: bool, with_scheduler: bool = True) -> Classifier:
+    classifier: Classifier = Classifier(config_helper, str_helper, 'datasets/intents.json', use_pretrained=True,
+                                        backend=backend)
+    init_model(classifier, 200, force_retrain=force_retrain)
+
+    # Trace the inference function once, so the first message doesn't pay for it
+    classifier.warm_up()
+    if with_scheduler:
+        start_classifier_scheduler(config_helper, classifier)
+    return classifier
+
+
+def add_model_phases(pipeline: StartupPipeline, config_helper: ConfigHelper, retrain: bool = False,
+                     refresh_catalog: bool = False, lazy_token_detector: bool = False,
+                     start_schedulers: bool = True) -> None:
+    """
+    Adds the phases catalog, plugins, embeddings, intent_model, classifier and token_detector to the pipeline
+    :param pipeline: StartupPipeline instance
+    :param config_helper: ConfigHelper instance
+    :param retrain: bool - retrain the intent classifier even if the intent dataset did not change
+    :param refresh_catalog: bool - update the word vector catalog from the gensim catalog
+    :param lazy_token_detector: bool - load the TokenDetector on its first use instead of during the startup
+    :param start_schedulers: bool - start the inference schedulers (their threads don't survive a fork, so the
+    pre-fork server starts them in every worker, see start_classifier_scheduler and start_token_detector_scheduler)
+    :return: None
+    """
+    # Independent phases run at the same time, e.g. the word vectors are loaded while the intent detector is
+    # deserialized and the plugins are imported
+
+    # the word vector model is chosen by name (embedding_model in config.json) from the local catalog
+    model_name: str = config_helper.get_config_setting('embedding_model') or DEFAULT_MODEL_NAME
+    pipeline.add_phase('catalog', lambda _: Word2VecModels(refresh=refresh_catalog).get_model_by_name(model_name))
+    pipeline.add_phase('plugins', lambda _: PluginManager.import_plugins())
+    pipeline.add_phase('embeddings', lambda results: load_string_helper(config_helper, results['catalog']),
+                       depends_on=['catalog'])
+    pipeline.add_phase('intent_model', lambda results: Classifier.load_backend(
+        config_helper, results['catalog'].name, results['catalog'].dimensions), depends_on=['catalog'])
+    pipeline.add_phase('classifier', lambda results: load_classifier(
+        config_helper, results['embeddings'], results['intent_model'], retrain, start_schedulers),
+                       depends_on=['embeddings', 'intent_model'])
+    pipeline.add_phase('token_detector', lambda results: load_token_detector(
+        config_helper, results['embeddings'], lazy_token_detector, start_schedulers), depends_on=['embeddings'])
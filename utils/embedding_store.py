@@ -0,0 +1,147 @@
+# Compact on-disk format for word vectors: a float16/float32 matrix (vectors.npy) which is read through numpy.memmap,
+# the vocabulary (vocab.txt, one word per line separated by \n, line number = row of the matrix) and a small meta.json.
+
+import argparse
+import json
+import os
+from typing import *
+
+import numpy as np
+
+EMBEDDING_DIR: str = 'models/embeddings'
+STORE_DTYPES: Tuple[str, ...] = ('float16', 'float32')
+
+
+def get_store_dir(model_name: str, root: str = EMBEDDING_DIR) -> str:
+    """
+    :param model_name: string - name of the word vector model (e.g. glove-wiki-gigaword-50)
+    :param root: string - directory which contains all exported stores
+    :return: string - directory of the store of the model
+    """
+    return os.path.join(root, model_name)
+
+
+class EmbeddingStore:
+    def __init__(self, directory: str) -> None:
+        """
+        Read-only word -> vector lookup. Only the rows which are actually used are paged into memory.
+        :param directory: string - directory created by export_vectors
+        """
+        with open(os.path.join(directory, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.__meta: dict = json.load(f)
+        # newline='' keeps the lines exactly as written, a trailing \r comes from stores written in text mode on
+        # Windows (words never contain \r, see export_vectors)
+        with open(os.path.join(directory, 'vocab.txt'), 'r', encoding='utf-8', newline='') as f:
+            words: List[str] = [word[:-1] if word.endswith('\r') else word for word in f.read().split('\n')]
+        self.key_to_index: Dict[str, int] = {word: idx for idx, word in enumerate(words)}
+        self.vectors: np.memmap = np.load(os.path.join(directory, 'vectors.npy'), mmap_mode='r')
+        if self.vectors.shape != (len(words), self.__meta['dimensions']):
+            raise Exception(f'Embedding store {directory} is broken, vocab.txt and vectors.npy do not match.')
+
+    @staticmethod
+    def exists(directory: str) -> bool:
+        """
+        :param directory: string - directory of the store
+        :return: bool - True if a complete store exists in the directory, False if not
+        """
+        return all(os.path.isfile(os.path.join(directory, file)) for file in ['meta.json', 'vocab.txt', 'vectors.npy'])
+
+    def __getitem__(self, word: str) -> np.ndarray:
+        return np.asarray(self.vectors[self.key_to_index[word]], dtype=np.float32)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self.key_to_index
+
+    def __len__(self) -> int:
+        return len(self.key_to_index)
+
+    def get_dimensions(self) -> int:
+        return self.__meta['dimensions']
+
+    def get_model_name(self) -> str:
+        return self.__meta['model_name']
+
+
+def export_vectors(words: List[str], vectors: np.ndarray, directory: str, model_name: str,
+                   dtype: str = 'float16') -> None:
+    """
+    Writes word vectors into the compact store format
+    :param words: List[str] - vocabulary (words[i] belongs to vectors[i])
+    :param vectors: np.ndarray - matrix of shape (len(words), dimensions)
+    :param directory: string - target directory
+    :param model_name: string - name of the word vector model
+    :param dtype: string - 'float16' (half the size) or 'float32'
+    :return: None
+    """
+    if dtype not in STORE_DTYPES:
+        raise Exception(f'Unsupported dtype {dtype}. Possible values: {STORE_DTYPES}')
+    if len(words) != vectors.shape[0]:
+        raise Exception('The amount of words and vectors must be equal.')
+    if any('\n' in word or '\r' in word for word in words):
+        raise Exception('Words must not contain line breaks (\\n or \\r).')
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, 'vectors.npy'), np.asarray(vectors, dtype=dtype))
+    with open(os.path.join(directory, 'vocab.txt'), 'w', encoding='utf-8', newline='') as f:
+        f.write('\n'.join(words))
+    with open(os.path.join(directory, 'meta.json'), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({'model_name': model_name, 'dimensions': int(vectors.shape[1]), 'dtype': dtype,
+                            'count': len(words)}, indent=4))
+
+
+def read_word2vec_text(path: str) -> Tuple[List[str], np.ndarray]:
+    """
+    Reads vectors in the word2vec/GloVe text format ("word v1 v2 ..." per line, optional "count dimensions" header)
+    :param path: string - path to the text file
+    :return: Tuple[List[str], np.ndarray] - vocabulary and matrix
+    """
+    words: List[str] = []
+    rows: List[np.ndarray] = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_idx, line in enumerate(f):
+            parts: List[str] = line.rstrip().split(' ')
+            if line_idx == 0 and len(parts) == 2 and all(part.isdigit() for part in parts):
+                continue  # word2vec header
+            if len(parts) < 2:
+                continue
+            words.append(parts[0])
+            rows.append(np.array(parts[1:], dtype=np.float32))
+    if not rows:
+        raise Exception(f'No vectors found in {path}')
+    return words, np.stack(rows)
+
+
+def export_gensim_model(model_name: str, directory: str, dtype: str = 'float16') -> None:
+    """
+    Downloads/loads a model of the gensim catalog once and exports it into the compact store format
+    :param model_name: string - name of the model in the gensim catalog
+    :param directory: string - target directory
+    :param dtype: string - 'float16' or 'float32'
+    :return: None
+    """
+    import gensim.downloader as gensim_api  # only needed for the export
+
+    keyed_vectors = gensim_api.load(model_name)
+    export_vectors(list(keyed_vectors.index_to_key), keyed_vectors.vectors, directory, model_name, dtype)
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(
+        description='Export word vectors into the compact, memory-mapped format used by StringHelper')
+    parser.add_argument('--model', required=True, help='name of the model (e.g. glove-wiki-gigaword-50)')
+    parser.add_argument('--dtype', default='float16', choices=STORE_DTYPES)
+    parser.add_argument('--from-text', default=None,
+                        help='read the vectors from a word2vec/GloVe text file instead of the gensim catalog')
+    parser.add_argument('--root', default=EMBEDDING_DIR, help='directory which contains all exported stores')
+    args: argparse.Namespace = parser.parse_args()
+
+    directory: str = get_store_dir(args.model, args.root)
+    if args.from_text:
+        words, vectors = read_word2vec_text(args.from_text)
+        export_vectors(words, vectors, directory, args.model, args.dtype)
+    else:
+        export_gensim_model(args.model, directory, args.dtype)
+    print(f'Exported {args.model} to {directory}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# Featurized training data on disk, so repeated trainings (and hyper-parameter sweeps) don't have to tokenize, stem
+# and embed every sample again. Entries are keyed by the dataset hash, the embedding model name and max_token_length.
+
+import json
+import os
+import shutil
+from typing import *
+
+import numpy as np
+
+from utils.fingerprint import make_fingerprint
+
+FEATURE_CACHE_DIR: str = 'models/feature_cache'
+
+
+class ShardWriter:
+    def __init__(self, directory: str) -> None:
+        """
+        Writes features and labels as numbered .npy shards into a temporary directory. The shards only become visible
+        to FeatureCache after commit(), so an interrupted featurization never leaves a broken cache entry.
+        :param directory: string - final directory of the cache entry
+        """
+        self.__directory: str = directory
+        self.__tmp_directory: str = directory + '.tmp'
+        self.__shards: Dict[str, int] = {}
+        shutil.rmtree(self.__tmp_directory, ignore_errors=True)
+        os.makedirs(self.__tmp_directory)
+
+    def write(self, split: str, features: np.ndarray, labels: np.ndarray) -> None:
+        """
+        :param split: string - name of the split (e.g. 'train' or 'validation')
+        :param features: np.ndarray - features of the shard
+        :param labels: np.ndarray - labels of the shard
+        :return: None
+        """
+        shard_idx: int = self.__shards.get(split, 0)
+        np.save(os.path.join(self.__tmp_directory, f'{split}-{shard_idx:05d}-features.npy'), features)
+        np.save(os.path.join(self.__tmp_directory, f'{split}-{shard_idx:05d}-labels.npy'), labels)
+        self.__shards[split] = shard_idx + 1
+
+    def commit(self) -> None:
+        """
+        Makes the written shards available
+        :return: None
+        """
+        with open(os.path.join(self.__tmp_directory, 'manifest.json'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'shards': self.__shards}, indent=4))
+        shutil.rmtree(self.__directory, ignore_errors=True)
+        os.replace(self.__tmp_directory, self.__directory)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.__tmp_directory, ignore_errors=True)
+
+
+class FeatureCache:
+    def __init__(self, cache_dir: str = FEATURE_CACHE_DIR) -> None:
+        """
+        :param cache_dir: string - directory of all cache entries
+        """
+        self.__cache_dir: str = cache_dir
+
+    @staticmethod
+    def get_key(dataset_hash: str, model_name: str, max_token_length: int) -> str:
+        """
+        :param dataset_hash: string - hash of the dataset(s) the features are built from
+        :param model_name: string - name of the embedding model
+        :param max_token_length: int - maximum token length of the features
+        :return: string - key of the cache entry
+        """
+        return make_fingerprint(dataset_hash=dataset_hash, model_name=model_name, max_token_length=max_token_length)
+
+    def load_arrays(self, key: str) -> Union[Tuple[np.ndarray, np.ndarray], None]:
+        """
+        :param key: string - key of the cache entry
+        :return: Tuple[np.ndarray, np.ndarray] - features and labels or None if nothing is cached
+        """
+        path: str = os.path.join(self.__cache_dir, f'{key}.npz')
+        if not os.path.isfile(path):
+            return None
+        with np.load(path) as cached:
+            return cached['features'], cached['labels']
+
+    def save_arrays(self, key: str, features: np.ndarray, labels: np.ndarray) -> None:
+        """
+        Stores small datasets (e.g. the intent dataset) as a single .npz file
+        :param key: string - key of the cache entry
+        :param features: np.ndarray - featurized samples
+        :param labels: np.ndarray - labels of the samples
+        :return: None
+        """
+        os.makedirs(self.__cache_dir, exist_ok=True)
+        tmp_path: str = os.path.join(self.__cache_dir, f'{key}.tmp.npz')
+        np.savez(tmp_path, features=features, labels=labels)
+        os.replace(tmp_path, os.path.join(self.__cache_dir, f'{key}.npz'))
+
+    def has_shards(self, key: str) -> bool:
+        """
+        :param key: string - key of the cache entry
+        :return: bool - True if a complete sharded entry exists, False if not
+        """
+        return os.path.isfile(os.path.join(self.__cache_dir, key, 'manifest.json'))
+
+    def create_shard_writer(self, key: str) -> ShardWriter:
+        """
+        Stores big datasets (e.g. the ITF datasets) as shards, which can be memory-mapped one by one
+        :param key: string - key of the cache entry
+        :return: ShardWriter
+        """
+        return ShardWriter(os.path.join(self.__cache_dir, key))
+
+    def get_shard_paths(self, key: str, split: str) -> List[Tuple[str, str]]:
+        """
+        :param key: string - key of the cache entry
+        :param split: string - name of the split
+        :return: List[Tuple[str, str]] - paths of the features and labels file of every shard
+        """
+        directory: str = os.path.join(self.__cache_dir, key)
+        with open(os.path.join(directory, 'manifest.json'), 'r', encoding='utf-8') as f:
+            shards: int = json.load(f)['shards'].get(split, 0)
+        return [(os.path.join(directory, f'{split}-{idx:05d}-features.npy'),
+                 os.path.join(directory, f'{split}-{idx:05d}-labels.npy')) for idx in range(shards)]
+
+    @staticmethod
+    def load_shard(paths: Tuple[str, str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        :param paths: Tuple[str, str] - paths of the features and labels file of the shard
+        :return: Tuple[np.ndarray, np.ndarray] - memory-mapped features and labels
+        """
+        return np.load(paths[0], mmap_mode='r'), np.load(paths[1], mmap_mode='r')
@@ -0,0 +1,57 @@
+import hashlib
+import json
+from typing import *
+
+
+def hash_json(data: Any) -> str:
+    """
+    Hashes JSON serializable data independent of key order and formatting of the source file
+    :param data: Any - JSON serializable data (e.g. a loaded dataset)
+    :return: string - sha256 hex digest
+    """
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def make_fingerprint(**parts: Any) -> str:
+    """
+    Combines everything a trained artifact depends on into a single hash
+    :param parts: Any - JSON serializable values (e.g. dataset_hash=..., model_name=..., max_token_length=...)
+    :return: string - sha256 hex digest
+    """
+    return hash_json(parts)
+
+
+def read_fingerprint(path: str) -> Union[dict, None]:
+    """
+    :param path: string - path to the fingerprint file
+    :return: dict - content of the fingerprint file or None if it doesn't exist or is broken
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_fingerprint(path: str, data: dict) -> None:
+    """
+    :param path: string - path to the fingerprint file
+    :param data: dict - must contain the key 'fingerprint'
+    :return: None
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=4, ensure_ascii=False))
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """
+    Hashes the content of a file without loading it into memory as a whole
+    :param path: string - path to the file
+    :param block_size: int - how many bytes are read at once
+    :return: string - sha256 hex digest
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
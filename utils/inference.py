@@ -0,0 +1,115 @@
+import logging
+from typing import *
+
+import numpy as np
+
+from utils.numpy_engine import NumpyModel
+
+INFERENCE_MODES: Tuple[str, ...] = ('predict', 'compiled', 'numpy')
+
+
+def load_keras() -> Any:
+    """
+    Imports Keras on first use (importing TensorFlow takes seconds and a lot of memory, so only training and the Keras
+    inference modes should pay for it). Mixed precision is only enabled if there is a GPU, on CPUs float16 is
+    emulated and makes training and inference slower.
+    :return: module - tensorflow.keras
+    """
+    import tensorflow as tf
+    from tensorflow import keras
+    if tf.config.list_physical_devices('GPU'):
+        keras.mixed_precision.set_global_policy('mixed_float16')
+    return keras
+
+
+class PredictRunner:
+    def __init__(self, model: Any) -> None:
+        """
+        Runs inference through keras.Model.predict (data adapter, callbacks, ...)
+        :param model: keras.Model - loaded model
+        """
+        self.__model: Any = model
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - model output of shape (n, outputs)
+        """
+        return self.__model.predict(batch)
+
+    def warm_up(self) -> None:
+        pass
+
+
+class CompiledRunner:
+    def __init__(self, model: Any, max_token_length: int, dimensions: int) -> None:
+        """
+        Calls the model directly inside a traced tf.function with a fixed input signature, so a single sentence does
+        not go through the whole Model.predict machinery and the graph is traced only once.
+        :param model: keras.Model - loaded model
+        :param max_token_length: int - maximum token length the model was built for
+        :param dimensions: int - dimensions of the word vectors
+        """
+        import tensorflow as tf  # import locally, so the NumPy-only paths never have to load TensorFlow
+
+        self.__tf: Any = tf
+        self.__max_token_length: int = max_token_length
+        self.__dimensions: int = dimensions
+        self.__fn: Callable = tf.function(
+            lambda x: model(x, training=False),
+            input_signature=[tf.TensorSpec(shape=(None, max_token_length, dimensions), dtype=tf.float32)])
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - model output of shape (n, outputs)
+        """
+        result = self.__fn(self.__tf.convert_to_tensor(batch, dtype=self.__tf.float32))
+        return np.asarray(result, dtype=np.float32)
+
+    def warm_up(self) -> None:
+        """
+        Traces the function once, so the first real request doesn't pay for it
+        :return: None
+        """
+        self(np.zeros((1, self.__max_token_length, self.__dimensions), dtype=np.float32))
+
+
+class NumpyRunner:
+    def __init__(self, model: NumpyModel) -> None:
+        """
+        Runs inference with the NumPy engine, which doesn't need TensorFlow
+        :param model: NumpyModel - exported model
+        """
+        self.__model: NumpyModel = model
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - model output of shape (n, outputs)
+        """
+        return self.__model(batch)
+
+    def warm_up(self) -> None:
+        pass
+
+
+def create_runner(model: Any, mode: Union[str, None], max_token_length: int,
+                  dimensions: int) -> Union[PredictRunner, CompiledRunner, NumpyRunner]:
+    """
+    :param model: keras.Model | NumpyModel - loaded model (an exported NumpyModel can only run in 'numpy' mode)
+    :param mode: string - one of INFERENCE_MODES (None falls back to 'predict')
+    :param max_token_length: int - maximum token length the model was built for
+    :param dimensions: int - dimensions of the word vectors
+    :return: runner which can be called with an input tensor and returns the model output
+    """
+    if mode == 'numpy':
+        return NumpyRunner(model if isinstance(model, NumpyModel) else NumpyModel.from_keras(model))
+    if isinstance(model, NumpyModel):
+        raise Exception(f'The NumPy export of a model can only run in inference_mode numpy, not {mode}.')
+    if mode is None or mode == 'predict':
+        return PredictRunner(model)
+    if mode == 'compiled':
+        return CompiledRunner(model, max_token_length, dimensions)
+    logging.warning(f'Unknown inference_mode {mode}, falling back to predict. Possible values: {INFERENCE_MODES}')
+    return PredictRunner(model)
@@ -0,0 +1,162 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import *
+
+from utils.config_helper import ConfigHelper
+
+
+@dataclass
+class SchedulerMetrics:
+    queue_depth: int
+    max_queue_depth: int
+    submitted: int
+    batches: int
+    average_batch_size: float
+
+
+class InferenceScheduler:
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]], max_batch_size: int = 16,
+                 max_delay_ms: float = 5.0, name: str = 'inference-scheduler') -> None:
+        """
+        Collects single requests from many threads and runs them as one batch through batch_fn.
+        :param batch_fn: Callable - function which takes a list of items and returns one result per item
+        :param max_batch_size: int - maximum amount of items per batch
+        :param max_delay_ms: float - maximum time the oldest request waits for further requests to join its batch
+        :param name: string - name of the worker thread (shows up in logs)
+        """
+        if max_batch_size < 1:
+            raise Exception('max_batch_size of the inference scheduler must be at least 1.')
+        self.__batch_fn: Callable[[List[Any]], List[Any]] = batch_fn
+        self.__max_batch_size: int = max_batch_size
+        self.__max_delay: float = max(max_delay_ms, 0) / 1000
+        self.__name: str = name
+
+        self.__queue: Deque[Tuple[Any, Future, float]] = deque()
+        self.__condition: threading.Condition = threading.Condition()
+        self.__stopped: bool = False
+
+        self.__max_queue_depth: int = 0
+        self.__submitted: int = 0
+        self.__batches: int = 0
+        self.__batched_items: int = 0
+
+        self.__worker: threading.Thread = threading.Thread(target=self.__run, name=name, daemon=True)
+        self.__worker.start()
+
+    @staticmethod
+    def from_config(config_helper: ConfigHelper, batch_fn: Callable[[List[Any]], List[Any]],
+                    name: str = 'inference-scheduler') -> Union['InferenceScheduler', None]:
+        """
+        Creates a scheduler with the latency/throughput settings of config.json
+        :param config_helper: ConfigHelper instance
+        :param batch_fn: Callable - function which takes a list of items and returns one result per item
+        :param name: string - name of the worker thread
+        :return: InferenceScheduler or None if inference_batching is disabled in config.json
+        """
+        if not config_helper.get_config_setting('inference_batching'):
+            return None
+        max_batch_size: Union[int, None] = config_helper.get_config_setting('inference_batch_max_size')
+        max_delay_ms: Union[float, None] = config_helper.get_config_setting('inference_batch_max_delay_ms')
+        return InferenceScheduler(batch_fn,
+                                  max_batch_size=max_batch_size if max_batch_size is not None else 16,
+                                  max_delay_ms=max_delay_ms if max_delay_ms is not None else 5.0,
+                                  name=name)
+
+    def submit(self, item: Any) -> Future:
+        """
+        Queues an item for the next batch
+        :param item: Any - item passed to batch_fn
+        :return: Future - resolves with the result of the item (or its exception)
+        """
+        future: Future = Future()
+        with self.__condition:
+            if self.__stopped:
+                raise Exception(f'Inference scheduler {self.__name} is already stopped.')
+            self.__queue.append((item, future, time.monotonic()))
+            self.__submitted += 1
+            self.__max_queue_depth = max(self.__max_queue_depth, len(self.__queue))
+            self.__condition.notify()
+        return future
+
+    def run(self, item: Any) -> Any:
+        """
+        Queues an item and blocks until its batch was processed
+        :param item: Any - item passed to batch_fn
+        :return: Any - result of the item
+        """
+        return self.submit(item).result()
+
+    def get_metrics(self) -> SchedulerMetrics:
+        """
+        :return: SchedulerMetrics - current queue depth and batch statistics
+        """
+        with self.__condition:
+            return SchedulerMetrics(queue_depth=len(self.__queue),
+                                    max_queue_depth=self.__max_queue_depth,
+                                    submitted=self.__submitted,
+                                    batches=self.__batches,
+                                    average_batch_size=self.__batched_items / self.__batches if self.__batches else 0.0)
+
+    def stop(self) -> None:
+        """
+        Processes all queued items and stops the worker thread
+        :return: None
+        """
+        with self.__condition:
+            self.__stopped = True
+            self.__condition.notify()
+        self.__worker.join()
+
+    def __collect_batch(self) -> List[Tuple[Any, Future, float]]:
+        with self.__condition:
+            while not self.__queue and not self.__stopped:
+                self.__condition.wait()
+            if not self.__queue:
+                return []
+            # the oldest request decides how long we are allowed to wait for more requests
+            deadline: float = self.__queue[0][2] + self.__max_delay
+            while len(self.__queue) < self.__max_batch_size and not self.__stopped:
+                remaining: float = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.__condition.wait(remaining)
+            batch_size: int = min(len(self.__queue), self.__max_batch_size)
+            return [self.__queue.popleft() for _ in range(batch_size)]
+
+    def __run(self) -> None:
+        while True:
+            batch: List[Tuple[Any, Future, float]] = self.__collect_batch()
+            if not batch:
+                return
+            batch = [request for request in batch if request[1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            with self.__condition:
+                self.__batches += 1
+                self.__batched_items += len(batch)
+            self.__process(batch)
+
+    def __process(self, batch: List[Tuple[Any, Future, float]]) -> None:
+        try:
+            results: List[Any] = self.__batch_fn([request[0] for request in batch])
+        except Exception as e:
+            if len(batch) == 1:
+                batch[0][1].set_exception(e)
+                return
+            # One bad item (e.g. a sentence that is too long) must not fail the whole batch, so we retry one by one
+            logging.warning(['[InferenceScheduler -> process]', self.__name, 'Batch failed, retrying items alone', e])
+            for request in batch:
+                self.__process_single(request)
+            return
+        for request, result in zip(batch, results):
+            request[1].set_result(result)
+
+    def __process_single(self, request: Tuple[Any, Future, float]) -> None:
+        try:
+            request[1].set_result(self.__batch_fn([request[0]])[0])
+        except Exception as e:
+            request[1].set_exception(e)
@@ -0,0 +1,335 @@
+# Models behind the Classifier. Every backend gets the same featurized input of shape
+# (n, max_token_length, dimensions) and returns class probabilities of shape (n, classes), so the Classifier (feature
+# cache, pattern matcher, scheduler, ...) doesn't have to know which one it talks to.
+
+import logging
+import os
+from typing import *
+
+import numpy as np
+
+from utils.inference import create_runner, load_keras
+from utils.numpy_engine import NumpyModel, check_quantization, export_model, get_export_path, is_export_current
+
+INTENT_BACKENDS: Tuple[str, ...] = ('lstm', 'centroid')
+PRETRAINED_DIR: str = 'models/pretrained'
+
+
+class LSTMBackend:
+    SUPPORTS_INCREMENTAL: bool = True
+
+    def __init__(self, model_name: str, max_token_length: int, dimensions: int, directory: str = PRETRAINED_DIR,
+                 inference_mode: Union[str, None] = None, quantization: Union[str, None] = None,
+                 keep_quantized: bool = False) -> None:
+        """
+        Stacked LSTM trained with Keras. In inference_mode numpy the NumPy export of the model is loaded instead, so
+        TensorFlow is only imported for training.
+        :param model_name: string - name of the embedding model
+        :param max_token_length: int - maximum token length
+        :param dimensions: int - dimensions of the word vectors
+        :param directory: string - directory of the saved model
+        :param inference_mode: string - one of utils.inference.INFERENCE_MODES
+        :param quantization: string - weights of the NumPy export (None, 'float16' or 'int8')
+        :param keep_quantized: bool - keep the quantized weights quantized in memory (see NumpyModel)
+        """
+        self.__max_token_length: int = max_token_length
+        self.__dimensions: int = dimensions
+        self.__inference_mode: Union[str, None] = inference_mode
+        self.__model: Union[Any, NumpyModel, None] = None  # keras.Sequential or its NumPy export
+        self.__runner: Union[Callable[[np.ndarray], np.ndarray], None] = None
+        self.__directory: str = directory
+        self.__model_file: str = os.path.join(directory, f'intent_detector_{model_name}.h5')
+        self.__quantization: Union[str, None] = check_quantization(quantization)
+        self.__keep_quantized: bool = keep_quantized
+        self.__export_file: str = get_export_path(self.__model_file, self.__quantization)
+        self.__fingerprint_file: str = os.path.join(directory, f'intent_detector_{model_name}.json')
+
+    def get_fingerprint_file(self) -> str:
+        return self.__fingerprint_file
+
+    def load(self) -> bool:
+        """
+        :return: bool - True if a saved model was loaded, False if none exists
+        """
+        self.__runner = None
+        if self.__inference_mode == 'numpy' and is_export_current(self.__model_file, self.__export_file):
+            self.__model = NumpyModel.load(self.__export_file, self.__keep_quantized)
+            return True
+        if not os.path.exists(self.__model_file):
+            return False
+        self.__model = load_keras().models.load_model(self.__model_file)
+        if self.__inference_mode == 'numpy':
+            # the next start doesn't need TensorFlow anymore
+            export_model(self.__model, self.__export_file, self.__quantization)
+        return True
+
+    def __ensure_keras_model(self) -> None:
+        """
+        Training needs the Keras model, so an exported model is replaced by the saved Keras model
+        :return: None
+        """
+        if isinstance(self.__model, NumpyModel):
+            self.__model = load_keras().models.load_model(self.__model_file)
+            self.__runner = None
+
+    def is_usable(self) -> bool:
+        return self.__model is not None
+
+    def get_num_classes(self) -> Union[int, None]:
+        """
+        :return: int - size of the softmax head (None if no model is loaded)
+        """
+        return None if self.__model is None else self.__model.output_shape[-1]
+
+    def reset(self) -> None:
+        self.__model = None
+        self.__runner = None
+
+    def fit(self, features: np.ndarray, labels: np.ndarray, num_classes: int, epochs: int, batch_size: int) -> None:
+        """
+        Trains the model (Note that training continues on the loaded model if there is one)
+        :param features: np.ndarray - featurized samples of shape (n, max_token_length, dimensions)
+        :param labels: np.ndarray - class index of every sample
+        :param num_classes: int - amount of intents
+        :param epochs: int - number of epochs
+        :param batch_size: int - how many samples to train on at once
+        :return: None
+        """
+        keras = load_keras()
+        self.__ensure_keras_model()
+        if self.__model is None:
+            self.__model = keras.Sequential([
+                keras.layers.LSTM(128 * 2, input_shape=(self.__max_token_length, self.__dimensions),
+                                  return_sequences=True),
+                keras.layers.Dropout(0.2),
+                keras.layers.LSTM(128 * 2),
+                keras.layers.Dropout(0.2),
+                keras.layers.Dense(num_classes, activation='softmax')
+            ])
+            self.__model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+        self.__runner = None
+        self.__model.fit(features, labels, epochs=epochs, batch_size=batch_size)
+
+    def fine_tune(self, features: np.ndarray, labels: np.ndarray, old_tags: List[str], tags: List[str], epochs: int,
+                  batch_size: int) -> None:
+        """
+        Grows the softmax head for new tags and continues training on the given samples
+        :param features: np.ndarray - new and replayed samples
+        :param labels: np.ndarray - class index of every sample
+        :param old_tags: List[str] - tags in the order of the loaded model
+        :param tags: List[str] - tags in the order of the current dataset
+        :param epochs: int - number of epochs
+        :param batch_size: int - how many samples to train on at once
+        :return: None
+        """
+        self.__ensure_keras_model()
+        if tags != old_tags:
+            self.__grow_head(old_tags, tags)
+        if len(features):
+            self.__model.fit(features, labels, epochs=epochs, batch_size=batch_size)
+
+    def __grow_head(self, old_tags: List[str], tags: List[str]) -> None:
+        """
+        Replaces the Dense softmax layer with a bigger one. Known tags keep their trained weights (moved to their new
+        class index), new tags start with freshly initialized weights.
+        :param old_tags: List[str] - tags in the order of the old output layer
+        :param tags: List[str] - tags in the order of the current dataset
+        :return: None
+        """
+        keras = load_keras()
+        old_head = self.__model.layers[-1]
+        old_kernel, old_bias = old_head.get_weights()
+
+        new_head = keras.layers.Dense(len(tags), activation='softmax')
+        model = keras.Sequential(self.__model.layers[:-1] + [new_head])
+        model.build((None, self.__max_token_length, self.__dimensions))
+
+        kernel, bias = new_head.get_weights()
+        for idx, tag in enumerate(tags):
+            if tag in old_tags:
+                kernel[:, idx] = old_kernel[:, old_tags.index(tag)]
+                bias[idx] = old_bias[old_tags.index(tag)]
+        new_head.set_weights([kernel, bias])
+
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+        self.__model = model
+        self.__runner = None
+
+    def set_inference_mode(self, mode: str) -> None:
+        """
+        :param mode: string - 'predict' (keras.Model.predict), 'compiled' (traced tf.function) or 'numpy' (NumPy
+                     engine)
+        :return: None
+        """
+        if isinstance(self.__model, NumpyModel) and mode != 'numpy':
+            self.__ensure_keras_model()
+        self.__inference_mode = mode
+        self.__runner = None
+
+    def __get_runner(self) -> Callable[[np.ndarray], np.ndarray]:
+        if self.__runner is None:
+            self.__runner = create_runner(self.__model, self.__inference_mode, self.__max_token_length,
+                                          self.__dimensions)
+        return self.__runner
+
+    def warm_up(self) -> None:
+        """
+        Builds the inference runner and runs it once, so the first message doesn't pay for tracing
+        :return: None
+        """
+        if self.__model is not None:
+            self.__get_runner().warm_up()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - class probabilities of shape (n, classes)
+        """
+        return self.__get_runner()(batch)
+
+    def save(self) -> None:
+        os.makedirs(self.__directory, exist_ok=True)
+        self.__model.save(self.__model_file)
+        export_model(self.__model, self.__export_file, self.__quantization)
+
+
+class CentroidBackend:
+    # computing the centroids of the whole dataset is cheaper than anything incremental
+    SUPPORTS_INCREMENTAL: bool = False
+    # candidates for the softmax temperature, the one with the lowest training loss is used
+    TEMPERATURES: Tuple[float, ...] = (1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0)
+
+    def __init__(self, model_name: str, max_token_length: int, dimensions: int, directory: str = PRETRAINED_DIR,
+                 inference_mode: Union[str, None] = None, quantization: Union[str, None] = None) -> None:
+        """
+        Cosine nearest-centroid classifier over mean-pooled word vectors. It only needs NumPy, trains in
+        milliseconds and the saved model is a few kilobytes.
+        :param model_name: string - name of the embedding model
+        :param max_token_length: int - maximum token length
+        :param dimensions: int - dimensions of the word vectors
+        :param directory: string - directory of the saved model
+        :param inference_mode: string - ignored, there is only one way to run this backend
+        :param quantization: string - ignored, the centroids are small enough
+        """
+        self.__dimensions: int = dimensions
+        self.__centroids: Union[np.ndarray, None] = None
+        self.__temperature: float = 1.0
+        self.__directory: str = directory
+        self.__model_file: str = os.path.join(directory, f'intent_centroids_{model_name}.npz')
+        self.__fingerprint_file: str = os.path.join(directory, f'intent_centroids_{model_name}.json')
+
+    def get_fingerprint_file(self) -> str:
+        return self.__fingerprint_file
+
+    def load(self) -> bool:
+        """
+        :return: bool - True if a saved model was loaded, False if none exists
+        """
+        if not os.path.exists(self.__model_file):
+            return False
+        with np.load(self.__model_file) as saved:
+            self.__centroids = saved['centroids']
+            self.__temperature = float(saved['temperature'])
+        return True
+
+    def is_usable(self) -> bool:
+        return self.__centroids is not None
+
+    def get_num_classes(self) -> Union[int, None]:
+        """
+        :return: int - amount of centroids (None if no model is loaded)
+        """
+        return None if self.__centroids is None else self.__centroids.shape[0]
+
+    def reset(self) -> None:
+        self.__centroids = None
+
+    @staticmethod
+    def pool(features: np.ndarray) -> np.ndarray:
+        """
+        :param features: np.ndarray - featurized samples of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - L2 normalized mean of the non-padding word vectors of every sample, shape (n, dimensions)
+        """
+        mask: np.ndarray = np.any(features != 0, axis=2)
+        counts: np.ndarray = np.maximum(mask.sum(axis=1, keepdims=True), 1)
+        pooled: np.ndarray = features.sum(axis=1, dtype=np.float32) / counts
+        return pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-8)
+
+    @staticmethod
+    def __softmax(logits: np.ndarray) -> np.ndarray:
+        logits = logits - logits.max(axis=1, keepdims=True)
+        exp: np.ndarray = np.exp(logits)
+        return exp / exp.sum(axis=1, keepdims=True)
+
+    def fit(self, features: np.ndarray, labels: np.ndarray, num_classes: int, epochs: int, batch_size: int) -> None:
+        """
+        Computes one centroid per intent and picks the softmax temperature which fits the training data best
+        :param features: np.ndarray - featurized samples of shape (n, max_token_length, dimensions)
+        :param labels: np.ndarray - class index of every sample
+        :param num_classes: int - amount of intents
+        :param epochs: int - ignored
+        :param batch_size: int - ignored
+        :return: None
+        """
+        pooled: np.ndarray = self.pool(np.asarray(features, dtype=np.float32))
+        labels = np.asarray(labels, dtype=np.int64)
+        centroids: np.ndarray = np.zeros((num_classes, self.__dimensions), dtype=np.float32)
+        np.add.at(centroids, labels, pooled)
+        self.__centroids = centroids / np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-8)
+
+        similarities: np.ndarray = pooled @ self.__centroids.T
+        losses: List[float] = [
+            float(-np.mean(np.log(self.__softmax(similarities * temperature)[np.arange(len(labels)), labels] + 1e-12)))
+            for temperature in self.TEMPERATURES]
+        self.__temperature = self.TEMPERATURES[int(np.argmin(losses))]
+        logging.info(f'Intent centroids trained on {len(labels)} patterns (temperature {self.__temperature})')
+
+    def fine_tune(self, features: np.ndarray, labels: np.ndarray, old_tags: List[str], tags: List[str], epochs: int,
+                  batch_size: int) -> None:
+        raise Exception('The centroid backend has to be trained on the whole dataset, please call fit() instead.')
+
+    def set_inference_mode(self, mode: str) -> None:
+        pass
+
+    def warm_up(self) -> None:
+        pass
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - class probabilities of shape (n, classes)
+        """
+        return self.__softmax((self.pool(batch) @ self.__centroids.T) * self.__temperature)
+
+    def save(self) -> None:
+        os.makedirs(self.__directory, exist_ok=True)
+        tmp_file: str = self.__model_file + '.tmp.npz'
+        np.savez(tmp_file, centroids=self.__centroids, temperature=np.float32(self.__temperature))
+        os.replace(tmp_file, self.__model_file)
+
+
+IntentBackend = Union[LSTMBackend, CentroidBackend]
+
+
+def create_backend(name: Union[str, None], model_name: str, max_token_length: int, dimensions: int,
+                   directory: str = PRETRAINED_DIR, inference_mode: Union[str, None] = None,
+                   quantization: Union[str, None] = None, keep_quantized: bool = False) -> IntentBackend:
+    """
+    :param name: string - one of INTENT_BACKENDS (None falls back to 'lstm')
+    :param model_name: string - name of the embedding model
+    :param max_token_length: int - maximum token length
+    :param dimensions: int - dimensions of the word vectors
+    :param directory: string - directory of the saved model
+    :param inference_mode: string - one of utils.inference.INFERENCE_MODES (only used by the LSTM)
+    :param quantization: string - weights of the NumPy export (None, 'float16' or 'int8', only used by the LSTM)
+    :param keep_quantized: bool - keep the quantized weights quantized in memory (only used by the LSTM)
+    :return: IntentBackend
+    """
+    if name is None or name == 'lstm':
+        return LSTMBackend(model_name, max_token_length, dimensions, directory, inference_mode, quantization,
+                           keep_quantized)
+    if name == 'centroid':
+        return CentroidBackend(model_name, max_token_length, dimensions, directory, inference_mode, quantization)
+    logging.warning(f'Unknown intent_backend {name}, falling back to lstm. Possible values: {INTENT_BACKENDS}')
+    return LSTMBackend(model_name, max_token_length, dimensions, directory, inference_mode, quantization,
+                       keep_quantized)
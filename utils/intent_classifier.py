@@ -1,11 +1,17 @@
-from utils.string_helper import StringHelper
+from utils.string_helper import StringHelper, FeaturizedMessage
 from utils.config_helper import ConfigHelper
-from tensorflow import keras
+from utils.inference_scheduler import InferenceScheduler
+from utils.intent_backends import IntentBackend, create_backend
+from utils.feature_cache import FeatureCache
+from utils.pattern_matcher import PatternMatcher, PatternMatch, PatternMatcherStats
+from utils.fingerprint import hash_json, make_fingerprint, read_fingerprint, write_fingerprint
 import numpy as np
 import json
 from typing import *
 from dataclasses import dataclass
-import os
+import time
+import random
+import logging
 
 
 # os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
@@ -25,12 +31,26 @@ class Intent:
     error_str: str
 
 
+@dataclass(frozen=True)
+class IntentRecord:
+    # One intent of the dataset, compiled once at load time
+    __slots__ = ('idx', 'tag', 'action', 'patterns', 'responses', 'error_msg')
+    idx: int
+    tag: str
+    action: Optional[str]
+    patterns: Tuple[str, ...]
+    responses: Optional[Tuple[str, ...]]
+    error_msg: Optional[str]
+
+
 class Classifier:
     def __init__(self, config_helper: ConfigHelper, str_helper: StringHelper, intent_path: str,
-                 use_pretrained: bool = False) -> None:
+                 use_pretrained: bool = False, backend: Union[IntentBackend, None] = None) -> None:
         """
         :param str_helper: StringHelper instance
         :param intent_path: string - path to the intent dataset
+        :param backend: IntentBackend - already created (and loaded) backend, e.g. deserialized while the word vectors
+                        were loading (see load_backend)
         """
         with open(intent_path, 'r', encoding='utf-8') as f:
             self.__dataset: dict = json.load(f)
@@ -39,15 +59,65 @@ class Classifier:
             raise Exception('max_token_length is not set in config.json or is not an integer.')
 
         self.__str_helper: StringHelper = str_helper
-        self.__intent_detector: Union[keras.Sequential, None] = None
-        self.__model_file: str = f'models/pretrained/intent_detector_{str_helper.get_model_name()}.h5'
+        self.__scheduler: Union[InferenceScheduler, None] = None
+        self.__feature_cache: Union[FeatureCache, None] = \
+            FeatureCache() if config_helper.get_config_setting('feature_cache') else None
+        self.__backend: IntentBackend = backend if backend is not None else \
+            self.load_backend(config_helper, str_helper.get_model_name(), str_helper.get_dimensions(), use_pretrained)
+        # the fingerprint is stored next to the model and tells us on which dataset the model was trained
+        self.__fingerprint_file: str = self.__backend.get_fingerprint_file()
+        self.__intents: List[IntentRecord] = []
+        self.__intents_by_tag: Dict[str, IntentRecord] = {}
+        self.__intents_by_action: Dict[Optional[str], IntentRecord] = {}
+        self.__compile_dataset()
 
-        if use_pretrained and os.path.exists(self.__model_file):
-            self.__intent_detector = keras.models.load_model(self.__model_file)
-        self.__tags: dict = {}
+        self.__pattern_matcher: Union[PatternMatcher, None] = None
+        if config_helper.get_config_setting('pattern_matcher'):
+            threshold: Union[float, None] = config_helper.get_config_setting('pattern_matcher_threshold')
+            self.__pattern_matcher = PatternMatcher([(pattern, intent.idx) for intent in self.__intents
+                                                     for pattern in intent.patterns],
+                                                    threshold=threshold if threshold is not None else 0.9)
+
+    @staticmethod
+    def load_backend(config_helper: ConfigHelper, model_name: str, dimensions: int,
+                     use_pretrained: bool = True) -> IntentBackend:
+        """
+        Creates the intent backend configured in config.json ('lstm' (Keras) or 'centroid' (NumPy only), see
+        utils/intent_backends.py). It only needs the name and dimensions of the word vector model, not its vectors.
+        :param config_helper: ConfigHelper instance
+        :param model_name: string - name of the word vector model
+        :param dimensions: int - dimensions of the word vectors
+        :param use_pretrained: bool - whether to load the saved model
+        :return: IntentBackend
+        """
+        backend: IntentBackend = create_backend(config_helper.get_config_setting('intent_backend'), model_name,
+                                                config_helper.get_config_setting('max_token_length'), dimensions,
+                                                inference_mode=config_helper.get_config_setting('inference_mode'),
+                                                quantization=config_helper.get_config_setting('model_quantization'),
+                                                keep_quantized=bool(
+                                                    config_helper.get_config_setting('model_keep_quantized')))
+        if use_pretrained:
+            backend.load()
+        return backend
+
+    def __compile_dataset(self) -> None:
+        """
+        Builds the intent records and the indices by class index, tag and action, so all lookups are O(1)
+        :return: None
+        """
+        self.__intents = []
+        self.__intents_by_tag = {}
+        self.__intents_by_action = {}
         for idx, intent in enumerate(self.__dataset['intents']):
-            tag: str = intent['tag']
-            self.__tags[idx] = tag
+            responses: Optional[list] = intent.get('responses')
+            record: IntentRecord = IntentRecord(idx=idx, tag=intent['tag'], action=intent.get('action'),
+                                                patterns=tuple(intent.get('patterns', [])),
+                                                responses=None if responses is None else tuple(responses),
+                                                error_msg=intent.get('error_msg'))
+            self.__intents.append(record)
+            # the first intent wins, just like a linear search would do
+            self.__intents_by_tag.setdefault(record.tag, record)
+            self.__intents_by_action.setdefault(record.action, record)
 
     def tag_exists(self, tag: str) -> bool:
         """
@@ -55,10 +125,7 @@ class Classifier:
         :param tag: string - tag to check
         :return: bool - True if tag exists, False if not
         """
-        for intent in self.__dataset['intents']:
-            if intent['tag'] == tag:
-                return True
-        return False
+        return tag in self.__intents_by_tag
 
     def action_exists(self, action: str) -> bool:
         """
@@ -66,47 +133,156 @@ class Classifier:
         :param action: string - action to check
         :return: bool - True if action exists, False if not
         """
-        for intent in self.__dataset['intents']:
-            if intent['action'] == action:
-                return True
-        return False
+        return action in self.__intents_by_action
 
     def get_intent_by_action(self, action: str) -> Union[Intent, None]:
-        for intent in self.__dataset['intents']:
-            if intent['action'] == action:
-                return Intent(intent['responses'][0], intent['error_msg'])
-        return None
+        intent: Union[IntentRecord, None] = self.__intents_by_action.get(action)
+        if intent is None:
+            return None
+        return Intent(intent.responses[0], intent.error_msg)
+
+    def get_intent_by_tag(self, tag: str) -> Union[IntentRecord, None]:
+        """
+        :param tag: string - tag of the intent
+        :return: IntentRecord or None if the tag doesn't exist
+        """
+        return self.__intents_by_tag.get(tag)
+
+    def set_scheduler(self, scheduler: Union[InferenceScheduler, None]) -> None:
+        """
+        Routes classify() through a micro-batching scheduler, so concurrent calls share one forward pass
+        :param scheduler: InferenceScheduler - scheduler running classify_batch (None to run every call directly)
+        :return: None
+        """
+        self.__scheduler = scheduler
+
+    def set_inference_mode(self, mode: str) -> None:
+        """
+        :param mode: string - 'predict' (keras.Model.predict), 'compiled' (traced tf.function) or 'numpy' (NumPy
+                     engine), only used by the LSTM backend
+        :return: None
+        """
+        self.__backend.set_inference_mode(mode)
+
+    def warm_up(self) -> None:
+        """
+        Builds the inference runner and runs it once, so the first message doesn't pay for tracing
+        :return: None
+        """
+        self.__backend.warm_up()
 
     def is_usable(self) -> bool:
-        return self.__intent_detector is not None
+        return self.__backend.is_usable()
+
+    def get_fingerprint(self) -> str:
+        """
+        :return: string - hash of the intent dataset, the embedding model name and max_token_length
+        """
+        return make_fingerprint(dataset_hash=hash_json(self.__dataset),
+                                model_name=self.__str_helper.get_model_name(),
+                                max_token_length=self.__max_token_lengths)
+
+    def is_up_to_date(self) -> bool:
+        """
+        Checks if the saved model was trained on the current dataset, embedding model and max_token_length
+        :return: bool - True if no retraining is needed, False if not
+        """
+        if not self.__backend.is_usable():
+            return False
+        saved: Union[dict, None] = read_fingerprint(self.__fingerprint_file)
+        return saved is not None and saved.get('fingerprint') == self.get_fingerprint()
+
+    def featurize(self, s: str) -> FeaturizedMessage:
+        """
+        Embeds a message once, so it can be passed to classify() and to the TokenDetector without embedding it again
+        :param s: string - message of the user
+        :return: FeaturizedMessage
+        """
+        return self.__str_helper.featurize(s, self.__max_token_lengths)
 
-    def classify(self, s: str) -> Prediction:
+    def classify(self, s: Union[str, FeaturizedMessage]) -> Prediction:
         """
-        :param s: string - sentence to classify
+        :param s: string | FeaturizedMessage - sentence to classify
         :return: Prediction - tag and confidence
         """
-        if self.__intent_detector is None:
+        matched: Union[Prediction, None] = self.__match_pattern(s)
+        if matched is not None:
+            return matched
+        if self.__scheduler is not None:
+            return self.__scheduler.run(s)
+        return self.classify_batch([s], use_pattern_matcher=False)[0]
+
+    def classify_batch(self, sentences: List[Union[str, FeaturizedMessage]],
+                       use_pattern_matcher: bool = True) -> List[Prediction]:
+        """
+        Classifies multiple sentences with a single forward pass of the intent detector
+        :param sentences: List[str | FeaturizedMessage] - sentences to classify
+        :param use_pattern_matcher: bool - whether sentences found in the dataset patterns skip the intent detector
+        :return: List[Prediction] - one prediction per sentence (same order as sentences)
+        """
+        results: List[Union[Prediction, None]] = [self.__match_pattern(s) if use_pattern_matcher else None
+                                                  for s in sentences]
+        unmatched: List[int] = [idx for idx, result in enumerate(results) if result is None]
+        if len(unmatched) == 0:
+            return results
+        if not self.__backend.is_usable():
             raise Exception(
                 f'Intent detector with model {self.__str_helper.get_model_name()} not trained yet. Please call '
                 f'train() first or set use_pretrained to True.')
-        prediction: np.ndarray = self.__intent_detector.predict(
-            self.__str_helper.get_insertable(s.lower(), self.__max_token_lengths, True))
-        tag: str = self.__tags[np.argmax(prediction)]
-        confidence: float = np.max(prediction)
-        action: Optional[str] = None if self.__dataset['intents'][np.argmax(prediction)]['action'] is None else \
-            self.__dataset['intents'][np.argmax(prediction)]['action']
+        start: float = time.perf_counter()
+        predictions: np.ndarray = self.__backend.predict(
+            self.__str_helper.get_insertable_batch(
+                [sentences[idx] if isinstance(sentences[idx], FeaturizedMessage) else sentences[idx].lower()
+                 for idx in unmatched], self.__max_token_lengths))
+        if self.__pattern_matcher is not None:
+            self.__pattern_matcher.record_neural_latency((time.perf_counter() - start) * 1000 / len(unmatched))
+        for idx, prediction in zip(unmatched, predictions):
+            results[idx] = self.__build_prediction(prediction)
+        return results
 
+    def __match_pattern(self, s: Union[str, FeaturizedMessage]) -> Union[Prediction, None]:
+        """
+        :param s: string | FeaturizedMessage - sentence to classify
+        :return: Prediction if the sentence (almost) literally is a pattern of the dataset, else None
+        """
+        if self.__pattern_matcher is None:
+            return None
+        match: Union[PatternMatch, None] = self.__pattern_matcher.match(
+            s.text if isinstance(s, FeaturizedMessage) else s)
+        if match is None:
+            return None
+        return self.__build_intent_prediction(self.__intents[match.intent_idx], match.confidence)
+
+    def get_pattern_matcher_stats(self) -> Union[PatternMatcherStats, None]:
+        """
+        :return: PatternMatcherStats - hit rate and saved latency of the pattern matcher (None if it is disabled)
+        """
+        return self.__pattern_matcher.get_stats() if self.__pattern_matcher is not None else None
+
+    def __build_prediction(self, prediction: np.ndarray) -> Prediction:
+        """
+        Builds the Prediction of one sentence out of its row of the model output
+        :param prediction: np.ndarray - softmax output of the intent detector for one sentence
+        :return: Prediction - tag and confidence
+        """
+        idx: int = int(np.argmax(prediction))
+        return self.__build_intent_prediction(self.__intents[idx], prediction[idx])
+
+    @staticmethod
+    def __build_intent_prediction(intent: IntentRecord, confidence: float) -> Prediction:
+        """
+        :param intent: IntentRecord - predicted intent
+        :param confidence: float - confidence of the prediction
+        :return: Prediction - tag and confidence
+        """
         # main_str is a random string from responses list, it's not a real key
-        main_str: Optional[str] = None if self.__dataset['intents'][np.argmax(prediction)]['responses'] is None else \
-            np.random.choice(self.__dataset['intents'][np.argmax(prediction)]['responses'])
+        main_str: Optional[str] = None if intent.responses is None else np.random.choice(intent.responses)
 
         # error_str is a key value from responses but can be None in that case we use
         # default value 'Etwas ist schiefgelaufen, tut mir leid.'
-        error_str: Optional[str] = None if self.__dataset['intents'][np.argmax(prediction)]['error_msg'] is None else \
-            self.__dataset['intents'][np.argmax(prediction)]['error_msg']
-        if error_str is None:
-            error_str = 'Etwas ist schiefgelaufen, tut mir leid.'
-        return Prediction(tag, confidence, action, main_str, error_str)
+        error_str: str = intent.error_msg if intent.error_msg is not None else \
+            'Etwas ist schiefgelaufen, tut mir leid.'
+        return Prediction(intent.tag, confidence, intent.action, main_str, error_str)
 
     def train(self, epochs: int = 500, batch_size: int = 64) -> None:
         """
@@ -118,27 +294,90 @@ class Classifier:
         features: list = []
         labels: list = []
 
-        for idx, intent in enumerate(self.__dataset['intents']):
-            tag: str = intent['tag']
-            self.__tags[idx] = tag
-            for pattern in intent['patterns']:
-                features.append(np.array(self.__str_helper.get_insertable(pattern, self.__max_token_lengths)))
-                labels.append(idx)
-
-        features: np.ndarray = np.array(features)
-        labels: np.ndarray = np.array(labels)
-
-        if not self.__intent_detector:
-            self.__intent_detector = keras.Sequential = keras.Sequential([
-                keras.layers.LSTM(128 * 2, input_shape=(self.__max_token_lengths, self.__str_helper.get_dimensions()),
-                                  return_sequences=True),
-                keras.layers.Dropout(0.2),
-                keras.layers.LSTM(128 * 2),
-                keras.layers.Dropout(0.2),
-                keras.layers.Dense(len(self.__tags.keys()), activation='softmax')
-            ])
-            self.__intent_detector.compile(optimizer='adam', loss='sparse_categorical_crossentropy',
-                                           metrics=['accuracy'])
-        self.__intent_detector.fit(features, labels, epochs=epochs, batch_size=batch_size)
-        os.makedirs('models/pretrained', exist_ok=True)
-        self.__intent_detector.save(self.__model_file)
+        cache_key: str = FeatureCache.get_key(hash_json(self.__dataset), self.__str_helper.get_model_name(),
+                                              self.__max_token_lengths)
+        cached: Union[Tuple[np.ndarray, np.ndarray], None] = \
+            self.__feature_cache.load_arrays(cache_key) if self.__feature_cache else None
+        if cached is not None:
+            features, labels = cached
+        else:
+            for intent in self.__intents:
+                for pattern in intent.patterns:
+                    features.append(np.array(self.__str_helper.get_insertable(pattern, self.__max_token_lengths)))
+                    labels.append(intent.idx)
+
+            features: np.ndarray = np.array(features)
+            labels: np.ndarray = np.array(labels)
+            if self.__feature_cache:
+                self.__feature_cache.save_arrays(cache_key, features, labels)
+
+        if self.__backend.is_usable() and self.__backend.get_num_classes() != len(self.__intents):
+            logging.warning('The amount of tags changed, so the pretrained intent detector can not be used anymore. '
+                            'Training a new one ...')
+            self.__backend.reset()
+
+        self.__backend.fit(features, labels, len(self.__intents), epochs, batch_size)
+        self.__save()
+
+    def train_incremental(self, epochs: int = 20, batch_size: int = 64, replay_ratio: float = 2.0) -> bool:
+        """
+        Fine-tunes the saved intent detector on intents and patterns which were added since the last training. The
+        softmax head grows for new tags and a random sample of already known patterns is replayed, so the model
+        doesn't forget the old intents.
+        :param epochs: int - number of epochs
+        :param batch_size: int - how many samples to train on at once
+        :param replay_ratio: float - how many known patterns are replayed per new pattern
+        :return: bool - True if the model is up to date afterward, False if a full training is needed (e.g. if
+                 intents were removed or no training snapshot exists)
+        """
+        saved: Union[dict, None] = read_fingerprint(self.__fingerprint_file)
+        if not self.__backend.is_usable() or saved is None or 'tags' not in saved or 'patterns' not in saved:
+            return False
+        old_tags: List[str] = saved['tags']
+        old_patterns: Dict[str, List[str]] = saved['patterns']
+        if saved.get('model_name') != self.__str_helper.get_model_name() or \
+                saved.get('max_token_length') != self.__max_token_lengths:
+            return False
+        if not self.__backend.SUPPORTS_INCREMENTAL or self.__backend.get_num_classes() != len(old_tags):
+            return False
+
+        tags: List[str] = [intent.tag for intent in self.__intents]
+        if not set(old_tags).issubset(tags) or len(set(tags)) != len(tags):
+            # shrinking the head would shift the classes of the remaining intents, so we train from scratch
+            return False
+
+        new_samples: List[Tuple[str, int]] = []
+        known_samples: List[Tuple[str, int]] = []
+        for intent in self.__intents:
+            known: Set[str] = set(old_patterns.get(intent.tag, []))
+            for pattern in intent.patterns:
+                (known_samples if pattern in known else new_samples).append((pattern, intent.idx))
+
+        features: np.ndarray = np.zeros((0, self.__max_token_lengths, self.__str_helper.get_dimensions()),
+                                        dtype=np.float32)
+        labels: np.ndarray = np.zeros((0,), dtype=np.int64)
+        if new_samples:
+            replay_size: int = min(len(known_samples), int(len(new_samples) * replay_ratio))
+            samples: List[Tuple[str, int]] = new_samples + random.sample(known_samples, replay_size)
+            features = np.array(
+                [self.__str_helper.get_insertable(pattern, self.__max_token_lengths) for pattern, _ in samples])
+            labels = np.array([label for _, label in samples])
+            logging.info(f'Fine-tuning intent detector on {len(new_samples)} new and {replay_size} known patterns')
+        self.__backend.fine_tune(features, labels, old_tags, tags, epochs, batch_size)
+        self.__save()
+        return True
+
+    def __save(self) -> None:
+        """
+        Saves the model together with its fingerprint and a snapshot of the dataset it was trained on
+        :return: None
+        """
+        self.__backend.save()
+        write_fingerprint(self.__fingerprint_file, {
+            'fingerprint': self.get_fingerprint(),
+            'model_name': self.__str_helper.get_model_name(),
+            'max_token_length': self.__max_token_lengths,
+            # the snapshot is used by train_incremental to find out what changed since this training
+            'tags': [intent.tag for intent in self.__intents],
+            'patterns': {intent.tag: list(intent.patterns) for intent in self.__intents}
+        })
@@ -0,0 +1,79 @@
+# Incremental reader for the big ITF datasets, so they never have to be loaded into memory as a whole.
+
+import json
+from typing import *
+
+
+def iter_json_array(path: str, key: str = 'intents', read_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Yields the items of a top-level array (e.g. {"intents": [{...}, {...}]}) one by one while reading the file in
+    small pieces.
+    :param path: string - path to the JSON file
+    :param key: string - key of the array in the top-level object
+    :param read_size: int - how many characters are read at once
+    :return: Iterator - items of the array
+    """
+    decoder: json.JSONDecoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as f:
+        buffer: str = ''
+        eof: bool = False
+
+        def read_more() -> bool:
+            nonlocal buffer, eof
+            data: str = f.read(read_size)
+            if not data:
+                eof = True
+                return False
+            buffer += data
+            return True
+
+        # find the start of the array
+        marker: str = f'"{key}"'
+        while True:
+            key_idx: int = buffer.find(marker)
+            bracket_idx: int = buffer.find('[', key_idx) if key_idx >= 0 else -1
+            if bracket_idx >= 0:
+                buffer = buffer[bracket_idx + 1:]
+                break
+            if not read_more():
+                raise Exception(f'No array with the key {key} found in {path}')
+
+        pos: int = 0
+        while True:
+            # skip whitespace and separators between the items
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos >= len(buffer):
+                buffer, pos = '', 0
+                if not read_more():
+                    raise Exception(f'Unexpected end of file in {path}')
+                continue
+            if buffer[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # the item is not complete yet
+                buffer, pos = buffer[pos:], 0
+                if eof or not read_more():
+                    raise
+                continue
+            yield item
+            pos = end
+            if pos > read_size:
+                buffer, pos = buffer[pos:], 0
+
+
+def interleave(iterators: List[Iterator[Any]]) -> Iterator[Any]:
+    """
+    Yields the items of all iterators round-robin, so a shuffle buffer sees items of every dataset
+    :param iterators: List[Iterator] - iterators to interleave
+    :return: Iterator - items of all iterators
+    """
+    active: List[Iterator[Any]] = list(iterators)
+    while active:
+        for iterator in list(active):
+            try:
+                yield next(iterator)
+            except StopIteration:
+                active.remove(iterator)
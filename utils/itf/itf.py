@@ -1,20 +1,24 @@
 # ITF stands for "Important Token Finder" and tells you where important parts in a sentence are.
 
-import json
 import logging
 import os
 import random
+import tempfile
 from dataclasses import dataclass
 from typing import *
 
 import numpy as np
 import requests
-from tensorflow import keras
 
 from utils.config_helper import ConfigHelper
-from utils.string_helper import StringHelper
-
-keras.mixed_precision.set_global_policy('mixed_float16')
+from utils.feature_cache import FeatureCache, ShardWriter
+from utils.fingerprint import hash_file, make_fingerprint
+from utils.inference import create_runner, load_keras
+from utils.inference_scheduler import InferenceScheduler
+from utils.itf.dataset_stream import iter_json_array, interleave
+from utils.parallel_featurizer import ParallelFeaturizer, featurize_into
+from utils.numpy_engine import NumpyModel, check_quantization, export_model, get_export_path, is_export_current
+from utils.string_helper import StringHelper, FeaturizedMessage
 
 
 @dataclass
@@ -39,14 +43,30 @@ class TokenDetector:
         :param use_pretrained: Boolean - whether to use a pretrained model or not
         """
         self.__str_helper: StringHelper = str_helper
-        self.__token_detector: Union[keras.Sequential, None] = None
-        if use_pretrained and os.path.exists(
-                f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5'):
-            self.__token_detector = keras.models.load_model(
-                f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5')
+        # keras.Sequential or, in inference_mode numpy, its NumPy export (so TensorFlow is only imported for training)
+        self.__token_detector: Union[Any, NumpyModel, None] = None
+        self.__scheduler: Union[InferenceScheduler, None] = None
+        self.__inference_mode: Union[str, None] = config_helper.get_config_setting('inference_mode')
+        self.__runner: Union[Callable[[np.ndarray], np.ndarray], None] = None
+        self.__feature_cache: Union[FeatureCache, None] = \
+            FeatureCache() if config_helper.get_config_setting('feature_cache') else None
+        self.__model_file: str = f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5'
+        # inference_mode numpy can run on quantized weights (model_quantization float16 or int8)
+        self.__quantization: Union[str, None] = check_quantization(
+            config_helper.get_config_setting('model_quantization'))
+        self.__export_file: str = get_export_path(self.__model_file, self.__quantization)
+        if use_pretrained and self.__inference_mode == 'numpy' and \
+                is_export_current(self.__model_file, self.__export_file):
+            self.__token_detector = NumpyModel.load(
+                self.__export_file, bool(config_helper.get_config_setting('model_keep_quantized')))
+            logging.info(f'Loaded exported model {self.__export_file}')
+        elif use_pretrained and os.path.exists(self.__model_file):
+            self.__token_detector = load_keras().models.load_model(self.__model_file)
             logging.info(f'Loaded pretrained model token_detector-{self.__str_helper.get_model_name()}.h5')
-        if use_pretrained and not os.path.exists(
-                f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5'):
+            if self.__inference_mode == 'numpy':
+                # the next start doesn't need TensorFlow
+                export_model(self.__token_detector, self.__export_file, self.__quantization)
+        elif use_pretrained:
             logging.warning(f'No pretrained model token_detector-{self.__str_helper.get_model_name()}.h5 found. '
                             f'You have to train a new one via. token_detector.train()')
 
@@ -61,6 +81,48 @@ class TokenDetector:
             'https://cdn.discordapp.com/attachments/1057089742262509659/1178343410151727174/webintents.json'
         ]
         self.__max_entries_per_dataset: int = 170_000
+        chunk_size: Union[int, None] = config_helper.get_config_setting('itf_chunk_size')
+        shuffle_buffer: Union[int, None] = config_helper.get_config_setting('itf_shuffle_buffer')
+        self.__chunk_size: int = chunk_size if chunk_size else 4096
+        self.__shuffle_buffer: int = shuffle_buffer if shuffle_buffer else 16_384
+        featurize_workers: Union[int, None] = config_helper.get_config_setting('featurize_workers')
+        self.__featurize_workers: int = featurize_workers if featurize_workers else 1
+        self.__featurizer: Union[ParallelFeaturizer, None] = None
+
+    def set_scheduler(self, scheduler: Union[InferenceScheduler, None]) -> None:
+        """
+        Routes get_important_parts() through a micro-batching scheduler, so concurrent calls share one forward pass
+        :param scheduler: InferenceScheduler - scheduler running get_important_parts_batch (None to run every call
+                          directly)
+        :return: None
+        """
+        self.__scheduler = scheduler
+
+    def set_inference_mode(self, mode: str) -> None:
+        """
+        :param mode: string - 'predict' (keras.Model.predict), 'compiled' (traced tf.function) or 'numpy' (NumPy
+                     engine)
+        :return: None
+        """
+        if isinstance(self.__token_detector, NumpyModel) and mode != 'numpy':
+            self.__token_detector = load_keras().models.load_model(self.__model_file)
+        self.__inference_mode = mode
+        self.__runner = None
+
+    def warm_up(self) -> None:
+        """
+        Builds the inference runner and runs it once, so the first message doesn't pay for tracing
+        :return: None
+        """
+        if self.__token_detector is None:
+            return
+        self.__get_runner().warm_up()
+
+    def __get_runner(self) -> Callable[[np.ndarray], np.ndarray]:
+        if self.__runner is None:
+            self.__runner = create_runner(self.__token_detector, self.__inference_mode, self.__max_token_length,
+                                          self.__str_helper.get_dimensions())
+        return self.__runner
 
     def is_usable(self) -> bool:
         return self.__token_detector is not None
@@ -80,18 +142,31 @@ class TokenDetector:
                 f.write(requests.get(dataset_url).content)
             logging.info('Downloaded dataset.')
 
-    def get_important_parts(self, s: str) -> PositionPrediction:
+    def get_important_parts(self, s: Union[str, FeaturizedMessage]) -> PositionPrediction:
         """
-        :param s: string - sentence to classify
+        :param s: string | FeaturizedMessage - sentence to classify
         :return: Tuple[int, int] - start and end index of the token
         """
+        if self.__scheduler is not None:
+            return self.__scheduler.run(s)
+        return self.get_important_parts_batch([s])[0]
+
+    def get_important_parts_batch(self, sentences: List[Union[str, FeaturizedMessage]]) -> List[PositionPrediction]:
+        """
+        Runs the token detector on multiple sentences with a single forward pass
+        :param sentences: List[str | FeaturizedMessage] - sentences to classify
+        :return: List[PositionPrediction] - one prediction per sentence (same order as sentences)
+        """
         if self.__token_detector is None:
             raise Exception('Token detector not trained yet. Please call train() first.')
-        prediction: np.ndarray = self.__token_detector.predict(
-            self.__str_helper.get_insertable(s.lower(), self.__max_token_length, True))
-        return PositionPrediction(float(prediction[0][0]), float(prediction[0][1]),
-                                  float(prediction[0][2]), float(prediction[0][3]),
-                                  float(prediction[0][4]), float(prediction[0][5]))
+        if len(sentences) == 0:
+            return []
+        predictions: np.ndarray = self.__get_runner()(
+            self.__str_helper.get_insertable_batch(
+                [s if isinstance(s, FeaturizedMessage) else s.lower() for s in sentences], self.__max_token_length))
+        return [PositionPrediction(float(prediction[0]), float(prediction[1]),
+                                   float(prediction[2]), float(prediction[3]),
+                                   float(prediction[4]), float(prediction[5])) for prediction in predictions]
 
     @staticmethod
     def __get_part_info(labels: tuple, index: int) -> list:
@@ -105,6 +180,134 @@ class TokenDetector:
             return [labels[index][1], labels[index][2]]
         return [-1, -1]
 
+    def __iter_dataset(self, intent_path: str) -> Iterator[Tuple[str, List[int]]]:
+        """
+        Yields the samples of one dataset file without loading the whole file (sentences which are too long are
+        skipped later during the featurization)
+        :param intent_path: string - path to the dataset
+        :return: Iterator[Tuple[str, List[int]]] - sentence and its 6 label values
+        """
+        for idx, entry in enumerate(iter_json_array(intent_path, 'intents')):
+            sentence: str = str(entry['pattern']).lower()
+            try:
+                label: tuple = entry['labels']
+            except KeyError as e:
+                if 'label' not in entry:
+                    raise e
+                label: tuple = entry['label']  # and if there is also no label key, it also raises the error
+            # dataset has labels list and in labels list there a lists in which the first item is the type
+            # (we ignore this for now) and the second item is the start index and the third item is the end index
+            # ive checked the dataset and there are max 6 lists in the labels list. If there are less than 6 lists
+            # we put -1 values in here
+            to_extend: list = []
+            for i in range(3):
+                to_extend.extend(self.__get_part_info(label, i))
+            yield sentence, to_extend
+            if idx > self.__max_entries_per_dataset:
+                break
+
+    def __iter_chunks(self) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+        """
+        Featurizes the samples of all datasets in chunks of itf_chunk_size, in a single pass over the datasets
+        :return: Iterator[Tuple[str, np.ndarray, np.ndarray]] - split ('validation' for every 5th sample, else
+        'train'), features (n, max_token_length, dims) and labels (n, 6)
+        """
+        chunks: Dict[str, Tuple[List[str], List[List[int]]]] = {'train': ([], []), 'validation': ([], [])}
+        # the datasets are interleaved, so the shuffle buffer contains samples of all of them
+        samples: Iterator[Tuple[str, List[int]]] = interleave(
+            [self.__iter_dataset(intent_path) for intent_path in self.__intent_paths])
+        for sample_idx, (sentence, label) in enumerate(samples):
+            split: str = 'validation' if sample_idx % 5 == 4 else 'train'
+            sentences, labels = chunks[split]
+            sentences.append(sentence)
+            labels.append(label)
+            if len(sentences) >= self.__chunk_size:
+                yield (split,) + self.__featurize_chunk(sentences, labels)
+                chunks[split] = ([], [])
+        for split, (sentences, labels) in chunks.items():
+            if sentences:
+                yield (split,) + self.__featurize_chunk(sentences, labels)
+
+    def __featurize_chunk(self, sentences: List[str], labels: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Featurizes a chunk (in parallel if featurize_workers is set) and drops sentences which are too long
+        :param sentences: List[str] - sentences of the chunk
+        :param labels: List[List[int]] - labels of the chunk
+        :return: Tuple[np.ndarray, np.ndarray] - features and labels
+        """
+        if self.__featurizer is not None:
+            features, valid = self.__featurizer.featurize(sentences, self.__max_token_length)
+        else:
+            features: np.ndarray = np.zeros((len(sentences), self.__max_token_length,
+                                             self.__str_helper.get_dimensions()), dtype=np.float32)
+            valid: List[bool] = featurize_into(self.__str_helper, sentences, self.__max_token_length, features)
+        mask: np.ndarray = np.array(valid, dtype=bool)
+        return features[mask], np.array(labels, dtype=np.float32)[mask]
+
+    def __prepare_shards(self, feature_cache: FeatureCache) -> str:
+        """
+        Featurizes all datasets once into memory-mappable shards, if they are not cached yet
+        :param feature_cache: FeatureCache - the persistent feature cache or a temporary one for a single training
+        :return: string - key of the cache entry
+        """
+        if feature_cache is not self.__feature_cache:
+            cache_key: str = 'temporary'
+        else:
+            dataset_hash: str = make_fingerprint(files=[hash_file(intent_path) for intent_path in self.__intent_paths],
+                                                 max_entries_per_dataset=self.__max_entries_per_dataset)
+            cache_key = FeatureCache.get_key(dataset_hash, self.__str_helper.get_model_name(), self.__max_token_length)
+            if feature_cache.has_shards(cache_key):
+                logging.info('Using cached features of the token detector datasets.')
+                return cache_key
+
+        logging.info('Featurizing the token detector datasets ...')
+        writer: ShardWriter = feature_cache.create_shard_writer(cache_key)
+        try:
+            for split, features, labels in self.__iter_chunks():
+                writer.write(split, features, labels)
+        except (Exception, KeyboardInterrupt):
+            writer.abort()
+            raise
+        writer.commit()
+        return cache_key
+
+    @staticmethod
+    def __iter_shards(feature_cache: FeatureCache, cache_key: str,
+                      validation: bool) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        :param feature_cache: FeatureCache - cache which contains the shards
+        :param cache_key: string - key of the cache entry
+        :param validation: bool - True yields the validation split, False the training split
+        :return: Iterator[Tuple[np.ndarray, np.ndarray]] - memory-mapped features and labels of every shard
+        """
+        shard_paths: List[Tuple[str, str]] = feature_cache.get_shard_paths(
+            cache_key, 'validation' if validation else 'train')
+        if not validation:
+            random.shuffle(shard_paths)  # a new shard order on every epoch, the shuffle buffer does the rest
+        for paths in shard_paths:
+            yield FeatureCache.load_shard(paths)
+
+    def __build_dataset(self, batch_size: int, validation: bool, feature_cache: FeatureCache,
+                        cache_key: str) -> 'tf.data.Dataset':
+        """
+        :param batch_size: int - how many samples to train on at once
+        :param validation: bool - whether to build the validation split (20 %) or the training split (80 %)
+        :param feature_cache: FeatureCache - cache which contains the shards
+        :param cache_key: string - key of the cache entry
+        :return: tf.data.Dataset - shuffled, batched and prefetched dataset
+        """
+        import tensorflow as tf
+        dataset: tf.data.Dataset = tf.data.Dataset.from_generator(
+            lambda: self.__iter_shards(feature_cache, cache_key, validation),
+            output_signature=(
+                tf.TensorSpec(shape=(None, self.__max_token_length, self.__str_helper.get_dimensions()),
+                              dtype=tf.float32),
+                tf.TensorSpec(shape=(None, 6), dtype=tf.float32)))
+        dataset = dataset.unbatch()
+        if not validation:
+            dataset = dataset.shuffle(self.__shuffle_buffer, reshuffle_each_iteration=True)
+        return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
     def summary(self) -> None:
         """
         Prints a summary of the model.
@@ -122,66 +325,43 @@ class TokenDetector:
         :param train_on_pretrained: Boolean - whether to train on the pretrained model or create a new one
         :return: None
         """
+        if self.__featurize_workers > 1:
+            self.__featurizer = ParallelFeaturizer(self.__str_helper, self.__featurize_workers)
+        # without feature_cache the datasets are featurized into temporary shards, which are removed after the training
+        # (so every sample is still featurized only once instead of on every epoch)
+        temporary_dir: Union[tempfile.TemporaryDirectory, None] = \
+            None if self.__feature_cache is not None else tempfile.TemporaryDirectory(prefix='itf-features-')
+        try:
+            self.__train(epochs, batch_size, train_on_pretrained,
+                         self.__feature_cache if temporary_dir is None else FeatureCache(temporary_dir.name))
+        finally:
+            if self.__featurizer is not None:
+                self.__featurizer.close()
+                self.__featurizer = None
+            if temporary_dir is not None:
+                temporary_dir.cleanup()
 
-        features: list = []
-        labels: list = []
-
+    def __train(self, epochs: int, batch_size: int, train_on_pretrained: bool, feature_cache: FeatureCache) -> None:
         if len(self.__intent_paths) == 0:
             self.download_datasets()
             for dataset_url in self.__dataset_urls:
                 if dataset_url not in self.__intent_paths:
                     self.__intent_paths.append(dataset_url)
 
-        # Load all datasets and append them to the features and labels list
-        for intent_path in self.__intent_paths:
-            with open(intent_path, 'r', encoding='utf-8') as f:
-                dataset: dict = json.load(f)
-            for idx, entry in enumerate(dataset['intents']):
-                sentence: str = str(entry['pattern']).lower()
-                if self.__str_helper.get_token_length(sentence) > self.__max_token_length:
-                    continue
-                try:
-                    label: tuple = entry['labels']
-                except KeyError as e:
-                    if 'label' not in entry:
-                        raise e
-                    label: tuple = entry['label']  # and if there is also no label key, it also raises the error
-                # labels.append(np.array([label[0][1], label[0][2],
-                #                         label[1][1], label[1][2],
-                #                         label[2][1], label[2][2]]))
-                # dataset has labels list and in labels list there a lists in which the first item is the type
-                # (we ignore this for now) and the second item is the start index and the third item is the end index
-                # ive checked the dataset and there are max 6 lists in the labels list. If there are less than 6 lists
-                # we put -1 values in here
-                to_extend: list = []
-                for i in range(3):
-                    to_extend.extend(self.__get_part_info(label, i))
-                labels.append(np.array(to_extend))
-                features.append(
-                    self.__str_helper.get_insertable(sentence, self.__max_token_length).astype(np.float32))
-                if idx > self.__max_entries_per_dataset:
-                    break
-            del dataset
-
-        features: np.ndarray = np.array(features)
-        labels: np.ndarray = np.array(labels)
-
-        # Shuffle the features and labels
-        c: list = list(zip(features, labels))
-        random.shuffle(c)
-        features, labels = zip(*c)
-        features: np.ndarray = np.array(features)
-        labels: np.ndarray = np.array(labels)
+        # The datasets are featurized chunk by chunk into shards once, every epoch streams the memory-mapped shards, so
+        # the memory usage depends on itf_chunk_size and itf_shuffle_buffer instead of the size of the datasets. With
+        # feature_cache enabled, the shards are kept for the next training.
+        keras = load_keras()
+        cache_key: str = self.__prepare_shards(feature_cache)
+        train_data: 'tf.data.Dataset' = self.__build_dataset(batch_size, False, feature_cache, cache_key)
+        validation_data: 'tf.data.Dataset' = self.__build_dataset(batch_size, True, feature_cache, cache_key)
 
         if train_on_pretrained:
-            if os.path.isfile(f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5'):
-                self.__token_detector = keras.models.load_model(
-                    f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5')
+            if os.path.isfile(self.__model_file):
+                self.__token_detector = keras.models.load_model(self.__model_file)
                 self.__token_detector.compile(optimizer='sgd', loss='mean_squared_error', metrics=['accuracy'])
-                self.__token_detector.fit(features, labels, epochs=epochs, batch_size=batch_size,
-                                          validation_split=.2)
-                self.__token_detector.save(
-                    f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5')
+                self.__token_detector.fit(train_data, epochs=epochs, validation_data=validation_data)
+                self.__save()
                 return
             logging.warning('No pretrained model found. Training a new one ...')
 
@@ -198,5 +378,14 @@ class TokenDetector:
 
         self.__token_detector.compile(optimizer=keras.optimizers.Adam(learning_rate=0.001), loss='mean_squared_error',
                                       metrics=['mse'])
-        self.__token_detector.fit(features, labels, epochs=epochs, batch_size=batch_size, validation_split=.2)
-        self.__token_detector.save(f'models/pretrained/token_detector-{self.__str_helper.get_model_name()}.h5')
+        self.__token_detector.fit(train_data, epochs=epochs, validation_data=validation_data)
+        self.__save()
+
+    def __save(self) -> None:
+        """
+        Saves the model and its NumPy export
+        :return: None
+        """
+        self.__runner = None
+        self.__token_detector.save(self.__model_file)
+        export_model(self.__token_detector, self.__export_file, self.__quantization)
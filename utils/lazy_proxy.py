@@ -0,0 +1,57 @@
+# Thread-safe proxy which builds an expensive object (e.g. the TokenDetector with its BiLSTM) on first use, so it only
+# costs startup time if it is needed at all.
+
+import logging
+import threading
+from typing import *
+
+
+class LazyProxy:
+    def __init__(self, factory: Callable[[], Any], name: str = 'object') -> None:
+        """
+        :param factory: Callable - builds the object, called at most once (again only if it raised)
+        :param name: string - name of the object for log messages
+        """
+        self.__factory: Callable[[], Any] = factory
+        self.__name: str = name
+        self.__instance: Any = None
+        self.__lock: threading.Lock = threading.Lock()
+        self.__preload_thread: Union[threading.Thread, None] = None
+
+    def get(self) -> Any:
+        """
+        Builds the object if that didn't happen yet. Concurrent callers wait for the same build.
+        :return: Any - the object
+        """
+        instance: Any = self.__instance
+        if instance is not None:
+            return instance
+        with self.__lock:
+            if self.__instance is None:
+                logging.info(f'Loading {self.__name} ...')
+                self.__instance = self.__factory()
+            return self.__instance
+
+    def is_loaded(self) -> bool:
+        return self.__instance is not None
+
+    def preload(self) -> None:
+        """
+        Builds the object in a background thread, so the first call doesn't have to wait for it
+        :return: None
+        """
+        if self.__instance is not None or self.__preload_thread is not None:
+            return
+        self.__preload_thread = threading.Thread(target=self.__preload, name=f'preload-{self.__name}', daemon=True)
+        self.__preload_thread.start()
+
+    def __preload(self) -> None:
+        try:
+            self.get()
+        except Exception as e:
+            # the next call of get() tries it again and raises the error where the object is actually needed
+            logging.error(['[LazyProxy -> preload]', 'While preloading', self.__name, e])
+
+    def __getattr__(self, item: str) -> Any:
+        # only called for attributes the proxy doesn't have itself
+        return getattr(self.get(), item)
@@ -0,0 +1,68 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import *
+
+
+@dataclass
+class CacheStats:
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+
+
+class LRUCache:
+    def __init__(self, max_size: int) -> None:
+        """
+        Thread-safe, bounded least-recently-used cache
+        :param max_size: int - maximum amount of entries (0 disables the cache)
+        """
+        self.__max_size: int = max(max_size, 0)
+        self.__entries: OrderedDict = OrderedDict()
+        self.__lock: threading.Lock = threading.Lock()
+        self.__hits: int = 0
+        self.__misses: int = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """
+        :param key: Hashable - key of the entry
+        :param default: Any - returned if the key is not cached
+        :return: Any - cached value or default
+        """
+        with self.__lock:
+            if key in self.__entries:
+                self.__entries.move_to_end(key)
+                self.__hits += 1
+                return self.__entries[key]
+            self.__misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        :param key: Hashable - key of the entry
+        :param value: Any - value to cache
+        :return: None
+        """
+        if self.__max_size == 0:
+            return
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Removes all entries and resets the hit/miss counters
+        :return: None
+        """
+        with self.__lock:
+            self.__entries.clear()
+            self.__hits = 0
+            self.__misses = 0
+
+    def get_stats(self) -> CacheStats:
+        with self.__lock:
+            return CacheStats(size=len(self.__entries), max_size=self.__max_size, hits=self.__hits,
+                              misses=self.__misses)
@@ -0,0 +1,396 @@
+# Inference engine for the exported Keras models which only needs NumPy. Supports the layers BaxterLite uses (LSTM,
+# Bidirectional LSTM, Dense and Dropout), so inference-only deployments don't have to import TensorFlow at all.
+# The weights can be stored quantized (float16 or int8 with one scale per output unit), which makes the exports 2 - 4
+# times smaller and faster to load. The kernels are dequantized to float32 once, on the first forward pass, so the
+# inference is as fast as with a full precision export. Where memory matters more than latency, keep_quantized keeps
+# them quantized in memory and converts every kernel for the duration of one forward pass instead (int8 kernels are
+# multiplied unscaled and their output is scaled afterwards).
+# Export the pretrained models of an embedding model via: python -m utils.numpy_engine --model <model-name>
+
+import argparse
+import json
+import logging
+import os
+from typing import *
+
+import numpy as np
+
+PRETRAINED_DIR: str = 'models/pretrained'
+QUANTIZATION_MODES: Tuple[str, ...] = ('float16', 'int8')
+QUANTIZED_DTYPES: Tuple[np.dtype, ...] = (np.dtype(np.float16), np.dtype(np.int8))
+
+
+def sigmoid(x: np.ndarray) -> np.ndarray:
+    return 0.5 * (np.tanh(0.5 * x) + 1)  # numerically stable for big negative values
+
+
+def hard_sigmoid(x: np.ndarray) -> np.ndarray:
+    return np.clip(0.2 * x + 0.5, 0, 1)
+
+
+def relu(x: np.ndarray) -> np.ndarray:
+    return np.maximum(x, 0)
+
+
+def linear(x: np.ndarray) -> np.ndarray:
+    return x
+
+
+def softmax(x: np.ndarray) -> np.ndarray:
+    exp: np.ndarray = np.exp(x - x.max(axis=-1, keepdims=True))
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+ACTIVATIONS: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    'sigmoid': sigmoid, 'hard_sigmoid': hard_sigmoid, 'tanh': np.tanh, 'relu': relu, 'linear': linear,
+    'softmax': softmax
+}
+
+
+def get_kernel(weights: Dict[str, np.ndarray], key: str) -> Tuple[np.ndarray, Union[np.ndarray, None]]:
+    """
+    :param weights: Dict[str, np.ndarray] - weights of a layer as stored by quantize_weights
+    :param key: string - name of the kernel
+    :return: Tuple - float32 copy of a quantized kernel (the kernel itself if it is float32) and its int8 scale per
+             output unit (None if it has none)
+    """
+    kernel: np.ndarray = weights[key]
+    if kernel.dtype != np.float32:
+        kernel = kernel.astype(np.float32)
+    return kernel, weights.get(f'{key}__scale')
+
+
+def matmul(x: np.ndarray, kernel: np.ndarray, scale: Union[np.ndarray, None]) -> np.ndarray:
+    """
+    :param x: np.ndarray - float32 input
+    :param kernel: np.ndarray - float32 kernel (see get_kernel)
+    :param scale: np.ndarray - int8 scale per output unit, None if the kernel isn't int8 (or already dequantized)
+    :return: np.ndarray - x @ kernel, scaled per output unit (which is the same as multiplying the dequantized kernel)
+    """
+    y: np.ndarray = x @ kernel
+    return y if scale is None else y * scale
+
+
+def run_lstm(x: np.ndarray, weights: Dict[str, np.ndarray], config: dict) -> np.ndarray:
+    """
+    :param x: np.ndarray - input of shape (n, timesteps, features)
+    :param weights: Dict[str, np.ndarray] - kernel, recurrent_kernel and bias in the Keras layout (gates i, f, c, o),
+                    the kernels can be quantized (see quantize_weights)
+    :param config: dict - units, activation, recurrent_activation, return_sequences and go_backwards
+    :return: np.ndarray - (n, timesteps, units) if return_sequences is set, else (n, units)
+    """
+    units: int = config['units']
+    activation: Callable = ACTIVATIONS[config['activation']]
+    recurrent_activation: Callable = ACTIVATIONS[config['recurrent_activation']]
+    if config['go_backwards']:
+        x = x[:, ::-1]
+
+    # the input projection of all timesteps is a single matrix multiplication
+    projected: np.ndarray = matmul(x, *get_kernel(weights, 'kernel'))
+    if 'bias' in weights:
+        projected += weights['bias']
+    # converted once, not in every timestep
+    recurrent_kernel, recurrent_scale = get_kernel(weights, 'recurrent_kernel')
+
+    h: np.ndarray = np.zeros((x.shape[0], units), dtype=np.float32)
+    c: np.ndarray = np.zeros((x.shape[0], units), dtype=np.float32)
+    outputs: List[np.ndarray] = []
+    for step in range(x.shape[1]):
+        z: np.ndarray = projected[:, step] + matmul(h, recurrent_kernel, recurrent_scale)
+        i: np.ndarray = recurrent_activation(z[:, :units])
+        f: np.ndarray = recurrent_activation(z[:, units:2 * units])
+        c = f * c + i * activation(z[:, 2 * units:3 * units])
+        o: np.ndarray = recurrent_activation(z[:, 3 * units:])
+        h = o * activation(c)
+        if config['return_sequences']:
+            outputs.append(h)
+    return np.stack(outputs, axis=1) if config['return_sequences'] else h
+
+
+class NumpyModel:
+    def __init__(self, layers: List[dict], weights: Dict[str, np.ndarray], keep_quantized: bool = False) -> None:
+        """
+        :param layers: List[dict] - config of every layer (see export_layers)
+        :param weights: Dict[str, np.ndarray] - weights keyed by layer{idx}_{name}, kernels can be quantized (see
+                        quantize_weights)
+        :param keep_quantized: bool - keep quantized kernels quantized in memory (about 2 - 4 times less memory for the
+                               weights, but every forward pass converts them, which makes inference slower). By default
+                               they are dequantized once on the first forward pass.
+        """
+        self.__layers: List[dict] = layers
+        self.__weights: Dict[str, np.ndarray] = {key: value if value.dtype in QUANTIZED_DTYPES else
+                                                 np.asarray(value, dtype=np.float32)
+                                                 for key, value in weights.items()}
+        self.__keep_quantized: bool = keep_quantized
+        self.__dequantized: bool = keep_quantized or not any(value.dtype in QUANTIZED_DTYPES
+                                                             for value in self.__weights.values())
+        last_units: int = layers[-1]['config']['units']
+        self.output_shape: Tuple[Union[int, None], int] = (None, last_units)  # the same attribute a Keras model has
+
+    @staticmethod
+    def from_keras(model: Any) -> 'NumpyModel':
+        """
+        :param model: keras.Sequential - trained model
+        :return: NumpyModel - model with the same weights
+        """
+        return NumpyModel(*export_layers(model))
+
+    @staticmethod
+    def load(path: str, keep_quantized: bool = False) -> 'NumpyModel':
+        """
+        :param path: string - path to an exported .npz file
+        :param keep_quantized: bool - keep quantized kernels quantized in memory (see NumpyModel)
+        :return: NumpyModel
+        """
+        with np.load(path) as exported:
+            layers: List[dict] = json.loads(str(exported['layers']))
+            weights: Dict[str, np.ndarray] = {key: exported[key] for key in exported.files if key != 'layers'}
+        return NumpyModel(layers, weights, keep_quantized)
+
+    def get_layers(self) -> List[dict]:
+        return self.__layers
+
+    def get_weights(self) -> Dict[str, np.ndarray]:
+        """
+        :return: Dict[str, np.ndarray] - weights as they are kept in memory (quantized kernels with their scales until
+                 the first forward pass, unless keep_quantized is set)
+        """
+        return self.__weights
+
+    def is_quantized(self) -> bool:
+        """
+        :return: bool - True if the kernels in memory are quantized
+        """
+        return any(value.dtype in QUANTIZED_DTYPES for value in self.__weights.values())
+
+    def __dequantize(self) -> None:
+        # the new dict replaces the quantized weights in one assignment, so concurrent forward passes see either
+        if not self.__dequantized:
+            self.__weights = dequantize_weights(self.__weights)
+            self.__dequantized = True
+
+    def get_nbytes(self) -> int:
+        """
+        :return: int - memory of all weights in bytes
+        """
+        return sum(value.nbytes for value in self.__weights.values())
+
+    def __layer_weights(self, idx: int, prefix: str = '') -> Dict[str, np.ndarray]:
+        start: str = f'layer{idx}_{prefix}'
+        return {key[len(start):]: value for key, value in self.__weights.items() if key.startswith(start)}
+
+    def __call__(self, batch: np.ndarray) -> np.ndarray:
+        """
+        :param batch: np.ndarray - input tensor of shape (n, max_token_length, dimensions)
+        :return: np.ndarray - model output of shape (n, outputs)
+        """
+        self.__dequantize()
+        x: np.ndarray = np.asarray(batch, dtype=np.float32)
+        for idx, layer in enumerate(self.__layers):
+            config: dict = layer['config']
+            if layer['type'] == 'LSTM':
+                x = run_lstm(x, self.__layer_weights(idx), config)
+            elif layer['type'] == 'Bidirectional':
+                forward: np.ndarray = run_lstm(x, self.__layer_weights(idx, 'forward_'), layer['forward'])
+                backward: np.ndarray = run_lstm(x, self.__layer_weights(idx, 'backward_'), layer['backward'])
+                if layer['backward']['return_sequences']:
+                    backward = backward[:, ::-1]  # back into the order of the input, just like Keras does
+                x = np.concatenate([forward, backward], axis=-1)
+            elif layer['type'] == 'Dense':
+                weights: Dict[str, np.ndarray] = self.__layer_weights(idx)
+                x = matmul(x, *get_kernel(weights, 'kernel'))
+                if 'bias' in weights:
+                    x = x + weights['bias']
+                x = ACTIVATIONS[config['activation']](x)
+        return x
+
+    def summary(self) -> None:
+        for idx, layer in enumerate(self.__layers):
+            weights: int = sum(int(np.prod(value.shape)) for key, value in self.__weights.items()
+                               if key.startswith(f'layer{idx}_') and not key.endswith('__scale'))
+            print(f'{layer["type"]:<15} {json.dumps(layer["config"])} ({weights} weights)')
+
+
+def _export_lstm(layer: Any) -> Tuple[dict, Dict[str, np.ndarray]]:
+    config: dict = layer.get_config()
+    if config.get('return_state') or config.get('stateful'):
+        raise Exception(f'LSTM layer {layer.name} uses return_state or stateful, which is not supported.')
+    names: List[str] = ['kernel', 'recurrent_kernel', 'bias'] if config.get('use_bias', True) else \
+        ['kernel', 'recurrent_kernel']
+    return ({'units': config['units'], 'activation': config['activation'],
+             'recurrent_activation': config['recurrent_activation'],
+             'return_sequences': config['return_sequences'], 'go_backwards': config['go_backwards']},
+            dict(zip(names, layer.get_weights())))
+
+
+def export_layers(model: Any) -> Tuple[List[dict], Dict[str, np.ndarray]]:
+    """
+    :param model: keras.Sequential - trained model
+    :return: Tuple[List[dict], Dict[str, np.ndarray]] - layer configs and weights keyed by layer{idx}_{name}
+    """
+    layers: List[dict] = []
+    weights: Dict[str, np.ndarray] = {}
+    for layer in model.layers:
+        layer_type: str = type(layer).__name__
+        idx: int = len(layers)
+        if layer_type in ['Dropout', 'InputLayer']:
+            continue  # no-ops during inference
+        if layer_type == 'LSTM':
+            config, layer_weights = _export_lstm(layer)
+            layers.append({'type': layer_type, 'config': config})
+            weights.update({f'layer{idx}_{name}': value for name, value in layer_weights.items()})
+        elif layer_type == 'Bidirectional':
+            if layer.merge_mode != 'concat' or type(layer.forward_layer).__name__ != 'LSTM':
+                raise Exception(f'Bidirectional layer {layer.name} must wrap an LSTM and use merge_mode concat.')
+            forward_config, forward_weights = _export_lstm(layer.forward_layer)
+            backward_config, backward_weights = _export_lstm(layer.backward_layer)
+            layers.append({'type': layer_type, 'config': {'units': forward_config['units'] * 2},
+                           'forward': forward_config, 'backward': backward_config})
+            weights.update({f'layer{idx}_forward_{name}': value for name, value in forward_weights.items()})
+            weights.update({f'layer{idx}_backward_{name}': value for name, value in backward_weights.items()})
+        elif layer_type == 'Dense':
+            config: dict = layer.get_config()
+            layers.append({'type': layer_type, 'config': {'units': config['units'],
+                                                          'activation': config['activation']}})
+            names: List[str] = ['kernel', 'bias'] if config.get('use_bias', True) else ['kernel']
+            weights.update({f'layer{idx}_{name}': value for name, value in zip(names, layer.get_weights())})
+        else:
+            raise Exception(f'Layer {layer.name} of type {layer_type} is not supported by the NumPy engine.')
+    return layers, weights
+
+
+def check_quantization(quantization: Union[str, None]) -> Union[str, None]:
+    """
+    :param quantization: string - one of QUANTIZATION_MODES or None
+    :return: string - the quantization mode, None (full precision) if it is unknown
+    """
+    if quantization is not None and quantization not in QUANTIZATION_MODES:
+        logging.warning(f'Unknown model_quantization {quantization}, falling back to full precision. Possible values: '
+                        f'{QUANTIZATION_MODES}')
+        return None
+    return quantization
+
+
+def quantize_weights(weights: Dict[str, np.ndarray], quantization: Union[str, None]) -> Dict[str, np.ndarray]:
+    """
+    Quantizes the kernels (biases are tiny and stay float32). int8 kernels are stored together with a float32 scale per
+    output unit ({key}__scale), so units with small weights don't lose their precision to units with big ones.
+    :param weights: Dict[str, np.ndarray] - float32 weights keyed by layer{idx}_{name}
+    :param quantization: string - one of QUANTIZATION_MODES (None keeps full precision)
+    :return: Dict[str, np.ndarray] - quantized weights
+    """
+    if quantization is None:
+        return weights
+    if quantization not in QUANTIZATION_MODES:
+        raise Exception(f'Unknown quantization {quantization}. Possible values: {QUANTIZATION_MODES}')
+    quantized: Dict[str, np.ndarray] = {}
+    for key, value in weights.items():
+        if value.ndim < 2:
+            quantized[key] = value
+        elif quantization == 'float16':
+            quantized[key] = value.astype(np.float16)
+        else:
+            scale: np.ndarray = np.maximum(np.abs(value).max(axis=0, keepdims=True), 1e-12) / 127
+            quantized[key] = np.clip(np.round(value / scale), -127, 127).astype(np.int8)
+            quantized[f'{key}__scale'] = scale.astype(np.float32)
+    return quantized
+
+
+def dequantize_weights(weights: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """
+    :param weights: Dict[str, np.ndarray] - weights as stored by quantize_weights
+    :return: Dict[str, np.ndarray] - float32 weights (int8 kernels multiplied with their scales)
+    """
+    return {key: value.astype(np.float32) * weights[f'{key}__scale'] if f'{key}__scale' in weights else
+            value.astype(np.float32) for key, value in weights.items() if not key.endswith('__scale')}
+
+
+def save_layers(path: str, layers: List[dict], weights: Dict[str, np.ndarray],
+                quantization: Union[str, None] = None) -> None:
+    """
+    :param path: string - target .npz file
+    :param layers: List[dict] - layer configs
+    :param weights: Dict[str, np.ndarray] - weights keyed by layer{idx}_{name}
+    :param quantization: string - one of QUANTIZATION_MODES (None keeps full precision)
+    :return: None
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path: str = path + '.tmp.npz'
+    np.savez(tmp_path, layers=np.array(json.dumps(layers)), **quantize_weights(weights, quantization))
+    os.replace(tmp_path, path)
+
+
+def export_model(model: Any, path: str, quantization: Union[str, None] = None) -> None:
+    """
+    :param model: keras.Sequential - trained model
+    :param path: string - target .npz file
+    :param quantization: string - one of QUANTIZATION_MODES (None keeps full precision)
+    :return: None
+    """
+    save_layers(path, *export_layers(model), quantization=quantization)
+    logging.info(f'Exported model to {path}')
+
+
+def get_export_path(model_file: str, quantization: Union[str, None] = None) -> str:
+    """
+    :param model_file: string - path to the saved Keras model
+    :param quantization: string - one of QUANTIZATION_MODES (None for full precision)
+    :return: string - path of its NumPy export (same name, .npz or _<quantization>.npz)
+    """
+    name: str = os.path.splitext(model_file)[0]
+    return f'{name}.npz' if quantization is None else f'{name}_{quantization}.npz'
+
+
+def is_export_current(model_file: str, export_file: str) -> bool:
+    """
+    :param model_file: string - path to the saved Keras model
+    :param export_file: string - path of its NumPy export
+    :return: bool - True if the export exists and is not older than the Keras model
+    """
+    if not os.path.isfile(export_file):
+        return False
+    return not os.path.isfile(model_file) or os.path.getmtime(export_file) >= os.path.getmtime(model_file)
+
+
+def verify_export(model: Any, numpy_model: NumpyModel, samples: int = 32, seed: int = 0) -> float:
+    """
+    :param model: keras.Sequential - original model
+    :param numpy_model: NumpyModel - exported model
+    :param samples: int - amount of random inputs
+    :param seed: int - seed of the random inputs
+    :return: float - maximum absolute difference between both outputs
+    """
+    batch: np.ndarray = np.random.default_rng(seed).normal(
+        size=(samples,) + tuple(model.input_shape[1:])).astype(np.float32)
+    expected: np.ndarray = np.asarray(model(batch, training=False), dtype=np.float32)
+    return float(np.max(np.abs(expected - numpy_model(batch))))
+
+
+def main() -> None:
+    parser: argparse.ArgumentParser = argparse.ArgumentParser(description='Export the pretrained models for the '
+                                                                          'NumPy inference engine')
+    parser.add_argument('--model', required=True, help='name of the word vector model (e.g. glove-wiki-gigaword-200)')
+    parser.add_argument('--root', default=PRETRAINED_DIR, help='directory of the pretrained models')
+    parser.add_argument('--tolerance', type=float, default=1e-2, help='maximum difference to the Keras outputs')
+    parser.add_argument('--quantize', choices=QUANTIZATION_MODES, default=None,
+                        help='store the weights quantized (the tolerance is not checked for quantized exports)')
+    args: argparse.Namespace = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    from tensorflow import keras
+    for model_file in [os.path.join(args.root, f'intent_detector_{args.model}.h5'),
+                       os.path.join(args.root, f'token_detector-{args.model}.h5')]:
+        if not os.path.isfile(model_file):
+            logging.warning(f'{model_file} does not exist, skipping it.')
+            continue
+        model: Any = keras.models.load_model(model_file)
+        export_file: str = get_export_path(model_file, args.quantize)
+        export_model(model, export_file, args.quantize)
+        difference: float = verify_export(model, NumpyModel.load(export_file))
+        if difference > args.tolerance and args.quantize is None:
+            raise Exception(f'The export of {model_file} differs by {difference} from the Keras model.')
+        logging.info(f'Maximum difference to the Keras model: {difference}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+# Multi-process featurization for big datasets. The workers write their float32 rows straight into a shared memory
+# block, so only the sentences and a validity mask have to be pickled.
+
+import logging
+import math
+import multiprocessing as mp
+import os
+from multiprocessing import resource_tracker, shared_memory
+from typing import *
+
+import numpy as np
+
+from utils.embedding_store import EMBEDDING_DIR, EmbeddingStore, get_store_dir
+from utils.string_helper import StringHelper, Model
+
+_worker_str_helper: Union[StringHelper, None] = None
+_uses_own_resource_tracker: bool = False
+
+
+def featurize_into(str_helper: StringHelper, sentences: List[str], max_token_length: int,
+                   out: np.ndarray) -> List[bool]:
+    """
+    Featurizes sentences into a preallocated array. Sentences with more than max_token_length tokens are skipped and
+    their rows stay zero. Both the serial and the parallel path use this function, so they return the same results.
+    :param str_helper: StringHelper instance
+    :param sentences: List[str] - sentences to featurize
+    :param max_token_length: int - maximum token length
+    :param out: np.ndarray - array of shape (len(sentences), max_token_length, dimensions)
+    :return: List[bool] - True for every sentence which was featurized, False for skipped ones
+    """
+    valid: List[bool] = [str_helper.get_token_length(sentence) <= max_token_length for sentence in sentences]
+    rows: List[int] = [row for row, is_valid in enumerate(valid) if is_valid]
+    if rows:
+        out[rows] = str_helper.get_insertable_batch([sentences[row] for row in rows], max_token_length,
+                                                    use_cache=False)
+    return valid
+
+
+def _init_worker(model: Model, embedding_dir: str, uses_own_resource_tracker: bool) -> None:
+    global _worker_str_helper, _uses_own_resource_tracker
+    _uses_own_resource_tracker = uses_own_resource_tracker
+    if _worker_str_helper is None:  # forked workers already inherited the StringHelper of the parent
+        _worker_str_helper = StringHelper(model, embedding_dir, insertable_cache_size=0)
+
+
+def _featurize_shard(shm_name: str, shape: Tuple[int, int, int], start: int, sentences: List[str]) -> List[bool]:
+    shm: shared_memory.SharedMemory = shared_memory.SharedMemory(name=shm_name)
+    if _uses_own_resource_tracker:
+        # attaching registers the block at the resource tracker of the worker, which would unlink it on exit
+        resource_tracker.unregister(shm._name, 'shared_memory')  # noqa
+    out: Union[np.ndarray, None] = None
+    try:
+        out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        return featurize_into(_worker_str_helper, sentences, shape[1], out[start:start + len(sentences)])
+    finally:
+        out = None  # the buffer must not be referenced anymore when the shared memory gets closed
+        shm.close()
+
+
+class ParallelFeaturizer:
+    def __init__(self, str_helper: StringHelper, workers: int, embedding_dir: str = EMBEDDING_DIR) -> None:
+        """
+        :param str_helper: StringHelper instance (inherited by the workers where fork is available)
+        :param workers: int - amount of worker processes
+        :param embedding_dir: string - directory of the embedding stores, used by workers which can't be forked
+        """
+        global _worker_str_helper
+        self.__str_helper: StringHelper = str_helper
+        self.__workers: int = workers
+
+        context = mp.get_context('fork' if 'fork' in mp.get_all_start_methods() else 'spawn')
+        is_forked: bool = context.get_start_method() == 'fork'
+        if is_forked:
+            # forked workers share the resource tracker of the parent, so it has to run before the pool is created
+            resource_tracker.ensure_running()
+        elif not EmbeddingStore.exists(get_store_dir(str_helper.get_model_name(), embedding_dir)):
+            logging.warning('Every featurization worker has to load the whole word vector model. Export it via '
+                            'python -m utils.embedding_store to share it between the workers.')
+        _worker_str_helper = str_helper
+        # spawned posix workers get their own resource tracker (Windows doesn't track shared memory at all)
+        uses_own_resource_tracker: bool = not is_forked and os.name == 'posix'
+        self.__pool = context.Pool(workers, initializer=_init_worker,
+                                   initargs=(str_helper.get_model(), embedding_dir, uses_own_resource_tracker))
+
+    def featurize(self, sentences: List[str], max_token_length: int) -> Tuple[np.ndarray, List[bool]]:
+        """
+        :param sentences: List[str] - sentences to featurize
+        :param max_token_length: int - maximum token length
+        :return: Tuple[np.ndarray, List[bool]] - features in the order of the sentences and the validity mask
+        """
+        shape: Tuple[int, int, int] = (len(sentences), max_token_length, self.__str_helper.get_dimensions())
+        size: int = max(int(np.prod(shape)) * np.dtype(np.float32).itemsize, 1)
+        shm: shared_memory.SharedMemory = shared_memory.SharedMemory(create=True, size=size)
+        out: Union[np.ndarray, None] = None
+        try:
+            out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+            out.fill(0)
+            shard_size: int = max(math.ceil(len(sentences) / self.__workers), 1)
+            results: list = [self.__pool.apply_async(_featurize_shard,
+                                                     (shm.name, shape, start, sentences[start:start + shard_size]))
+                             for start in range(0, len(sentences), shard_size)]
+            valid: List[bool] = []
+            for result in results:  # the shards are in order, so the mask is too
+                valid.extend(result.get())
+            features: np.ndarray = out.copy()
+        finally:
+            out = None  # the buffer must not be referenced anymore when the shared memory gets closed
+            shm.close()
+            shm.unlink()
+        return features, valid
+
+    def close(self) -> None:
+        self.__pool.close()
+        self.__pool.join()
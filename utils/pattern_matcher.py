@@ -0,0 +1,151 @@
+# Fast path in front of the intent detector: inputs which (almost) literally appear in the patterns of the intent
+# dataset are answered by a hash table / n-gram lookup instead of a forward pass.
+
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import *
+
+
+@dataclass
+class PatternMatch:
+    intent_idx: int
+    confidence: float
+    exact: bool
+
+
+@dataclass
+class PatternMatcherStats:
+    lookups: int
+    exact_hits: int
+    fuzzy_hits: int
+    hit_rate: float
+    saved_ms: float
+
+
+def levenshtein(a: str, b: str) -> int:
+    """
+    :param a: string - first string
+    :param b: string - second string
+    :return: int - minimum amount of insertions, deletions and substitutions to turn a into b
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    previous: List[int] = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current: List[int] = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+class PatternMatcher:
+    def __init__(self, patterns: List[Tuple[str, int]], threshold: float = 0.9, ngram_size: int = 3,
+                 min_fuzzy_length: int = 5, max_candidates: int = 10) -> None:
+        """
+        :param patterns: List[Tuple[str, int]] - pattern and class index of its intent
+        :param threshold: float - minimum similarity (0 - 1) of a fuzzy match, values above 1 disable fuzzy matching
+        :param ngram_size: int - size of the character n-grams used to find fuzzy candidates
+        :param min_fuzzy_length: int - shorter inputs are only matched exactly (e.g. "hi" vs. "hm")
+        :param max_candidates: int - how many candidates are compared via edit distance
+        """
+        self.__threshold: float = threshold
+        self.__ngram_size: int = ngram_size
+        self.__min_fuzzy_length: int = min_fuzzy_length
+        self.__max_candidates: int = max_candidates
+
+        intents_by_pattern: Dict[str, Set[int]] = {}
+        for pattern, intent_idx in patterns:
+            normalized: str = self.normalize(pattern)
+            if normalized:
+                intents_by_pattern.setdefault(normalized, set()).add(intent_idx)
+
+        # patterns which belong to more than one intent are ambiguous and left to the intent detector
+        self.__exact: Dict[str, int] = {pattern: next(iter(intents)) for pattern, intents in
+                                        intents_by_pattern.items() if len(intents) == 1}
+        self.__patterns: List[str] = list(self.__exact.keys())
+        self.__ngram_index: Dict[str, List[int]] = {}
+        for pattern_idx, pattern in enumerate(self.__patterns):
+            for gram in set(self.__ngrams(pattern)):
+                self.__ngram_index.setdefault(gram, []).append(pattern_idx)
+
+        self.__lock: threading.Lock = threading.Lock()
+        self.__lookups: int = 0
+        self.__exact_hits: int = 0
+        self.__fuzzy_hits: int = 0
+        self.__saved_ms: float = 0.0
+        self.__neural_ms: Union[float, None] = None
+
+    @staticmethod
+    def normalize(s: str) -> str:
+        """
+        :param s: string - input or pattern
+        :return: string - lowercased string without punctuation and duplicate whitespace
+        """
+        return ' '.join(re.sub(r'[^\w\s]', ' ', s.lower()).split())
+
+    def __ngrams(self, s: str) -> List[str]:
+        padded: str = f' {s} '
+        return [padded[idx:idx + self.__ngram_size] for idx in range(max(len(padded) - self.__ngram_size + 1, 1))]
+
+    def match(self, s: str) -> Union[PatternMatch, None]:
+        """
+        :param s: string - input of the user
+        :return: PatternMatch if the input matches a pattern with at least the threshold similarity, else None
+        """
+        normalized: str = self.normalize(s)
+        result: Union[PatternMatch, None] = None
+        if normalized in self.__exact:
+            result = PatternMatch(self.__exact[normalized], 1.0, True)
+        elif self.__threshold <= 1 and len(normalized) >= self.__min_fuzzy_length:
+            result = self.__match_fuzzy(normalized)
+
+        with self.__lock:
+            self.__lookups += 1
+            if result is not None:
+                if result.exact:
+                    self.__exact_hits += 1
+                else:
+                    self.__fuzzy_hits += 1
+                if self.__neural_ms is not None:
+                    self.__saved_ms += self.__neural_ms
+        return result
+
+    def __match_fuzzy(self, normalized: str) -> Union[PatternMatch, None]:
+        shared_grams: Counter = Counter()
+        for gram in set(self.__ngrams(normalized)):
+            shared_grams.update(self.__ngram_index.get(gram, []))
+
+        best: Union[PatternMatch, None] = None
+        for pattern_idx, _ in shared_grams.most_common(self.__max_candidates):
+            pattern: str = self.__patterns[pattern_idx]
+            longest: int = max(len(pattern), len(normalized))
+            if 1 - abs(len(pattern) - len(normalized)) / longest < self.__threshold:
+                continue  # the edit distance can't be small enough
+            similarity: float = 1 - levenshtein(pattern, normalized) / longest
+            if similarity >= self.__threshold and (best is None or similarity > best.confidence):
+                best = PatternMatch(self.__exact[pattern], similarity, False)
+        return best
+
+    def record_neural_latency(self, ms: float) -> None:
+        """
+        Tells the matcher how long a forward pass of the intent detector takes per input, so it can report the
+        latency it saved
+        :param ms: float - latency per input in milliseconds
+        :return: None
+        """
+        with self.__lock:
+            self.__neural_ms = ms if self.__neural_ms is None else 0.9 * self.__neural_ms + 0.1 * ms
+
+    def get_stats(self) -> PatternMatcherStats:
+        """
+        :return: PatternMatcherStats - hit rate and saved latency (estimated via the average forward pass latency)
+        """
+        with self.__lock:
+            hits: int = self.__exact_hits + self.__fuzzy_hits
+            return PatternMatcherStats(lookups=self.__lookups, exact_hits=self.__exact_hits,
+                                       fuzzy_hits=self.__fuzzy_hits,
+                                       hit_rate=hits / self.__lookups if self.__lookups else 0.0,
+                                       saved_ms=self.__saved_ms)
@@ -12,11 +12,7 @@ class PluginManager:
         self.__plugin_actions: dict = {}
 
         # Init plugins
-        os.makedirs('plugins', exist_ok=True)
-        for plugin in os.listdir('plugins'):
-            if not plugin.endswith('.py'):
-                continue
-            module_name: str = f'plugins.{plugin[:-3]}'
+        for plugin, module_name in self.get_plugin_modules():
             plugin_data: Callable = self.get_plugin_data(module_name)
             plugin_instance: Any = plugin_data()
 
@@ -37,6 +33,27 @@ class PluginManager:
 
             logging.info(f'Plugin {plugin_name} loaded successfully')
 
+    @staticmethod
+    def get_plugin_modules() -> List[Tuple[str, str]]:
+        """
+        :return: List[Tuple[str, str]] - file and module name of every plugin in the plugins directory
+        """
+        os.makedirs('plugins', exist_ok=True)
+        return [(plugin, f'plugins.{plugin[:-3]}') for plugin in os.listdir('plugins') if plugin.endswith('.py')]
+
+    @staticmethod
+    def import_plugins() -> None:
+        """
+        Imports all plugin modules, so creating the PluginManager later (which needs the classifier) doesn't have to
+        :return: None
+        """
+        for plugin, module_name in PluginManager.get_plugin_modules():
+            try:
+                importlib.import_module(module_name)
+            except Exception as e:
+                # the PluginManager imports it again and raises the error there
+                logging.error(['[PluginManager -> import_plugins]', 'While importing plugin', plugin, e])
+
     def get_plugin_actions(self) -> dict:
         """
         This parses all plugins and returns a dictionary with all actions
@@ -0,0 +1,147 @@
+# Connects actions which wait for the next message of the user (ActionUtils.request_input / request_input_async) with
+# the place the message arrives (e.g. Ui.prompt_response). Waiting coroutines sleep on an asyncio.Future, which is
+# resolved as soon as the response arrives, so there is no polling.
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import threading
+from collections import deque
+from dataclasses import dataclass
+from typing import *
+
+DEFAULT_CONVERSATION: str = 'default'
+
+# conversation of the message an action was triggered by, actions inherit it from ActionHelper.dispatch_action
+current_conversation: contextvars.ContextVar = contextvars.ContextVar('current_conversation',
+                                                                      default=DEFAULT_CONVERSATION)
+
+
+class PromptTimeoutError(Exception):
+    pass
+
+
+class PromptCancelledError(Exception):
+    pass
+
+
+@dataclass(eq=False)
+class _PendingPrompt:
+    loop: Union[asyncio.AbstractEventLoop, None]
+    future: Union[asyncio.Future, None]
+    callback: Union[Callable[[str], None], None]
+
+
+class PromptBroker:
+    def __init__(self) -> None:
+        # oldest prompt first, the next response of a conversation answers its oldest prompt
+        self.__pending: Dict[str, Deque[_PendingPrompt]] = {}
+        self.__lock: threading.Lock = threading.Lock()
+
+    def __add(self, conversation_id: str, prompt: _PendingPrompt) -> None:
+        with self.__lock:
+            self.__pending.setdefault(conversation_id, deque()).append(prompt)
+
+    def __remove(self, conversation_id: str, prompt: _PendingPrompt) -> None:
+        with self.__lock:
+            prompts: Union[Deque[_PendingPrompt], None] = self.__pending.get(conversation_id)
+            if prompts is None or prompt not in prompts:
+                return
+            prompts.remove(prompt)
+            if not prompts:
+                del self.__pending[conversation_id]
+
+    def __pop(self, conversation_id: str) -> Union[_PendingPrompt, None]:
+        with self.__lock:
+            prompts: Union[Deque[_PendingPrompt], None] = self.__pending.get(conversation_id)
+            if not prompts:
+                return None
+            prompt: _PendingPrompt = prompts.popleft()
+            if not prompts:
+                del self.__pending[conversation_id]
+            return prompt
+
+    def has_pending(self, conversation_id: str = DEFAULT_CONVERSATION) -> bool:
+        with self.__lock:
+            return bool(self.__pending.get(conversation_id))
+
+    def get_pending_count(self) -> int:
+        with self.__lock:
+            return sum(len(prompts) for prompts in self.__pending.values())
+
+    def add_callback(self, conversation_id: str, callback: Callable[[str], None]) -> None:
+        """
+        :param conversation_id: string - conversation the response has to come from
+        :param callback: Callable[[str], None] - called with the response on the thread which resolves the prompt
+        :return: None
+        """
+        self.__add(conversation_id, _PendingPrompt(None, None, callback))
+
+    async def wait_for_response(self, conversation_id: str, timeout: Union[float, None] = None,
+                                send_prompt: Union[Callable[[], Union[Awaitable, None]], None] = None) -> str:
+        """
+        :param conversation_id: string - conversation the response has to come from
+        :param timeout: float - seconds to wait for the response, None waits until it arrives
+        :param send_prompt: Callable - shows the prompt to the user, called once the prompt is registered, so even an
+        immediate response can't get lost. If it returns an awaitable (e.g. a blocking call handed to a thread), it is
+        awaited before the timeout starts.
+        :return: str - response of the user
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        prompt: _PendingPrompt = _PendingPrompt(loop, loop.create_future(), None)
+        self.__add(conversation_id, prompt)
+        try:
+            if send_prompt is not None:
+                sent: Union[Awaitable, None] = send_prompt()
+                if inspect.isawaitable(sent):
+                    await sent
+            return await asyncio.wait_for(prompt.future, timeout)
+        except asyncio.TimeoutError:
+            raise PromptTimeoutError(f'No response in conversation {conversation_id} within {timeout} seconds')
+        finally:
+            self.__remove(conversation_id, prompt)
+
+    def resolve(self, conversation_id: str, response: str) -> bool:
+        """
+        Answers the oldest pending prompt of the conversation, can be called from any thread
+        :param conversation_id: string - conversation the response comes from
+        :param response: string - response of the user
+        :return: bool - True if a prompt was waiting for the response
+        """
+        prompt: Union[_PendingPrompt, None] = self.__pop(conversation_id)
+        if prompt is None:
+            return False
+        if prompt.callback is not None:
+            prompt.callback(response)
+        else:
+            prompt.loop.call_soon_threadsafe(self.__set_result, prompt.future, response)
+        return True
+
+    def cancel(self, conversation_id: Union[str, None] = None) -> int:
+        """
+        Fails the pending prompts with a PromptCancelledError, e.g. when the window is closed or a session ends
+        :param conversation_id: string - conversation to cancel, None cancels all conversations
+        :return: int - amount of cancelled prompts
+        """
+        with self.__lock:
+            conversation_ids: List[str] = list(self.__pending) if conversation_id is None else [conversation_id]
+            prompts: List[_PendingPrompt] = [prompt for key in conversation_ids
+                                             for prompt in self.__pending.pop(key, [])]
+        for prompt in prompts:
+            if prompt.future is not None:
+                prompt.loop.call_soon_threadsafe(self.__set_exception, prompt.future,
+                                                 PromptCancelledError('The prompt was cancelled'))
+        if prompts:
+            logging.info(f'Cancelled {len(prompts)} pending prompts')
+        return len(prompts)
+
+    @staticmethod
+    def __set_result(future: asyncio.Future, response: str) -> None:
+        if not future.done():
+            future.set_result(response)
+
+    @staticmethod
+    def __set_exception(future: asyncio.Future, error: Exception) -> None:
+        if not future.done():
+            future.set_exception(error)
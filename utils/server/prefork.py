@@ -0,0 +1,118 @@
+# Pre-fork mode of the server (posix only): the parent process loads the word vectors and the models once, opens the
+# listening socket and forks the workers. The workers share the memory of the parent copy-on-write (the word vectors
+# of an EmbeddingStore are even shared through the page cache of their memory map), so every extra worker only needs
+# memory for its own threads, caches and connections. The kernel distributes the connections between the workers.
+
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from typing import *
+
+# a worker which dies within this amount of seconds after its start isn't restarted (e.g. a broken config)
+MIN_WORKER_LIFETIME_S: float = 5.0
+
+
+def create_listening_socket(host: str, port: int, backlog: int = 1024) -> socket.socket:
+    """
+    :param host: string - interface to listen on
+    :param port: int - port to listen on
+    :param backlog: int - maximum amount of pending connections
+    :return: socket.socket - listening socket which is inherited by the workers
+    """
+    family: int = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class PreforkServer:
+    def __init__(self, run_worker: Callable[[int, socket.socket], None], workers: int) -> None:
+        """
+        :param run_worker: Callable - called in every worker with its index and the listening socket, serves until the
+        worker receives SIGTERM
+        :param workers: int - amount of worker processes
+        """
+        if not hasattr(os, 'fork'):
+            raise Exception('The pre-fork mode of the server needs os.fork, which is only available on posix systems.')
+        if workers < 1:
+            raise Exception('The pre-fork mode needs at least 1 worker.')
+        self.__run_worker: Callable[[int, socket.socket], None] = run_worker
+        self.__workers: int = workers
+        self.__children: Dict[int, Tuple[int, float]] = {}  # pid -> (worker index, start time)
+        self.__stopping: bool = False
+
+    def serve(self, host: str, port: int) -> None:
+        """
+        Forks the workers and restarts the ones which die until the parent receives SIGINT or SIGTERM
+        :param host: string - interface to listen on
+        :param port: int - port to listen on
+        :return: None
+        """
+        sock: socket.socket = create_listening_socket(host, port)
+        # Objects which exist now are never freed by the workers, keeping them out of the garbage collector avoids
+        # that collections in the workers write to (and thereby copy) the pages of the parent
+        gc.collect()
+        gc.freeze()
+
+        signal.signal(signal.SIGTERM, self.__stop)
+        signal.signal(signal.SIGINT, self.__stop)
+        for idx in range(self.__workers):
+            self.__spawn(idx, sock)
+        print(f'Serving on http://{host}:{port} with {self.__workers} workers (parent pid {os.getpid()})')
+
+        while self.__children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            except InterruptedError:
+                continue
+            if pid not in self.__children:
+                continue
+            idx, started = self.__children.pop(pid)
+            if self.__stopping:
+                continue
+            logging.error(['[PreforkServer -> serve]', 'Worker', idx, 'exited with status', status])
+            if time.monotonic() - started < MIN_WORKER_LIFETIME_S:
+                logging.error(['[PreforkServer -> serve]', 'Worker', idx, 'died right after its start, stopping'])
+                self.__stop()
+                continue
+            self.__spawn(idx, sock)
+        sock.close()
+
+    def __spawn(self, idx: int, sock: socket.socket) -> None:
+        pid: int = os.fork()
+        if pid:
+            self.__children[pid] = (idx, time.monotonic())
+            return
+        # worker: default signal handling, aiohttp installs its own handlers for a graceful shutdown
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        code: int = 0
+        try:
+            self.__run_worker(idx, sock)
+        except BaseException as e:
+            logging.error(['[PreforkServer -> worker]', 'Worker', idx, e])
+            code = 1
+        finally:
+            # never return into the loop of the parent
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def __stop(self, *_: Any) -> None:
+        if self.__stopping:
+            return
+        self.__stopping = True
+        for pid in list(self.__children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
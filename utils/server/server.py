@@ -0,0 +1,296 @@
+# Headless HTTP/WebSocket server which runs the same classify -> action -> response pipeline as the desktop UI, e.g. for
+# Arduinos or mobile apps. Every WebSocket connection and every HTTP session has its own conversation state (see
+# utils/session_store.py).
+#
+# HTTP:      POST /message {"message": "...", "session_id": "..."} -> {"session_id": "...", "response": "...",
+#            "events": [...]}, the session_id of the answer has to be sent with the next message of the conversation
+#            (without http_sessions, e.g. in the pre-fork mode, every request is a conversation of its own)
+# WebSocket: GET /ws, send {"message": "..."} (or plain text), every event is sent as JSON
+# Events:    {"type": "response", "response": "..."}, {"type": "prompt", "prompt": "..."} (an action waits for the next
+#            message), {"type": "message", "message": "..."} and {"type": "script", "script": "..."}
+
+import asyncio
+import json
+import logging
+import os
+import socket
+import uuid
+from dataclasses import dataclass, field
+from typing import *
+
+from aiohttp import web, WSMsgType
+
+from utils.action_helper.action_helper import ActionHelper
+from utils.action_utils import TriggerInfos, current_channel
+from utils.config_helper import ConfigHelper
+from utils.intent_classifier import Classifier, Prediction
+from utils.prompt_broker import PromptBroker, current_conversation
+from utils.session_store import SessionState, SessionStore
+from utils.string_helper import FeaturizedMessage
+
+# events which end the answer to an HTTP request
+FINAL_EVENTS: Tuple[str, ...] = ('response', 'prompt')
+
+
+class ServerChannel:
+    def __init__(self, session_id: str, loop: asyncio.AbstractEventLoop, prompts: PromptBroker) -> None:
+        """
+        Connection between the actions of one session and its client. Actions run on other threads, so every event is
+        handed over to the event loop of the server.
+        :param session_id: string - id of the session, also used as conversation id of the prompts
+        :param loop: asyncio.AbstractEventLoop - event loop of the server
+        :param prompts: PromptBroker - pending prompts of all sessions
+        """
+        self.__session_id: str = session_id
+        self.__loop: asyncio.AbstractEventLoop = loop
+        self.__prompts: PromptBroker = prompts
+        self.__events: asyncio.Queue = asyncio.Queue()
+
+    def push(self, event: dict) -> None:
+        """
+        Queues an event for the client, can be called from any thread
+        :param event: dict - event with at least a type
+        :return: None
+        """
+        self.__loop.call_soon_threadsafe(self.__events.put_nowait, event)
+
+    async def get_event(self) -> dict:
+        return await self.__events.get()
+
+    def send_message(self, message: str) -> None:
+        self.push({'type': 'message', 'message': message})
+
+    def evaluate_js(self, script: str) -> None:
+        # actions written for the desktop UI call JavaScript functions of the chat (e.g. clear_chat()), the client
+        # decides what to do with them
+        self.push({'type': 'script', 'script': script})
+
+    def request_next_message(self, prompt: str, callback: Callable[[str], None]) -> None:
+        self.__prompts.add_callback(self.__session_id, callback)
+        self.push({'type': 'prompt', 'prompt': prompt})
+
+    async def request_next_message_async(self, prompt: str, timeout: Union[float, None] = None) -> str:
+        return await self.__prompts.wait_for_response(self.__session_id, timeout,
+                                                      lambda: self.push({'type': 'prompt', 'prompt': prompt}))
+
+    def cancel_prompts(self, conversation_id: str) -> int:
+        return self.__prompts.cancel(conversation_id)
+
+
+@dataclass
+class ServerSession:
+    # connection of a session, its conversation state is kept in the SessionStore
+    session_id: str
+    channel: ServerChannel
+    # one HTTP request per session at a time, so the events of a request don't end up in the answer of another one
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class Server:
+    def __init__(self, config_helper: ConfigHelper, classifier: Classifier, action_helper: ActionHelper,
+                 session_store: Union[SessionStore, None] = None, http_sessions: bool = True) -> None:
+        """
+        :param config_helper: ConfigHelper instance
+        :param classifier: Classifier - classifies the messages
+        :param action_helper: ActionHelper - runs the actions
+        :param session_store: SessionStore - conversation state, default is a store with the settings of config.json
+        :param http_sessions: bool - whether HTTP requests can continue a conversation via its session_id. The workers
+        of the pre-fork mode don't share their sessions and the next request can reach any of them, so there every
+        HTTP request is answered on its own and multi-turn conversations need a WebSocket.
+        """
+        self.__config_helper: ConfigHelper = config_helper
+        self.__classifier: Classifier = classifier
+        self.__action_helper: ActionHelper = action_helper
+        self.__prompts: PromptBroker = PromptBroker()
+        self.__sessions: Dict[str, ServerSession] = {}
+        self.__store: SessionStore = session_store or SessionStore.from_config(config_helper)
+        self.__store.set_on_evict(self.__on_session_evicted)
+        self.__http_sessions: bool = http_sessions
+        self.__loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.__sweeper: Union[asyncio.Task, None] = None
+
+    def create_app(self) -> web.Application:
+        app: web.Application = web.Application()
+        app.router.add_get('/health', self.__handle_health)
+        app.router.add_post('/message', self.__handle_http_message)
+        app.router.add_get('/ws', self.__handle_websocket)
+        app.on_startup.append(self.__on_startup)
+        app.on_shutdown.append(self.__on_shutdown)
+        return app
+
+    def run(self, host: Union[str, None] = None, port: Union[int, None] = None,
+            sock: Union[socket.socket, None] = None) -> None:
+        """
+        Serves until the process is stopped (Ctrl+C or SIGTERM)
+        :param host: string - interface to listen on
+        :param port: int - port to listen on
+        :param sock: socket.socket - already listening socket (e.g. shared by the workers of the pre-fork mode), used
+        instead of host and port
+        :return: None
+        """
+        keepalive_timeout: Union[float, None] = self.__config_helper.get_config_setting('server_keepalive_timeout')
+        web.run_app(self.create_app(), host=None if sock else host, port=None if sock else port, sock=sock,
+                    keepalive_timeout=keepalive_timeout if keepalive_timeout is not None else 75,
+                    print=None if sock else print)
+
+    def get_session_store(self) -> SessionStore:
+        return self.__store
+
+    async def __on_startup(self, _: web.Application) -> None:
+        self.__loop = asyncio.get_running_loop()
+        restored: int = self.__store.load_snapshot()
+        if restored:
+            logging.info(f'Restored {restored} sessions')
+        self.__sweeper = asyncio.ensure_future(self.__sweep_sessions())
+
+    async def __on_shutdown(self, _: web.Application) -> None:
+        if self.__sweeper is not None:
+            self.__sweeper.cancel()
+        self.__prompts.cancel()
+        self.__sessions.clear()
+        self.__store.snapshot()
+
+    async def __sweep_sessions(self) -> None:
+        # evicts expired sessions and updates the snapshot once a minute
+        while True:
+            await asyncio.sleep(60)
+            try:
+                self.__store.evict_expired()
+                self.__store.snapshot()
+            except Exception as e:
+                logging.error(['[Server -> sweep_sessions]', e])
+
+    def __on_session_evicted(self, state: SessionState) -> None:
+        # nobody answered for session_ttl_seconds (or the store is full), so its prompts are given up as well
+        self.__prompts.cancel(state.session_id)
+        self.__sessions.pop(state.session_id, None)
+
+    def __create_session(self, session_id: Union[str, None] = None) -> ServerSession:
+        session_id = session_id or uuid.uuid4().hex
+        session: ServerSession = ServerSession(session_id, ServerChannel(session_id, self.__loop, self.__prompts))
+        self.__sessions[session_id] = session
+        # the connection is removed together with its state, when the state is evicted
+        self.__store.get_or_create(session_id)
+        return session
+
+    def __close_session(self, session: ServerSession) -> None:
+        self.__prompts.cancel(session.session_id)
+        self.__sessions.pop(session.session_id, None)
+        self.__store.remove(session.session_id)
+
+    def __classify(self, message: str) -> Tuple[FeaturizedMessage, Prediction]:
+        # embed the message only once, actions using the TokenDetector get it via TriggerInfos
+        featurized: FeaturizedMessage = self.__classifier.featurize(message)
+        return featurized, self.__classifier.classify(featurized)
+
+    def __get_error_str(self) -> str:
+        error_str: str = self.__config_helper.get_config_setting('classifier_error_str')
+        return error_str or 'Sorry, I did not understand that. Maybe your input was too long.'
+
+    def handle_message(self, session: ServerSession, message: str) -> None:
+        """
+        Answers a pending prompt of the session or starts the pipeline for the message, the result arrives as events
+        :param session: ServerSession - session the message belongs to
+        :param message: string - message of the client
+        :return: None
+        """
+        if self.__prompts.resolve(session.session_id, message):
+            return
+        asyncio.ensure_future(self.__process_message(session, message))
+
+    async def __process_message(self, session: ServerSession, message: str) -> None:
+        try:
+            result: Any = await self.__run_pipeline(session, message)
+        except Exception as e:
+            logging.error(['[Server -> process_message]', 'While answering', session.session_id, e])
+            result = self.__get_error_str()
+        session.channel.push({'type': 'response', 'response': result if result else None})
+
+    async def __run_pipeline(self, session: ServerSession, message: str) -> Any:
+        try:
+            # the classifier blocks, so it runs in the default thread pool (concurrent messages are batched by the
+            # inference scheduler)
+            featurized, classified = await asyncio.get_running_loop().run_in_executor(None, self.__classify, message)
+        except (Exception,):
+            return self.__get_error_str()
+
+        state: SessionState = self.__store.get_or_create(session.session_id)
+        trigger_infos: TriggerInfos = state.build_trigger_infos(session.channel, featurized)
+        # this task has its own context, the action inherits it from dispatch_action
+        current_channel.set(session.channel)
+        current_conversation.set(session.session_id)
+        result: Any = await asyncio.wrap_future(self.__action_helper.dispatch_action(message,
+                                                                                     classified.action,
+                                                                                     classified.main_str,
+                                                                                     classified.error_str,
+                                                                                     trigger_infos))
+        state.remember(message, featurized,
+                       classified.action if self.__action_helper.action_exists(classified.action) else None)
+        return result
+
+    @staticmethod
+    async def __handle_health(_: web.Request) -> web.Response:
+        # the pid shows which worker answered in the pre-fork mode
+        return web.json_response({'status': 'ok', 'pid': os.getpid()})
+
+    async def __handle_http_message(self, request: web.Request) -> web.Response:
+        try:
+            data: dict = await request.json()
+        except (Exception,):
+            raise web.HTTPBadRequest(text='The body has to be JSON like {"message": "..."}')
+        message: Any = data.get('message')
+        if not isinstance(message, str) or not message:
+            raise web.HTTPBadRequest(text='message is missing')
+
+        session_id: Union[str, None] = data.get('session_id')
+        if session_id and not self.__http_sessions:
+            raise web.HTTPBadRequest(text='This server has several workers which don\'t share their sessions, so HTTP '
+                                          'requests can\'t continue a conversation. Send the message without a '
+                                          'session_id or use /ws for multi-turn conversations.')
+        session: Union[ServerSession, None] = self.__sessions.get(session_id) if session_id else None
+        if session is None:
+            session = self.__create_session(session_id)
+
+        try:
+            async with session.lock:
+                self.handle_message(session, message)
+                events: List[dict] = []
+                while not events or events[-1]['type'] not in FINAL_EVENTS:
+                    events.append(await session.channel.get_event())
+        finally:
+            if not self.__http_sessions:
+                # nobody can answer a prompt of this request, so it is cancelled instead of waiting forever
+                self.__close_session(session)
+        answer: dict = {'session_id': session.session_id if self.__http_sessions else None, 'events': events}
+        answer.update({key: value for key, value in events[-1].items() if key != 'type'})
+        return web.json_response(answer)
+
+    async def __handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        heartbeat: Union[float, None] = self.__config_helper.get_config_setting('server_heartbeat')
+        ws: web.WebSocketResponse = web.WebSocketResponse(heartbeat=heartbeat)
+        await ws.prepare(request)
+
+        session: ServerSession = self.__create_session()
+        await ws.send_json({'type': 'session', 'session_id': session.session_id})
+
+        async def send_events() -> None:
+            while True:
+                await ws.send_json(await session.channel.get_event())
+
+        sender: asyncio.Task = asyncio.ensure_future(send_events())
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                try:
+                    message: Any = json.loads(msg.data).get('message')
+                except (ValueError, AttributeError):
+                    message = msg.data  # plain text
+                if isinstance(message, str) and message:
+                    self.handle_message(session, message)
+        except Exception as e:
+            logging.error(['[Server -> handle_websocket]', 'While reading from', session.session_id, e])
+        finally:
+            sender.cancel()
+            self.__close_session(session)
+        return ws
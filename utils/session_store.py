@@ -0,0 +1,226 @@
+# Conversation state (last action, last input, ...) of every session, used by the Ui and the server to build the
+# TriggerInfos of an action. Sessions which weren't used for ttl_seconds are evicted, if the store is full the least
+# recently used session is evicted. The store can be written to a JSON snapshot and restored from it.
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import *
+
+from utils.action_utils import TriggerInfos
+from utils.config_helper import ConfigHelper
+from utils.string_helper import FeaturizedMessage
+
+SNAPSHOT_VERSION: int = 1
+
+
+@dataclass
+class SessionState:
+    session_id: str
+    last_action: Union[str, None] = None
+    last_input: Union[str, None] = None
+    # embedded last input, not part of the snapshots (actions fall back to last_input)
+    last_message: Union[FeaturizedMessage, None] = None
+    created_at: float = field(default_factory=time.time)
+    last_seen: float = field(default_factory=time.time)
+
+    def build_trigger_infos(self, ui: Any, message: Union[FeaturizedMessage, None] = None) -> TriggerInfos:
+        """
+        :param ui: Any - window or channel of the session (see TriggerInfos.ui)
+        :param message: FeaturizedMessage - embedded current input
+        :return: TriggerInfos - infos for the action of the current input
+        """
+        return TriggerInfos(ui=ui, last_action=self.last_action, last_input=self.last_input, message=message,
+                            last_message=self.last_message)
+
+    def remember(self, input_str: str, message: Union[FeaturizedMessage, None], action_key: Union[str, None]) -> None:
+        """
+        Saves the input after its action ran
+        :param input_str: string - input of the user
+        :param message: FeaturizedMessage - embedded input
+        :param action_key: string - action which answered the input, None if it isn't an action
+        :return: None
+        """
+        self.last_input = input_str
+        self.last_message = message
+        # repeating the last action doesn't change which action is repeated next time
+        if action_key != 'repeat':
+            self.last_action = action_key
+        self.last_seen = time.time()
+
+    def to_dict(self) -> dict:
+        return {'session_id': self.session_id, 'last_action': self.last_action, 'last_input': self.last_input,
+                'created_at': self.created_at, 'last_seen': self.last_seen}
+
+
+class SessionStore:
+    def __init__(self, ttl_seconds: Union[float, None] = 1800, max_sessions: int = 10000,
+                 snapshot_path: Union[str, None] = None,
+                 on_evict: Union[Callable[[SessionState], None], None] = None) -> None:
+        """
+        :param ttl_seconds: float - sessions which weren't used for this amount of seconds are evicted, None keeps them
+        :param max_sessions: int - maximum amount of sessions, the least recently used one is evicted first
+        :param snapshot_path: string - JSON file used by snapshot() and load_snapshot(), None disables snapshots
+        :param on_evict: Callable - called with every evicted session (e.g. to cancel its pending prompts)
+        """
+        if max_sessions < 1:
+            raise Exception('max_sessions of the session store must be at least 1.')
+        self.__ttl: Union[float, None] = ttl_seconds
+        self.__max_sessions: int = max_sessions
+        self.__snapshot_path: Union[str, None] = snapshot_path
+        self.__on_evict: Union[Callable[[SessionState], None], None] = on_evict
+        # least recently used session first
+        self.__sessions: OrderedDict[str, SessionState] = OrderedDict()
+        self.__lock: threading.Lock = threading.Lock()
+
+    @staticmethod
+    def from_config(config_helper: ConfigHelper, on_evict: Union[Callable[[SessionState], None], None] = None,
+                    ttl_setting: str = 'session_ttl_seconds') -> 'SessionStore':
+        """
+        Creates a store with session_ttl_seconds, session_max_count and session_snapshot_path of config.json
+        :param config_helper: ConfigHelper instance
+        :param on_evict: Callable - called with every evicted session
+        :param ttl_setting: string - setting which holds the ttl (e.g. desktop_session_ttl_seconds for the desktop
+                            app), a missing setting keeps the sessions until the store is full
+        :return: SessionStore
+        """
+        max_sessions: Union[int, None] = config_helper.get_config_setting('session_max_count')
+        return SessionStore(ttl_seconds=config_helper.get_config_setting(ttl_setting),
+                            max_sessions=max_sessions if max_sessions is not None else 10000,
+                            snapshot_path=config_helper.get_config_setting('session_snapshot_path'),
+                            on_evict=on_evict)
+
+    def set_on_evict(self, on_evict: Union[Callable[[SessionState], None], None]) -> None:
+        self.__on_evict = on_evict
+
+    def __is_expired(self, state: SessionState, now: float) -> bool:
+        return self.__ttl is not None and now - state.last_seen > self.__ttl
+
+    def __evicted(self, states: List[SessionState]) -> None:
+        # called without holding the lock, so the callback can use the store
+        if self.__on_evict is None:
+            return
+        for state in states:
+            try:
+                self.__on_evict(state)
+            except Exception as e:
+                logging.error(['[SessionStore -> evict]', 'While evicting', state.session_id, e])
+
+    def get(self, session_id: str) -> Union[SessionState, None]:
+        """
+        :param session_id: string - id of the session
+        :return: SessionState or None if the session doesn't exist (anymore)
+        """
+        evicted: List[SessionState] = []
+        with self.__lock:
+            state: Union[SessionState, None] = self.__sessions.get(session_id)
+            if state is not None and self.__is_expired(state, time.time()):
+                evicted.append(self.__sessions.pop(session_id))
+                state = None
+            if state is not None:
+                state.last_seen = time.time()
+                self.__sessions.move_to_end(session_id)
+        self.__evicted(evicted)
+        return state
+
+    def get_or_create(self, session_id: str) -> SessionState:
+        """
+        :param session_id: string - id of the session
+        :return: SessionState - the existing session or a new one
+        """
+        state: Union[SessionState, None] = self.get(session_id)
+        if state is not None:
+            return state
+        evicted: List[SessionState] = []
+        with self.__lock:
+            state = self.__sessions.get(session_id)  # another thread might have created it in the meantime
+            if state is None:
+                state = SessionState(session_id)
+                self.__sessions[session_id] = state
+                while len(self.__sessions) > self.__max_sessions:
+                    evicted.append(self.__sessions.popitem(last=False)[1])
+        self.__evicted(evicted)
+        return state
+
+    def remove(self, session_id: str) -> Union[SessionState, None]:
+        """
+        Removes a session without calling on_evict (e.g. when its connection is closed)
+        :param session_id: string - id of the session
+        :return: SessionState or None if the session didn't exist
+        """
+        with self.__lock:
+            return self.__sessions.pop(session_id, None)
+
+    def evict_expired(self) -> int:
+        """
+        :return: int - amount of evicted sessions
+        """
+        now: float = time.time()
+        with self.__lock:
+            expired: List[str] = [key for key, state in self.__sessions.items() if self.__is_expired(state, now)]
+            evicted: List[SessionState] = [self.__sessions.pop(key) for key in expired]
+        self.__evicted(evicted)
+        return len(evicted)
+
+    def __len__(self) -> int:
+        with self.__lock:
+            return len(self.__sessions)
+
+    def snapshot(self, path: Union[str, None] = None) -> bool:
+        """
+        Writes all sessions (without their embedded messages) as JSON
+        :param path: string - path of the snapshot, default is snapshot_path
+        :return: bool - False if snapshots are disabled
+        """
+        path = path or self.__snapshot_path
+        if not path:
+            return False
+        with self.__lock:
+            sessions: List[dict] = [state.to_dict() for state in self.__sessions.values()]
+        directory: str = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # write into a temporary file first, so a crash doesn't leave a half written snapshot
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': SNAPSHOT_VERSION, 'sessions': sessions}, ensure_ascii=False))
+        os.replace(path + '.tmp', path)
+        return True
+
+    def load_snapshot(self, path: Union[str, None] = None) -> int:
+        """
+        Restores the sessions of a snapshot, expired sessions are skipped
+        :param path: string - path of the snapshot, default is snapshot_path
+        :return: int - amount of restored sessions
+        """
+        path = path or self.__snapshot_path
+        if not path or not os.path.isfile(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data: dict = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(['[SessionStore -> load_snapshot]', 'While reading', path, e])
+            return 0
+        if data.get('version') != SNAPSHOT_VERSION:
+            logging.warning(f'Session snapshot {path} has an unknown version. Skipping...')
+            return 0
+
+        now: float = time.time()
+        states: List[SessionState] = [SessionState(entry['session_id'], entry.get('last_action'),
+                                                   entry.get('last_input'), None,
+                                                   entry.get('created_at', now), entry.get('last_seen', now))
+                                      for entry in data.get('sessions', [])]
+        # oldest first, so the order of the snapshot is the LRU order again
+        states = sorted([state for state in states if not self.__is_expired(state, now)],
+                        key=lambda state: state.last_seen)[-self.__max_sessions:]
+        with self.__lock:
+            for state in states:
+                self.__sessions[state.session_id] = state
+                self.__sessions.move_to_end(state.session_id)
+            while len(self.__sessions) > self.__max_sessions:
+                self.__sessions.popitem(last=False)
+            return sum(1 for state in states if state.session_id in self.__sessions)
@@ -0,0 +1,147 @@
+# Runs the startup as a graph of phases: every phase starts as soon as the phases it depends on are done, so independent
+# work (e.g. loading the word vectors and deserializing the intent detector) overlaps. Every phase is timed.
+
+import json
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import *
+
+
+@dataclass
+class PhaseTiming:
+    name: str
+    depends_on: List[str]
+    start_s: float  # seconds since the pipeline was created
+    duration_s: float
+    thread: str
+
+
+@dataclass
+class _Phase:
+    name: str
+    fn: Callable[[Dict[str, Any]], Any]
+    depends_on: List[str]
+
+
+class StartupPipeline:
+    def __init__(self, max_workers: int = 4) -> None:
+        """
+        :param max_workers: int - how many phases can run at the same time
+        """
+        self.__max_workers: int = max_workers
+        self.__phases: Dict[str, _Phase] = {}
+        self.__results: Dict[str, Any] = {}
+        self.__timings: List[PhaseTiming] = []
+        self.__lock: threading.Lock = threading.Lock()
+        self.__start: float = time.perf_counter()
+
+    def add_phase(self, name: str, fn: Callable[[Dict[str, Any]], Any], depends_on: Sequence[str] = ()) -> None:
+        """
+        :param name: string - unique name of the phase
+        :param fn: Callable - gets the results of all finished phases (by name) and returns the result of this phase
+        :param depends_on: Sequence[str] - phases which have to be finished before this one starts
+        :return: None
+        """
+        if name in self.__phases:
+            raise Exception(f'Startup phase {name} already exists')
+        self.__phases[name] = _Phase(name, fn, list(depends_on))
+
+    def __check_graph(self) -> None:
+        for phase in self.__phases.values():
+            for dependency in phase.depends_on:
+                if dependency not in self.__phases and dependency not in self.__results:
+                    raise Exception(f'Startup phase {phase.name} depends on the unknown phase {dependency}')
+        # Kahn's algorithm, everything which is left over is part of a cycle
+        remaining: Dict[str, Set[str]] = {name: {dependency for dependency in phase.depends_on
+                                                 if dependency in self.__phases}
+                                          for name, phase in self.__phases.items()}
+        while True:
+            ready: List[str] = [name for name, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                break
+            for name in ready:
+                del remaining[name]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
+        if remaining:
+            raise Exception(f'The startup phases {sorted(remaining)} depend on each other')
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Runs all added phases. If a phase fails, no new phases are started and its error is raised.
+        :return: Dict[str, Any] - results of all phases by name
+        """
+        self.__check_graph()
+        pending: Dict[str, _Phase] = dict(self.__phases)
+        self.__phases = {}
+        running: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.__max_workers, thread_name_prefix='startup') as executor:
+            while pending or running:
+                for name, phase in list(pending.items()):
+                    if all(dependency in self.__results for dependency in phase.depends_on):
+                        del pending[name]
+                        running[executor.submit(self.__run_phase, phase)] = name
+                done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name: str = running.pop(future)
+                    error: Union[BaseException, None] = future.exception()
+                    if error is not None:
+                        logging.error(['[StartupPipeline -> run]', 'Startup phase', name, 'failed', error])
+                        for other in running:
+                            other.cancel()
+                        raise error
+                    self.__results[name] = future.result()
+        return dict(self.__results)
+
+    def __run_phase(self, phase: _Phase) -> Any:
+        with self.measure(phase.name, phase.depends_on):
+            return phase.fn(dict(self.__results))
+
+    @contextmanager
+    def measure(self, name: str, depends_on: Sequence[str] = ()) -> Iterator[None]:
+        """
+        Times work which doesn't run inside the pipeline (e.g. phases which have to run on the main thread)
+        :param name: string - name of the phase
+        :param depends_on: Sequence[str] - phases it depends on (only used for the report)
+        :return: Iterator[None]
+        """
+        start: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            timing: PhaseTiming = PhaseTiming(name, list(depends_on), start - self.__start,
+                                              time.perf_counter() - start, threading.current_thread().name)
+            with self.__lock:
+                self.__timings.append(timing)
+            logging.info(f'Startup phase {name} took {timing.duration_s:.3f} seconds')
+
+    def get_timings(self) -> List[PhaseTiming]:
+        """
+        :return: List[PhaseTiming] - timings of all finished phases, sorted by their start
+        """
+        with self.__lock:
+            return sorted(self.__timings, key=lambda timing: timing.start_s)
+
+    def get_total(self) -> float:
+        """
+        :return: float - seconds since the pipeline was created
+        """
+        return time.perf_counter() - self.__start
+
+    def print_report(self) -> None:
+        print(f'{"phase":<20}{"start (s)":>12}{"duration (s)":>15}  thread')
+        for timing in self.get_timings():
+            print(f'{timing.name:<20}{timing.start_s:>12.3f}{timing.duration_s:>15.3f}  {timing.thread}')
+
+    def write_profile(self, path: str) -> None:
+        """
+        :param path: string - path of the JSON file
+        :return: None
+        """
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'total_s': self.get_total(),
+                                'phases': [asdict(timing) for timing in self.get_timings()]}, indent=4))
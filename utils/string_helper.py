@@ -1,11 +1,22 @@
-import gensim.downloader as gensim_api
 import numpy as np
 import nltk
 from nltk import word_tokenize
 from dataclasses import dataclass
+from typing import *
+import json
+import logging
+import os
+
+from utils.embedding_store import EmbeddingStore, EMBEDDING_DIR, get_store_dir
+from utils.lru_cache import LRUCache, CacheStats
 
 nltk.download('punkt', quiet=True)
 
+CATALOG_PATH: str = 'datasets/word2vec_catalog.json'
+CATALOG_VERSION: int = 1
+# used if embedding_model is not set in config.json
+DEFAULT_MODEL_NAME: str = 'glove-wiki-gigaword-200'
+
 
 @dataclass
 class Model:
@@ -16,34 +27,64 @@ class Model:
 
 
 class Word2VecModels:
-    def __init__(self) -> None:
-        all_models: list = []
-        model_data: dict = gensim_api.info()
+    def __init__(self, catalog_path: str = CATALOG_PATH, refresh: bool = False) -> None:
+        """
+        Word vector models sorted by size. They are read from a local catalog file, so the startup works offline and the
+        list doesn't change if the gensim catalog changes.
+        :param catalog_path: string - path to the catalog file
+        :param refresh: bool - fetch the current gensim catalog and overwrite the catalog file with it
+        """
+        if refresh or not os.path.isfile(catalog_path):
+            self.refresh_catalog(catalog_path)
+        with open(catalog_path, 'r', encoding='utf-8') as f:
+            catalog: dict = json.load(f)
+        if catalog.get('version') != CATALOG_VERSION:
+            raise Exception(f'Unsupported version {catalog.get("version")} of {catalog_path}, run BaxterLite with '
+                            f'--refresh-catalog to create a new one')
+
+        all_models: list = sorted([(model['name'], model['file_size'], model['dimensions'])
+                                   for model in catalog['models']], key=lambda x: x[1])
+        if len(all_models) <= 0:
+            raise Exception('No models found')
+
         self.__models: dict = {}
+        for idx, model in enumerate(all_models):
+            self.__models[idx] = Model(model[0], model[1], model[2])
 
+    @staticmethod
+    def refresh_catalog(catalog_path: str = CATALOG_PATH) -> None:
+        """
+        Fetches the model list of gensim and writes it to the catalog file
+        :param catalog_path: string - path to the catalog file
+        :return: None
+        """
+        import gensim.downloader as gensim_api
+        model_data: dict = gensim_api.info()
+        models: List[dict] = []
         for model_name in model_data['models']:
             # We check this in try-except because some models are only for test purposes, so
             # they don't have the required attributes
             try:
-                name: str = str(model_name)
                 model: dict = model_data['models'][model_name]
-                all_models.append((name, model['file_size'], model['parameters']['dimension']))
+                models.append({'name': str(model_name), 'file_size': model['file_size'],
+                               'dimensions': model['parameters']['dimension']})
             except (KeyError,):
                 pass
-
-        if len(all_models) <= 0:
+        if len(models) <= 0:
             raise Exception('No models found')
-        all_models: list = sorted(all_models, key=lambda x: x[1])
 
-        for idx, model in enumerate(all_models):
-            self.__models[idx] = Model(model[0], model[1], model[2])
+        os.makedirs(os.path.dirname(catalog_path) or '.', exist_ok=True)
+        with open(catalog_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'version': CATALOG_VERSION, 'source': 'gensim-data',
+                                'models': sorted(models, key=lambda x: x['file_size'])}, indent=4))
+        logging.info(f'Wrote {len(models)} models to {catalog_path}')
 
     def get_model_by_name(self, name: str) -> Model:
         """
         :param name: string - name of the target model
         :return: StringHelper.Model - returns model with the target name
         """
-        for model in self.__models:
+        for model in self.__models.values():
             if model.name == name:
                 return model
         raise Exception(f'No model with the name {name} found')
@@ -53,7 +94,7 @@ class Word2VecModels:
         :param size: int - size of the target model
         :return: StringHelper.Model - returns target model
         """
-        for model in self.__models:
+        for model in self.__models.values():
             if model.size == size:
                 return model
         raise Exception(f'No model with the size {size} found')
@@ -79,10 +120,60 @@ class Word2VecModels:
 
 
 class StringHelper:
-    def __init__(self, model: Model) -> None:
-        self.__model: Model = model
-        self.wv: dict = gensim_api.load(model.name)
+    def __init__(self, model: Model, embedding_dir: str = EMBEDDING_DIR, stem_cache_size: int = 50_000,
+                 insertable_cache_size: int = 512) -> None:
+        """
+        :param model: Model - word vector model to use
+        :param embedding_dir: string - directory of the exported embedding stores (see utils/embedding_store.py). If
+                              the model was exported, it is memory-mapped instead of loading the whole gensim model.
+        :param stem_cache_size: int - how many stemmed tokens are cached (0 disables the cache)
+        :param insertable_cache_size: int - how many sentence tensors are cached (0 disables the cache)
+        """
+        self.__embedding_dir: str = embedding_dir
         self.__stemmer: nltk.PorterStemmer = nltk.PorterStemmer()
+        self.__ignored_tokens: Set[str] = {'?', '!', '.', ','}
+
+        self.__stem_cache: LRUCache = LRUCache(stem_cache_size)
+        self.__insertable_cache: LRUCache = LRUCache(insertable_cache_size)
+
+        self.set_model(model)
+
+    def set_model(self, model: Model) -> None:
+        """
+        Loads the vectors of a word vector model and invalidates all caches which depend on the old one
+        :param model: Model - word vector model to use
+        :return: None
+        """
+        self.__model: Model = model
+        store_dir: str = get_store_dir(model.name, self.__embedding_dir)
+        if EmbeddingStore.exists(store_dir):
+            self.wv: Union[EmbeddingStore, Any] = EmbeddingStore(store_dir)
+        else:
+            logging.info(f'No embedding store for {model.name} found in {self.__embedding_dir}, loading the gensim '
+                         f'model. Run python -m utils.embedding_store --model {model.name} for a faster startup.')
+            import gensim.downloader as gensim_api  # importing gensim is slow and not needed for embedding stores
+            self.wv: Union[EmbeddingStore, Any] = gensim_api.load(model.name)
+        # gensim KeyedVectors and EmbeddingStore both expose the matrix and the word -> row mapping
+        self.__vectors: np.ndarray = self.wv.vectors
+        self.__key_to_index: Dict[str, int] = self.wv.key_to_index
+        self.clear_caches(keep_stems=True)
+
+    def clear_caches(self, keep_stems: bool = False) -> None:
+        """
+        Invalidates the caches, e.g. after the embedding model changed
+        :param keep_stems: bool - stems don't depend on the embedding model, so they can be kept
+        :return: None
+        """
+        if not keep_stems:
+            self.__stem_cache.clear()
+        self.__insertable_cache.clear()
+
+    def get_cache_stats(self) -> Dict[str, CacheStats]:
+        """
+        :return: dict - size, hits and misses of the stem and insertable caches
+        """
+        return {'stem': self.__stem_cache.get_stats(),
+                'insertable': self.__insertable_cache.get_stats()}
 
     @staticmethod
     def tokenize(text: str) -> list:
@@ -104,7 +195,11 @@ class StringHelper:
         :param w: string - word to be stemmed
         :return: string - returns the stemmed word
         """
-        return self.__stemmer.stem(w)
+        stemmed: Union[str, None] = self.__stem_cache.get(w)
+        if stemmed is None:
+            stemmed = self.__stemmer.stem(w)
+            self.__stem_cache.put(w, stemmed)
+        return stemmed
 
     def get_dimensions(self) -> int:
         """
@@ -119,6 +214,18 @@ class StringHelper:
         """
         return len(self.tokenize(s))
 
+    def get_token_indices(self, s: str) -> List[int]:
+        """
+        :param s: string - string to be converted
+        :return: List[int] - row of every (stemmed) token in the vector matrix, -1 if the token is unknown
+        """
+        indices: List[int] = []
+        for token in self.tokenize(s):
+            if token in self.__ignored_tokens:
+                continue
+            indices.append(self.__key_to_index.get(self.stem(token), -1))
+        return indices
+
     def get_insertable(self, s: str, max_token_length: int, is_input: bool = False) -> np.ndarray:
         """
         :param s: string - string to be converted to a vector
@@ -126,31 +233,95 @@ class StringHelper:
         :param is_input: bool - if the string is user input or not
         :return: np.ndarray - returns a vector representation of the string
         """
-        current_sentence: list = []
-        runs: int = 0
-        for token in self.tokenize(s):
-            if token in ['?', '!', '.', ',']:
-                continue
-            token: str = self.stem(token)
-            try:
-                current_sentence.append(self.w2v(token))
-            except (KeyError,):
-                current_sentence.append(np.zeros((self.__model.dimensions,)))
-            runs += 1
-        if runs > max_token_length:
-            raise Exception(f'The sentence {s} is longer then the maximum token length ({max_token_length})')
-        for _ in range(max_token_length - len(current_sentence)):
-            current_sentence.append(np.zeros((self.__model.dimensions,)))
-        current_sentence: np.ndarray = np.array(current_sentence)
-        # To prevent incompatible shape errors we have to reshape the array
+        insertable: np.ndarray = self.get_insertable_batch([s], max_token_length)
+        # To prevent incompatible shape errors the model input needs the batch dimension
         if not is_input:
-            return current_sentence.reshape(
-                (current_sentence.shape[0], current_sentence.shape[1]))
-        return current_sentence.reshape(
-            (1, current_sentence.shape[0], current_sentence.shape[1]))
+            return insertable[0]
+        return insertable
+
+    def get_insertable_batch(self, sentences: List[Union[str, 'FeaturizedMessage']], max_token_length: int,
+                             use_cache: bool = True) -> np.ndarray:
+        """
+        :param sentences: List[str | FeaturizedMessage] - strings to be converted to vectors (already featurized
+                          messages are copied into the tensor instead of being embedded again)
+        :param max_token_length: int - maximum length of each string
+        :param use_cache: bool - whether to use the sentence cache (training data is seen once, so it should not
+                          evict the cached user inputs)
+        :return: np.ndarray - returns one padded float32 tensor of shape (len(sentences), max_token_length, dimensions)
+        """
+        insertable: np.ndarray = np.zeros((len(sentences), max_token_length, self.__model.dimensions),
+                                          dtype=np.float32)
+        rows: List[int] = []
+        columns: List[int] = []
+        vector_indices: List[int] = []
+        uncached: List[Tuple[int, str]] = []
+        for row, s in enumerate(sentences):
+            if isinstance(s, FeaturizedMessage):
+                if s.max_token_length == max_token_length:
+                    insertable[row] = s.get_insertable()
+                    continue
+                s = s.text.lower()
+            cached: Union[np.ndarray, None] = self.__insertable_cache.get((s, max_token_length)) if use_cache else None
+            if cached is not None:
+                insertable[row] = cached
+                continue
+            uncached.append((row, s))
+            indices: List[int] = self.get_token_indices(s)
+            if len(indices) > max_token_length:
+                raise Exception(f'The sentence {s} is longer then the maximum token length ({max_token_length})')
+            for column, vector_idx in enumerate(indices):
+                if vector_idx < 0:
+                    continue  # unknown tokens stay zero, just like the padding
+                rows.append(row)
+                columns.append(column)
+                vector_indices.append(vector_idx)
+        if vector_indices:
+            # one gather for all known tokens of all sentences
+            insertable[rows, columns] = self.__vectors[vector_indices]
+        for row, s in uncached if use_cache else []:
+            self.__insertable_cache.put((s, max_token_length), insertable[row].copy())
+        return insertable
+
+    def featurize(self, s: str, max_token_length: int) -> 'FeaturizedMessage':
+        """
+        :param s: string - message of the user
+        :param max_token_length: int - maximum length of the string
+        :return: FeaturizedMessage - message which can be passed to all models without embedding it again
+        """
+        return FeaturizedMessage(s, max_token_length, self)
+
+    def get_model(self) -> Model:
+        """
+        :return: Model - returns the Word2Vec model
+        """
+        return self.__model
 
     def get_model_name(self) -> str:
         """
         :return: string - returns the name of the Word2Vec model
         """
         return self.__model.name
+
+
+class FeaturizedMessage:
+    def __init__(self, text: str, max_token_length: int, str_helper: StringHelper) -> None:
+        """
+        A user message which is tokenized, stemmed and embedded at most once, no matter how many models read it.
+        Create it via StringHelper.featurize.
+        :param text: string - message as the user wrote it
+        :param max_token_length: int - maximum token length of the tensor
+        :param str_helper: StringHelper instance used for the featurization
+        """
+        self.text: str = text
+        self.max_token_length: int = max_token_length
+        self.__str_helper: StringHelper = str_helper
+        self.__insertable: Union[np.ndarray, None] = None
+
+    def get_insertable(self) -> np.ndarray:
+        """
+        The models lowercase their input, so the tensor is built from the lowercased text
+        :return: np.ndarray - tensor of shape (max_token_length, dimensions)
+        """
+        if self.__insertable is None:
+            self.__insertable = self.__str_helper.get_insertable_batch([self.text.lower()], self.max_token_length)[0]
+        return self.__insertable
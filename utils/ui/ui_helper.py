@@ -1,11 +1,12 @@
 import asyncio
-
 import webview
 
 from utils.config_helper import ConfigHelper
 from utils.intent_classifier import Classifier, Prediction
 from utils.action_helper.action_helper import ActionHelper
-from utils.action_utils import TriggerInfos
+from utils.prompt_broker import DEFAULT_CONVERSATION, PromptBroker, current_conversation
+from utils.session_store import SessionState, SessionStore
+from utils.string_helper import FeaturizedMessage
 from typing import *
 
 
@@ -37,10 +38,14 @@ class Ui:
         self.__window.events.shown += self.__on_window_shown
         self.__window.events.closing += self.__on_window_closed
 
-        self.__last_action: Union[str, None] = None
-        self.__last_input: Union[str, None] = None
+        # conversation state (last action, last input) of the chat, the one conversation of the window doesn't expire
+        # unless desktop_session_ttl_seconds is set (session_ttl_seconds is meant for the clients of the server)
+        self.__sessions: SessionStore = SessionStore.from_config(config_helper,
+                                                                 ttl_setting='desktop_session_ttl_seconds')
+        self.__sessions.load_snapshot()
 
-        self.__callback: Union[Callable[[str], None], None] = None
+        # prompts of actions waiting for the next message of the user
+        self.__prompts: PromptBroker = PromptBroker()
 
     def close_current_ui(self) -> None:
         if self.__window:
@@ -64,6 +69,8 @@ class Ui:
     def __on_window_closed(self) -> None:
         self.__currently_ui_open = False
         self.__window = None
+        # nobody can answer the prompts of the closed window anymore
+        self.__prompts.cancel()
 
     def get_window(self) -> webview.Window:
         """
@@ -71,39 +78,43 @@ class Ui:
         """
         return self.__window
 
-    def __build_last_trigger_data(self) -> TriggerInfos:
-        return TriggerInfos(ui=self.__window, last_action=self.__last_action, last_input=self.__last_input)
+    def get_session_store(self) -> SessionStore:
+        return self.__sessions
+
+    def __get_session(self) -> SessionState:
+        return self.__sessions.get_or_create(current_conversation.get())
 
-    def prompt_response(self, response: str) -> None:
+    def prompt_response(self, response: str, conversation_id: str = DEFAULT_CONVERSATION) -> None:
         """
         This method is called from the ui when the user sends a message and request_next_message was called before
         :param response: str -> response from the user
+        :param conversation_id: str -> conversation the response belongs to
         :return: None
         """
-        if not self.__callback:
-            return
-        self.__callback(response)
-        self.__callback = None
+        self.__prompts.resolve(conversation_id, response)
+
+    def cancel_prompts(self, conversation_id: str = DEFAULT_CONVERSATION) -> int:
+        """
+        Gives up the prompts of a conversation, e.g. when the action which asked timed out
+        :param conversation_id: str -> conversation to cancel
+        :return: int -> amount of cancelled prompts
+        """
+        return self.__prompts.cancel(conversation_id)
 
-    async def request_next_message_async(self, prompt: str) -> str:
+    async def request_next_message_async(self, prompt: str, timeout: Union[float, None] = None) -> str:
         """
         Instead of saving the callback, we are waiting for the response and return it
         :param prompt: str -> prompt to send to the ui (message to display)
+        :param timeout: float -> seconds to wait for the response, None waits until the user answers
         :return: str -> response from the user
         """
-        response: Union[str, None] = None
-
-        def callback(r: str) -> None:
-            nonlocal response
-            response = r
-
-        self.__callback = callback
-
-        self.__window.evaluate_js(f'set_prompt(\'{prompt}\')')
-        # Wait while callback is not called
-        while not response:
-            await asyncio.sleep(0.1)
-        return response
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        window: webview.Window = self.__window
+        # evaluate_js blocks until the window ran the script, so it runs in a thread instead of on the event loop which
+        # all coroutine actions share
+        return await self.__prompts.wait_for_response(
+            current_conversation.get(), timeout,
+            lambda: loop.run_in_executor(None, window.evaluate_js, f'set_prompt(\'{prompt}\')'))
 
     def send_message(self, message: str) -> None:
         """
@@ -120,7 +131,7 @@ class Ui:
         :param callback: Callable[[str], None] -> callback to call when the user sends a message
         :return: None
         """
-        self.__callback = callback
+        self.__prompts.add_callback(current_conversation.get(), callback)
         self.__window.evaluate_js(f'set_prompt(\'{prompt}\')')
 
     def get_response(self, message: str) -> dict:
@@ -129,7 +140,9 @@ class Ui:
         :return: dict -> {'response': str} -> response to the message
         """
         try:
-            classified: Prediction = self.__classifier.classify(message)
+            # embed the message only once, actions using the TokenDetector get it via TriggerInfos
+            featurized: FeaturizedMessage = self.__classifier.featurize(message)
+            classified: Prediction = self.__classifier.classify(featurized)
         except (Exception,):
             error_str: str = self.__config_helper.get_config_setting('classifier_error_str')
             if error_str:
@@ -137,17 +150,16 @@ class Ui:
             return {'response': 'Sorry, I did not understand that. Maybe your input was too long.'}
         if len(webview.windows) > 0:
             self.__window = webview.windows[0]
-        result: str = self.__action_helper.try_action(message,
-                                                      classified.action,
-                                                      classified.main_str,
-                                                      classified.error_str,
-                                                      self.__build_last_trigger_data())
-        self.__last_input = message
-        if self.__action_helper.action_exists(classified.action):
-            if not classified.action == 'repeat':
-                self.__last_action = classified.action
-        else:
-            self.__last_action = None
+        session: SessionState = self.__get_session()
+        # pywebview calls this method on a thread of its own, which waits until the action answered
+        result: str = self.__action_helper.dispatch_action(message,
+                                                           classified.action,
+                                                           classified.main_str,
+                                                           classified.error_str,
+                                                           session.build_trigger_infos(self.__window,
+                                                                                       featurized)).result()
+        session.remember(message, featurized,
+                         classified.action if self.__action_helper.action_exists(classified.action) else None)
 
         return {'response': result if result else None}
 